@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 
+from .sqlite_profiles import sqlite_database
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -42,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'movies.middleware.DBTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,14 +73,38 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
+# Serve the home, detail and stats pages with async views (to be deployed with config/asgi.py)
+ASYNC_VIEWS = False
+# Number of threads running the SQLite queries of the async views
+ASYNC_SQLITE_THREADS = 8
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+IMDB_DB_PATH = BASE_DIR / 'data' / 'imdb.db'
+
+# Connection profile of the web tier, which only reads imdb.db:
+#   "readonly":  opened with mode=ro and query_only, tuned pragmas, connections kept alive per thread
+#   "immutable": same, and SQLite also skips file locking and change detection.
+#                Only when imdb.db is never written while the server runs (restart it after an import)
+#   "memory":    each worker copies imdb.db in memory at startup, and reads the file like "readonly"
+#                if less than SQLITE_MEMORY_MIN_FREE bytes would be left. Restart it after an import
+#   None:        stock connection
+# The precomputed tables are always written through the 'writer' connection.
+SQLITE_PROFILE = None
+SQLITE_MMAP_SIZE = 1024 * 1024 * 1024
+SQLITE_CACHE_SIZE = 64 * 1024 * 1024
+SQLITE_MEMORY_MIN_FREE = 512 * 1024 * 1024
+
 DATABASES = {
-    'default': {
+    'default': sqlite_database(IMDB_DB_PATH, SQLITE_PROFILE, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE),
+
+    'writer': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'data' / 'imdb.db',
+        'NAME': IMDB_DB_PATH,
+        # same file as 'default': the tests write the precomputed tables in the test database
+        'TEST': {'MIRROR': 'default'},
     },
 
     'mongo': {
@@ -87,6 +114,89 @@ DATABASES = {
     }
 }
 
+# Result counts of the list and search pagination:
+#   "exact":  COUNT query memoized per filter set until the dataset changes
+#   "capped": stops counting after RESULT_COUNT_CAP results and shows "N+" pages
+#   "inline": count computed in the same query as the page rows
+RESULT_COUNT_MODE = "exact"
+RESULT_COUNT_CAP = 1000
+
+# Minimum similarity (Dice coefficient of the trigrams) of a person name to match a person search
+PERSON_SEARCH_THRESHOLD = 0.5
+
+# Minimum number of votes of the random movies shown on the home page
+RANDOM_MOVIES_MIN_VOTES = 0
+
+# Result cache of movies.services (see movies/services/cache.py)
+#   BACKEND: "memory" (per worker), "disk" (shared by all the workers) or None to disable it
+QUERY_CACHE = {
+    'BACKEND': 'memory',
+    'PATH': BASE_DIR / 'data' / 'query_cache.db',
+    'MAX_ENTRIES': 10000,
+    'MAX_BYTES': 64 * 1024 * 1024,
+}
+
+# Image URLs of the movie thumbnails (see movies/services/thumbnails.py), fetched from API_URL
+# at most CONCURRENCY requests at a time and RATE requests per second, and kept in PATH.
+# Movies without image are asked again after MISSING_TTL seconds.
+# The build_thumbnails command stores the images in STORAGE, fitted in each (width, height) of SIZES
+THUMBNAILS = {
+    'API_URL': 'https://api.imdbapi.dev/titles/',
+    'PATH': BASE_DIR / 'data' / 'thumbnails.db',
+    'STORAGE': BASE_DIR / 'data' / 'thumbs',
+    'SIZES': {
+        'card': (200, 300),
+        'detail': (400, 600),
+    },
+    'CONCURRENCY': 4,
+    'RATE': 5,
+    'TIMEOUT': 10,
+    'WAIT': 2,
+    'MISSING_TTL': 7 * 24 * 3600,
+    'MAX_BATCH': 100,
+}
+
+# The pages answer 304 Not Modified while the dataset version is unchanged (see movies/conditional.py).
+# Change ETAG_SALT when the templates change, to invalidate the pages kept by the browsers
+ETAG_SALT = "1"
+# Seconds between two reads of the MongoDB dataset version
+MONGO_VERSION_TTL = 60
+
+# Times the database queries of each request: Server-Timing header and a JSON log line
+# per request on the 'movies.timing' logger (see movies/middleware.py)
+DB_TIMING = False
+
+# Queries taking more than SLOW_QUERY_MS milliseconds are logged with their parameters and
+# query plan in data/slow_queries.log (None to disable)
+SLOW_QUERY_MS = None
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': BASE_DIR / 'data' / 'slow_queries.log',
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'movies': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'movies.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
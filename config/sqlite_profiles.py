@@ -0,0 +1,52 @@
+from urllib.parse import quote
+
+# Connection profiles of imdb.db, see SQLITE_PROFILE in settings.py
+
+PROFILES = [None, "readonly", "immutable", "memory"]
+
+# Shared cache in-memory database: one copy per process, seen by all its threads
+MEMORY_URI = "file:imdb_memory?mode=memory&cache=shared"
+
+QUERY_ONLY_PRAGMAS = (
+    "PRAGMA temp_store = MEMORY;"
+    "PRAGMA query_only = ON"
+)
+
+def sqlite_database(path, profile: str | None, mmap_size: int, cache_size: int) -> dict:
+    """
+    Returns the DATABASES entry opening the SQLite file 'path' with the given profile.
+    'cache_size' is in bytes, like 'mmap_size'.
+    The "memory" profile reads the file like "readonly" until the worker has loaded
+    its in-memory copy, see movies/services/memory_db.py.
+    """
+    if profile not in PROFILES:
+        raise ValueError("wrong SQLITE_PROFILE: ", profile)
+    if profile is None:
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': path,
+        }
+
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{quote(str(path))}?mode=ro" + ("&immutable=1" if profile == "immutable" else ""),
+        # Django connections are per thread: each worker thread keeps its own open
+        'CONN_MAX_AGE': None,
+        'OPTIONS': {
+            'init_command': (
+                f"PRAGMA mmap_size = {mmap_size};"
+                f"PRAGMA cache_size = -{cache_size // 1024};"
+                + QUERY_ONLY_PRAGMAS
+            ),
+        },
+    }
+
+def memory_database() -> dict:
+    """
+    Returns the DATABASES entry of the in-memory copy of the database.
+    """
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': MEMORY_URI,
+        'OPTIONS': {'init_command': QUERY_ONLY_PRAGMAS},
+    }
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# Copies imdb.db in memory at worker startup with SQLITE_PROFILE = "memory"
+from django.conf import settings
+
+if settings.SQLITE_PROFILE == "memory":
+    from movies.services.memory_db import load_memory_db
+    load_memory_db()
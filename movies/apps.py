@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class MoviesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'movies'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from .services import timing
+
+        if timing.hooks_needed():
+            connection_created.connect(timing.install_sqlite_wrapper)
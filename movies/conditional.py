@@ -0,0 +1,74 @@
+import hashlib
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.views.decorators.http import condition
+
+from .services.dataset import get_data_updated_at, get_data_version
+from .services.mongo_service import get_mongo_version
+
+# Conditional GET of the pages: they only change with the dataset, so a browser holding a page
+# of the current dataset version gets a 304 before any query runs.
+
+def _normalized_query(request) -> str:
+    """
+    Returns the query string with its parameters sorted and the empty ones removed,
+    so that equivalent URLs share the same ETag.
+    """
+    params = sorted(
+        (key, value)
+        for key, values in request.GET.lists()
+        for value in values if value != ""
+    )
+    return "&".join(f"{key}={value}" for key, value in params)
+
+def _etag(request, version: str) -> str:
+    raw = "\n".join([settings.ETAG_SALT, version, request.path, _normalized_query(request)])
+    return '"' + hashlib.sha1(raw.encode()).hexdigest() + '"'
+
+def sqlite_etag(request, *args, **kwargs) -> str:
+    return _etag(request, get_data_version())
+
+def sqlite_last_modified(request, *args, **kwargs):
+    return get_data_updated_at()
+
+def mongo_etag(request, *args, **kwargs) -> str:
+    stamp = get_mongo_version()
+    # without stamp, the cached pages would never change: no ETag
+    return _etag(request, stamp["version"]) if stamp else None
+
+def mongo_last_modified(request, *args, **kwargs):
+    stamp = get_mongo_version()
+    return stamp["updated_at"] if stamp else None
+
+def _condition(etag_func, last_modified_func):
+    """
+    Same as Django's condition(), but for the async views the ETag and Last-Modified are
+    computed in a worker thread: they query imdb.db or MongoDB synchronously, which is
+    forbidden (SQLite) or blocking (pymongo) on the event loop.
+    """
+    sync_decorator = condition(etag_func=etag_func, last_modified_func=last_modified_func)
+
+    def decorator(view):
+        if not iscoroutinefunction(view):
+            return sync_decorator(view)
+
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            etag = await sync_to_async(etag_func, thread_sensitive=False)(request, *args, **kwargs)
+            last_modified = await sync_to_async(last_modified_func, thread_sensitive=False)(request, *args, **kwargs)
+            # the values are known: Django's decorator only compares them with the request headers
+            return await condition(
+                etag_func=lambda *a, **k: etag,
+                last_modified_func=lambda *a, **k: last_modified
+            )(view)(request, *args, **kwargs)
+        return inner
+    return decorator
+
+# pages built from imdb.db (list, search, stats)
+sqlite_condition = _condition(sqlite_etag, sqlite_last_modified)
+
+# pages built from the MongoDB collections (movie details)
+mongo_condition = _condition(mongo_etag, mongo_last_modified)
@@ -0,0 +1,71 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from config.sqlite_profiles import PROFILES, sqlite_database
+from movies.services import sqlite_service
+from movies.services.memory_db import load_memory_db
+from movies.services.counts import clear_counts
+
+# Queries of the web app, called without the result cache
+QUERIES = {
+    "top_movies":          lambda: sqlite_service.get_top_N_movies.__wrapped__(10),
+    "random_movies":       lambda: sqlite_service.get_random_movies(10),
+    "film_list_page_1":    lambda: sqlite_service.get_film_list.__wrapped__(1, [[], 0, 9000, 0, "any"], "title", "ASC"),
+    "film_list_page_500":  lambda: sqlite_service.get_film_list.__wrapped__(500, [[], 0, 9000, 0, "any"], "year", "DESC"),
+    "film_list_size":      lambda: sqlite_service.get_film_list_size([["Drama"], 1990, 2020, 5, "any"]),
+    "search_title":        lambda: sqlite_service.search_movies_from_title.__wrapped__("star", 1),
+    "search_person":       lambda: sqlite_service.search_movies_from_person.__wrapped__("brad pitt", 1),
+    "movies_by_genre":     lambda: sqlite_service._query_movies_count_by_genre(),
+}
+
+class Command(BaseCommand):
+    help = "Compares the latency of the sqlite_service queries with each SQLite connection profile"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=20, help="runs of each query per profile")
+
+    def handle(self, *args, **options):
+        runs = options["runs"]
+        results = {}
+        for profile in PROFILES:
+            self._use_profile(profile)
+            results[profile] = {name: self._measure(query, runs) for name, query in QUERIES.items()}
+        # back to the configured profile
+        self._use_profile(settings.SQLITE_PROFILE)
+
+        header = f"{'query':<20}" + "".join(f"{str(p):>12}" for p in PROFILES)
+        self.stdout.write(f"median latency in ms over {runs} runs, one request per run")
+        self.stdout.write(header)
+        for name in QUERIES:
+            self.stdout.write(f"{name:<20}" + "".join(f"{results[p][name]:>12.2f}" for p in PROFILES))
+
+    def _use_profile(self, profile):
+        """
+        Reopens the default connection with 'profile'.
+        """
+        connections["default"].close()
+        del connections["default"]
+        connections.settings["default"] = connections.configure_settings({
+            "default": sqlite_database(
+                settings.IMDB_DB_PATH, profile, settings.SQLITE_MMAP_SIZE, settings.SQLITE_CACHE_SIZE
+            )
+        })["default"]
+        if profile == "memory":
+            load_memory_db()
+
+    def _measure(self, query, runs: int) -> float:
+        # warms up the page cache of the OS, shared by all the profiles
+        query()
+        timings = []
+        for _ in range(runs):
+            clear_counts()
+            start = time.perf_counter()
+            query()
+            timings.append((time.perf_counter() - start) * 1000)
+            # end of request: closes the connection unless the profile keeps it alive
+            close_old_connections()
+        return statistics.median(timings)
@@ -0,0 +1,80 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from movies.services.thumbnails import get_fetcher, get_image_urls, resize_image, store_thumbnails
+
+class Command(BaseCommand):
+    help = "Downloads the images of the movies of imdb.db, resizes them and stores them for /thumb/<movie_id>"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None, help="most voted movies to process (all by default)")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes resizing the images")
+        parser.add_argument("--batch", type=int, default=100, help="movies downloaded and resized per batch")
+
+    def handle(self, *args, **options):
+        conf = settings.THUMBNAILS
+        store = get_fetcher().store
+        session = requests.Session()
+
+        movie_ids = self._movie_ids(options["limit"])
+        self.stdout.write(f"{len(movie_ids)} movies")
+
+        done = skipped = failed = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool, \
+             ThreadPoolExecutor(max_workers=conf["CONCURRENCY"]) as downloads:
+            for i in range(0, len(movie_ids), options["batch"]):
+                batch = movie_ids[i:i + options["batch"]]
+                local = store.get_local(batch, "card")
+                todo = [mid for mid in batch if mid not in local]
+                skipped += len(batch) - len(todo)
+
+                # image URLs through the cache of the web app, within the limits of the image API
+                urls = {}
+                for j in range(0, len(todo), conf["MAX_BATCH"]):
+                    chunk = todo[j:j + conf["MAX_BATCH"]]
+                    found, _ = get_image_urls(chunk, wait=len(chunk) / conf["RATE"] + conf["TIMEOUT"])
+                    urls.update({mid: url for mid, url in found.items() if url and not url.startswith("/thumb/")})
+
+                images = dict(zip(urls, downloads.map(lambda url: self._download(session, url), urls.values())))
+                resized = {
+                    mid: pool.submit(resize_image, data, conf["SIZES"])
+                    for mid, data in images.items() if data is not None
+                }
+                for mid, future in resized.items():
+                    try:
+                        store_thumbnails(mid, future.result())
+                        done += 1
+                    except Exception as e:
+                        self.stderr.write(f"{mid}: {e}")
+                        failed += 1
+                failed += len(todo) - len(resized)
+
+                self.stdout.write(
+                    f"{min(i + options['batch'], len(movie_ids))}/{len(movie_ids)} movies: "
+                    f"{done} stored, {skipped} already stored, {failed} without image"
+                )
+
+        self.stdout.write(self.style.SUCCESS(f"Thumbnails stored in {conf['STORAGE']}"))
+
+    def _movie_ids(self, limit: int | None) -> list:
+        with connection.cursor() as c:
+            res = c.execute("""
+                SELECT m.movie_id
+                FROM movies m
+                LEFT JOIN ratings r ON m.movie_id = r.movie_id
+                ORDER BY r.num_votes DESC
+                LIMIT ?
+            """, (-1 if limit is None else limit,)).fetchall()
+        return [r[0] for r in res]
+
+    def _download(self, session, url: str):
+        try:
+            res = session.get(url, timeout=settings.THUMBNAILS["TIMEOUT"])
+        except requests.RequestException:
+            return None
+        return res.content if res.ok else None
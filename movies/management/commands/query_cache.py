@@ -0,0 +1,18 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from movies.services.cache import cache_stats, clear_cache
+
+class Command(BaseCommand):
+    help = "Shows the content and the hit/miss counters of the query result cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clear", action="store_true", help="empties the cache and resets its counters")
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            clear_cache()
+            self.stdout.write(self.style.SUCCESS("Query cache cleared"))
+            return
+        self.stdout.write(json.dumps(cache_stats(), indent=4))
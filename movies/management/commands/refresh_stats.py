@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from movies.services.dataset import write_data_version
+from movies.services.sqlite_service import refresh_movie_summary, refresh_random_pool, refresh_stats_snapshot
+
+class Command(BaseCommand):
+    help = "Rebuilds the tables precomputed for the web app (stats_snapshot, random_pool, movie_summary)"
+
+    def handle(self, *args, **options):
+        snapshot = refresh_stats_snapshot()
+        self.stdout.write(self.style.SUCCESS(f"stats_snapshot rebuilt: {', '.join(snapshot)}"))
+
+        pool_size = refresh_random_pool()
+        self.stdout.write(self.style.SUCCESS(f"random_pool rebuilt: {pool_size} movies"))
+
+        summary_size = refresh_movie_summary()
+        self.stdout.write(self.style.SUCCESS(f"movie_summary rebuilt: {summary_size} movies"))
+
+        # the precomputed tables changed: results cached for the previous version are dropped
+        version = write_data_version()
+        self.stdout.write(self.style.SUCCESS(f"dataset version: {version}"))
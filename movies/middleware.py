@@ -0,0 +1,71 @@
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+
+from .services import timing
+
+logger = logging.getLogger("movies.timing")
+
+class DBTimingMiddleware:
+    """
+    Times the database queries of each request (settings.DB_TIMING): the totals per backend
+    are sent in a Server-Timing header and logged as one JSON line per request.
+    Removed from the middleware chain when DB_TIMING is disabled.
+    Runs on the event loop in front of async views, which stay concurrent (settings.ASYNC_VIEWS).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not timing.is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = timing.start_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            queries = timing.end_request(token)
+        return self.report(request, response, queries, start)
+
+    async def __acall__(self, request):
+        # the threads running the queries through sync_to_async get a copy of this context
+        token = timing.start_request()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            queries = timing.end_request(token)
+        return self.report(request, response, queries, start)
+
+    def report(self, request, response, queries: list, start: float):
+        """
+        Adds the Server-Timing header of the recorded queries to 'response' and logs the request.
+        """
+        total_ms = (time.perf_counter() - start) * 1000
+
+        totals = timing.summarize(queries)
+        metrics = [
+            f'{backend};dur={t["ms"]:.1f};desc="{t["queries"]} queries, {t["rows"]} rows"'
+            for backend, t in totals.items()
+        ]
+        metrics.append(f"total;dur={total_ms:.1f}")
+        response["Server-Timing"] = ", ".join(metrics)
+
+        logger.info(json.dumps({
+            "method": request.method,
+            "path": request.get_full_path(),
+            "status": response.status_code,
+            "ms": round(total_ms, 2),
+            "db": {backend: {**t, "ms": round(t["ms"], 2)} for backend, t in totals.items()},
+        }))
+        return response
@@ -0,0 +1,287 @@
+import atexit
+import functools
+import hashlib
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from django.conf import settings
+
+from .dataset import get_data_version
+
+# Query result cache of the services, configured by settings.QUERY_CACHE.
+# Results are stored pickled, so callers can modify what they get without altering the cache.
+
+class MemoryBackend:
+    """
+    In-process LRU store, bounded by number of entries and by total size of the pickled values.
+    """
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # key -> (expires_at, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counts_lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: float | None) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + ttl if ttl else None, value)
+            self._bytes += len(value)
+            # evicts the least recently used entries
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def count(self, name: str, hit: bool, stats: dict | None = None) -> None:
+        # the process counters of cache_stats are the only ones of an in-process store
+        if stats is not None:
+            with self.counts_lock:
+                stats["hits" if hit else "misses"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def info(self) -> dict:
+        return {"entries": len(self._entries), "bytes": self._bytes}
+
+class DiskBackend:
+    """
+    LRU store in a SQLite file, shared by all the workers of the server.
+    Bounded by number of entries and by total size of the pickled values.
+    To keep the reads from writing to the shared file, the access time of an entry is only
+    refreshed once per 'access_interval' seconds (so the eviction order is approximate),
+    and the hit and miss counters are kept per process and added to the file every
+    'flush_interval' seconds.
+    """
+    def __init__(self, path: str, max_entries: int, max_bytes: int,
+                 access_interval: float = 60, flush_interval: float = 10):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.access_interval = access_interval
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._counts = {} # name -> [hits, misses] not flushed yet
+        self.counts_lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+        atexit.register(self.flush)
+
+    @property
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key CHAR(40) PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS counters (
+                    name VARCHAR(200) PRIMARY KEY,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    misses INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        now = time.time()
+        res = self._conn.execute(
+            "SELECT value, expires_at, accessed_at FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if res is None:
+            return None
+        value, expires_at, accessed_at = res
+        if expires_at is not None and expires_at < now:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+        if now - accessed_at >= self.access_interval:
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return value
+
+    def set(self, key: str, value: bytes, ttl: float | None) -> None:
+        if len(value) > self.max_bytes:
+            return
+        now = time.time()
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + ttl if ttl else None, now)
+            )
+            self._evict(conn)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn) -> None:
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if entries <= self.max_entries and size <= self.max_bytes:
+            return
+        evicted = []
+        for key, entry_size in conn.execute("SELECT key, size FROM entries ORDER BY accessed_at ASC"):
+            if entries <= self.max_entries and size <= self.max_bytes:
+                break
+            evicted.append((key,))
+            entries -= 1
+            size -= entry_size
+        conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+    def count(self, name: str, hit: bool, stats: dict | None = None) -> None:
+        """
+        Adds a hit or a miss to the counters of this process, flushed to the shared ones
+        once per flush_interval, and to the 'stats' of cache_stats.
+        """
+        with self.counts_lock:
+            if stats is not None:
+                stats["hits" if hit else "misses"] += 1
+            self._counts.setdefault(name, [0, 0])[0 if hit else 1] += 1
+            due = time.monotonic() - self._flushed_at >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Adds the counters of this process to the ones shared by all the workers.
+        """
+        with self.counts_lock:
+            counts, self._counts = self._counts, {}
+            self._flushed_at = time.monotonic()
+        if not counts:
+            return
+        self._conn.executemany("""
+            INSERT INTO counters (name, hits, misses) VALUES (?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses
+        """, [(name, hits, misses) for name, (hits, misses) in counts.items()])
+
+    def clear(self) -> None:
+        with self.counts_lock:
+            self._counts = {}
+        self._conn.execute("DELETE FROM entries")
+        self._conn.execute("DELETE FROM counters")
+
+    def info(self) -> dict:
+        self.flush()
+        entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        counters = self._conn.execute("SELECT name, hits, misses FROM counters").fetchall()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "functions": {name: {"hits": hits, "misses": misses} for name, hits, misses in counters}
+        }
+
+_backend = None
+_backend_lock = threading.Lock()
+
+# hits and misses per cached function, for this process
+_stats = {}
+
+def get_backend():
+    """
+    Returns the backend configured by settings.QUERY_CACHE, or None if the cache is disabled.
+    """
+    global _backend
+    if _backend is None:
+        conf = settings.QUERY_CACHE
+        with _backend_lock:
+            if _backend is None:
+                match conf["BACKEND"]:
+                    case "memory":
+                        _backend = MemoryBackend(conf["MAX_ENTRIES"], conf["MAX_BYTES"])
+                    case "disk":
+                        _backend = DiskBackend(conf["PATH"], conf["MAX_ENTRIES"], conf["MAX_BYTES"])
+                    case None:
+                        return None
+                    case _:
+                        raise(ValueError("wrong QUERY_CACHE backend: ", conf["BACKEND"]))
+    return _backend
+
+def cached(ttl: float | None = None):
+    """
+    Caches the results of the decorated service function.
+    Entries are keyed by function, arguments and dataset version, and expire after 'ttl' seconds
+    (never if None, the dataset version already changing on each import).
+    """
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+        stats = _stats.setdefault(name, {"hits": 0, "misses": 0})
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            backend = get_backend()
+            if backend is None:
+                return func(*args, **kwargs)
+
+            raw_key = repr((name, get_data_version(), args, sorted(kwargs.items())))
+            key = hashlib.sha1(raw_key.encode()).hexdigest()
+
+            value = backend.get(key)
+            # the request threads and the pool of the async views count at the same time
+            backend.count(name, value is not None, stats)
+            if value is not None:
+                return pickle.loads(value)
+
+            res = func(*args, **kwargs)
+            backend.set(key, pickle.dumps(res), ttl)
+            return res
+
+        wrapper.cache_stats = stats
+        return wrapper
+    return decorator
+
+def cache_stats() -> dict:
+    """
+    Returns the hits and misses of each cached function in this process, along with
+    the entries and bytes held by the backend (and the counters of all the workers for the disk backend).
+    """
+    backend = get_backend()
+    with backend.counts_lock if backend is not None else nullcontext():
+        functions = {name: dict(s) for name, s in _stats.items()}
+    return {
+        "functions": functions,
+        "backend": backend.info() if backend is not None else None,
+    }
+
+def clear_cache() -> None:
+    backend = get_backend()
+    if backend is not None:
+        backend.clear()
+    with backend.counts_lock if backend is not None else nullcontext():
+        for s in _stats.values():
+            s["hits"] = s["misses"] = 0
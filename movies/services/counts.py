@@ -0,0 +1,66 @@
+import math
+import threading
+
+from django.conf import settings
+
+from .dataset import get_data_version
+
+# Memoized result counts, keyed by (kind, normalized filters, cap, data version)
+_MAX_ENTRIES = 4096
+_counts = {}
+_lock = threading.Lock()
+
+def normalize_filters(filters: list) -> tuple:
+    """
+    Normalizes the list page filters [genres, min_year, max_year, min_note, genre_mode] so that
+    equivalent requests share the same memoized count.
+    """
+    genres, min_year, max_year, min_note, genre_mode = filters
+    genres = tuple(sorted({g.strip().lower() for g in genres}))
+    # a single genre matches the same movies in both modes
+    if len(genres) <= 1:
+        genre_mode = "any"
+    return (genres, int(min_year), int(max_year), float(min_note), genre_mode)
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split()).lower()
+
+def peek_count(kind: str, key: tuple):
+    return _counts.get((kind, key, get_data_version()))
+
+def store_count(kind: str, key: tuple, value: int) -> None:
+    with _lock:
+        if len(_counts) >= _MAX_ENTRIES:
+            # dicts keep insertion order: drop the oldest entry
+            _counts.pop(next(iter(_counts)))
+        _counts[(kind, key, get_data_version())] = value
+
+def cached_count(kind: str, key: tuple, count_fn) -> int:
+    """
+    Returns the memoized count for (kind, key), calling count_fn() on a miss.
+    Entries of a previous dataset are never hit again since the data version is part of the key.
+    """
+    res = peek_count(kind, key)
+    if res is None:
+        res = count_fn()
+        store_count(kind, key, res)
+    return res
+
+def clear_counts() -> None:
+    with _lock:
+        _counts.clear()
+
+def count_mode() -> str:
+    return getattr(settings, "RESULT_COUNT_MODE", "exact")
+
+def count_cap(page: int):
+    """
+    Returns the number of results after which counting stops for the given page,
+    or None if counts are exact.
+    The cap grows by steps of RESULT_COUNT_CAP so that the page navigation
+    around the current page can still be displayed.
+    """
+    if count_mode() != "capped":
+        return None
+    step = getattr(settings, "RESULT_COUNT_CAP", 1000)
+    return step * math.ceil((page + 5) * 20 / step)
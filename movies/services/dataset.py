@@ -0,0 +1,90 @@
+import os
+import uuid
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+
+# Alias of the connection writing the precomputed tables: the default one may be read-only
+WRITE_DB = "writer"
+
+def get_write_connection():
+    return connections[WRITE_DB]
+
+def get_db_signature() -> str:
+    """
+    Returns a stamp that changes with every write to imdb.db: its size and modification time.
+    Used to refresh what is derived from the schema, like the optional tables of the scripts.
+    """
+    try:
+        st = os.stat(settings.IMDB_DB_PATH)
+    except OSError:
+        return "missing"
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+@lru_cache(maxsize=4)
+def _read_data_version(db_signature: str):
+    with connection.cursor() as c:
+        exists = c.execute("SELECT 1 FROM sqlite_master WHERE name = 'dataset_version'").fetchone()
+        if not exists:
+            return None
+        res = c.execute("SELECT version, updated_at FROM dataset_version WHERE id = 1").fetchone()
+    return tuple(res) if res else None
+
+def get_data_version() -> str:
+    """
+    Returns the version stamp of the dataset, written by the import scripts and by
+    write_data_version each time the data changes.
+    Databases imported before the stamp existed are identified by their file signature.
+    """
+    db_signature = get_db_signature()
+    res = _read_data_version(db_signature)
+    return res[0] if res else db_signature
+
+def get_data_updated_at():
+    """
+    Returns the datetime at which the current version stamp was written, or None without stamp.
+    """
+    res = _read_data_version(get_db_signature())
+    return datetime.fromisoformat(res[1]) if res else None
+
+def store_data_version(conn, version: str | None = None) -> str:
+    """
+    Writes a new version stamp of imdb.db through 'conn', a sqlite3 connection or a cursor
+    (the caller commits). Returns the stamp.
+    Doesn't use Django: the import scripts of phase1_sqlite write their stamp with it.
+    """
+    version = version or uuid.uuid4().hex
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS dataset_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version VARCHAR(32) NOT NULL,
+            updated_at VARCHAR(32) NOT NULL
+        )
+    """)
+    conn.execute(
+        "INSERT OR REPLACE INTO dataset_version (id, version, updated_at) VALUES (1, ?, ?)",
+        (version, datetime.now(timezone.utc).isoformat())
+    )
+    return version
+
+def store_mongo_version(db, version: str | None = None) -> str:
+    """
+    Writes a new version stamp of the MongoDB collections in the pymongo database 'db',
+    read back by mongo_service.get_mongo_version. Used by the scripts of phase2_mongodb.
+    """
+    version = version or uuid.uuid4().hex
+    db["dataset_version"].replace_one(
+        {"_id": 1},
+        {"version": version, "updated_at": datetime.now(timezone.utc)},
+        upsert=True
+    )
+    return version
+
+def write_data_version() -> str:
+    """
+    Stores a new version stamp for the dataset, invalidating every result cached for the previous one.
+    """
+    with transaction.atomic(using=WRITE_DB), get_write_connection().cursor() as c:
+        return store_data_version(c)
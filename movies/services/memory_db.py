@@ -0,0 +1,100 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db import connections
+
+from config.sqlite_profiles import MEMORY_URI, memory_database
+
+# In-memory copy of imdb.db for the "memory" SQLITE_PROFILE.
+# The copy lives as long as one connection to it is open: _keeper holds it for the whole process.
+
+logger = logging.getLogger(__name__)
+
+_keeper = None
+_lock = threading.Lock()
+
+def _available_memory():
+    """
+    Returns the memory available to new allocations in bytes, or None if unknown (not Linux).
+    """
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def _resident_memory():
+    """
+    Returns the resident memory of the process in bytes, or None if unknown.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def _mb(size) -> str:
+    return "?" if size is None else f"{size / 1024 / 1024:.0f} MB"
+
+def load_memory_db() -> bool:
+    """
+    Copies imdb.db into a shared in-memory database with the backup API, then points
+    the default connection at it: the sqlite_service queries run unchanged on the copy.
+    Keeps reading the file (readonly profile) if the copy would leave less than
+    SQLITE_MEMORY_MIN_FREE bytes of available memory.
+    Called once per worker at startup, see config/wsgi.py and config/asgi.py.
+    Returns True if the default connection now reads the in-memory copy.
+    """
+    global _keeper
+    with _lock:
+        if _keeper is None:
+            _keeper = _copy_to_memory()
+            if _keeper is None:
+                return False
+
+        # the threads of this worker open their next connection on the copy
+        settings.DATABASES["default"] = connections.settings["default"] = \
+            connections.configure_settings({"default": memory_database()})["default"]
+        connections["default"].close()
+        del connections["default"]
+        return True
+
+def _copy_to_memory():
+    """
+    Returns the connection holding the in-memory copy of imdb.db, or None if it can't be made.
+    """
+    db_size = os.path.getsize(settings.IMDB_DB_PATH)
+    available = _available_memory()
+    if available is not None and available - db_size < settings.SQLITE_MEMORY_MIN_FREE:
+        logger.warning(
+            "imdb.db (%s) not loaded in memory, %s available: reading from disk",
+            _mb(db_size), _mb(available)
+        )
+        return None
+
+    rss_before = _resident_memory()
+    start = time.perf_counter()
+    keeper = sqlite3.connect(MEMORY_URI, uri=True, check_same_thread=False)
+    try:
+        source = f"file:{quote(str(settings.IMDB_DB_PATH))}?mode=ro"
+        with closing(sqlite3.connect(source, uri=True)) as disk:
+            disk.backup(keeper)
+    except (sqlite3.Error, MemoryError) as e:
+        keeper.close()
+        logger.warning("imdb.db not loaded in memory (%s): reading from disk", e)
+        return None
+
+    logger.info(
+        "imdb.db (%s) loaded in memory in %.2fs, resident memory %s -> %s",
+        _mb(db_size), time.perf_counter() - start, _mb(rss_before), _mb(_resident_memory())
+    )
+    return keeper
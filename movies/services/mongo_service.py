@@ -1,12 +1,51 @@
+import random
+import threading
+import time
+
 from django.conf import settings
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient, MongoClient
+
+from .cache import cached
+from .timing import mongo_listeners
 
-_client = MongoClient(settings.DATABASES["mongo"]["HOST"])
+_client = MongoClient(settings.DATABASES["mongo"]["HOST"], event_listeners=mongo_listeners())
 _db = _client[settings.DATABASES["mongo"]["NAME"]]
 
+# Client of the async views, created on first use so that it binds to the server event loop
+_async_client = None
+
+def _get_async_db():
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncMongoClient(settings.DATABASES["mongo"]["HOST"], event_listeners=mongo_listeners())
+    return _async_client[settings.DATABASES["mongo"]["NAME"]]
+
+# Version stamp of the MongoDB collections, written by scripts/phase2_mongodb.
+# Read again every MONGO_VERSION_TTL seconds at most, so that most requests don't query it
+_mongo_version = None  # (stamp, monotonic time of the read)
+_mongo_version_lock = threading.Lock()
+
+def get_mongo_version():
+    """
+    Returns the {"version", "updated_at"} stamp written by migrate_structured.py and
+    precompute_recommendations.py (see dataset.store_mongo_version), or None if the collections
+    were migrated without it.
+    """
+    global _mongo_version
+    with _mongo_version_lock:
+        if _mongo_version is None or time.monotonic() - _mongo_version[1] >= settings.MONGO_VERSION_TTL:
+            stamp = _db.dataset_version.find_one({"_id": 1}, {"_id": 0})
+            _mongo_version = (stamp, time.monotonic())
+        return _mongo_version[0]
+
+# movies_complete isn't covered by the SQLite dataset version: its entries expire instead
+@cached(ttl=3600)
 def get_movie_complete(movie_id: str):
     return _db.movies_complete.find_one({"_id": movie_id})
-    
+
+async def aget_movie_complete(movie_id: str):
+    return await _get_async_db().movies_complete.find_one({"_id": movie_id})
+
 def get_movie_and_title(movie_id: str):
     pipeline = [
         {"$match": {"_id": movie_id}},
@@ -17,8 +56,19 @@ def get_movie_and_title(movie_id: str):
     ]
     return _db.movies_complete.aggregate(pipeline)
 
-def get_rd_movies_from_directors(directors: list, N: int, original_id: str) -> list:
-    pipeline = [
+def get_rd_movies_from_pool(movie: dict, pool_name: str, N: int):
+    """
+    Returns N random movies among the recommendations precomputed for 'movie'
+    ("directors" or "genres" pool) by scripts/phase2_mongodb/precompute_recommendations.py,
+    or None if the movie has no such pool.
+    """
+    pool = movie.get("rec_pool", {}).get(pool_name)
+    if pool is None:
+        return None
+    return random.sample(pool, min(N, len(pool)))
+
+def _rd_movies_from_directors_pipeline(directors: list, N: int, original_id: str) -> list:
+    return [
         {"$match": {
             "directors.person_id": {"$in": directors},
             "_id": {"$ne": original_id}
@@ -31,10 +81,17 @@ def get_rd_movies_from_directors(directors: list, N: int, original_id: str) -> l
         }}
     ]
 
+def get_rd_movies_from_directors(directors: list, N: int, original_id: str) -> list:
+    pipeline = _rd_movies_from_directors_pipeline(directors, N, original_id)
     return _db.movies_complete.aggregate(pipeline)
 
-def get_rd_movies_from_genres(genres: list, N: int, original_id: str) -> list:
-    pipeline = [
+async def aget_rd_movies_from_directors(directors: list, N: int, original_id: str) -> list:
+    pipeline = _rd_movies_from_directors_pipeline(directors, N, original_id)
+    cursor = await _get_async_db().movies_complete.aggregate(pipeline)
+    return await cursor.to_list()
+
+def _rd_movies_from_genres_pipeline(genres: list, N: int, original_id: str) -> list:
+    return [
         {"$match": {
             "genres": {"$in": genres},
             "_id": {"$ne": original_id}
@@ -47,5 +104,12 @@ def get_rd_movies_from_genres(genres: list, N: int, original_id: str) -> list:
         }}
     ]
 
+def get_rd_movies_from_genres(genres: list, N: int, original_id: str) -> list:
+    pipeline = _rd_movies_from_genres_pipeline(genres, N, original_id)
     return _db.movies_complete.aggregate(pipeline)
 
+async def aget_rd_movies_from_genres(genres: list, N: int, original_id: str) -> list:
+    pipeline = _rd_movies_from_genres_pipeline(genres, N, original_id)
+    cursor = await _get_async_db().movies_complete.aggregate(pipeline)
+    return await cursor.to_list()
+
@@ -0,0 +1,66 @@
+import base64
+import binascii
+import json
+
+def encode_cursor(page: int, sort_on: str, row: dict) -> str:
+    """
+    Builds an opaque keyset token pointing at 'row' for the given sort mode.
+    The token carries the page number so the page navigation can still be displayed.
+    """
+    payload = json.dumps([page, sort_on, row[sort_on], row["mid"]])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(token: str, sort_on: str):
+    """
+    Returns (page, sort_value, movie_id) from a token built by encode_cursor,
+    or None if the token is missing, malformed or was built for another sort mode.
+    Only values SQLite can bind are accepted from the token.
+    """
+    if not token:
+        return None
+    try:
+        payload = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        page, token_sort, value, mid = json.loads(payload)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+    if token_sort != sort_on or not isinstance(page, int) or page < 1:
+        return None
+    if not isinstance(value, (str, int, float, type(None))) or not isinstance(mid, str):
+        return None
+    return page, value, mid
+
+def nearby_cursors(page: int, pages: range, sort_on: str, rows: list, fetch) -> dict:
+    """
+    Returns {page number: (direction, token)} for the pages of 'pages' around 'page',
+    whose movies are 'rows', so that the page navigation links seek like prev/next.
+    'fetch(cursor, count)' returns the movies of the 'count' pages at a
+    ("after" | "before", sort_value, movie_id) cursor: a single query in each direction
+    reads the pages in between, and every 20th movie starts a token.
+    """
+    if not rows:
+        return {}
+    cursors = {}
+    if page + 1 < pages.stop:
+        cursors[page + 1] = ("after", encode_cursor(page + 1, sort_on, rows[-1]))
+    if page - 1 >= pages.start:
+        cursors[page - 1] = ("before", encode_cursor(page - 1, sort_on, rows[0]))
+
+    # pages page + 1 ... pages.stop - 2, the last movie of each one points at the next
+    between = pages.stop - page - 2
+    if between > 0:
+        after = fetch(("after", rows[-1][sort_on], rows[-1]["mid"]), between)
+        for k in range(1, between + 1):
+            if len(after) < 20 * k:
+                break
+            cursors[page + 1 + k] = ("after", encode_cursor(page + 1 + k, sort_on, after[20 * k - 1]))
+
+    # pages pages.start + 1 ... page - 1, the first movie of each one points at the previous
+    between = page - 1 - pages.start
+    if between > 0:
+        before = fetch(("before", rows[0][sort_on], rows[0]["mid"]), between)
+        for k in range(1, between + 1):
+            if len(before) < 20 * k:
+                break
+            cursors[page - 1 - k] = ("before", encode_cursor(page - 1 - k, sort_on, before[-20 * k]))
+    return cursors
@@ -0,0 +1,72 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+# Queries slower than settings.SLOW_QUERY_MS, logged with their plan on the 'movies.slow_queries'
+# logger, which writes to a rotating file (see LOGGING in settings.py).
+
+logger = logging.getLogger("movies.slow_queries")
+
+def is_enabled() -> bool:
+    return getattr(settings, "SLOW_QUERY_MS", None) is not None
+
+def is_slow(ms: float) -> bool:
+    return is_enabled() and ms >= settings.SLOW_QUERY_MS
+
+def _write(entry: dict) -> None:
+    logger.warning(json.dumps(entry, default=str))
+
+def log_sqlite(connection, sql: str, params, ms: float, rows: int) -> None:
+    """
+    Logs a slow SQLite query with its parameters and its EXPLAIN QUERY PLAN.
+    'connection' is the Django connection that ran the query.
+    """
+    try:
+        # a cursor of the driver: the plan query itself is neither timed nor logged
+        cursor = connection.create_cursor()
+        try:
+            plan = [
+                {"id": r[0], "parent": r[1], "detail": r[3]}
+                for r in cursor.execute("EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()
+            ]
+        finally:
+            cursor.close()
+    except Exception as e:
+        plan = f"EXPLAIN QUERY PLAN failed: {e}"
+
+    _write({"backend": "sqlite", "ms": round(ms, 2), "rows": rows, "query": " ".join(sql.split()),
+            "params": params, "plan": plan})
+
+# fields added to the commands by the driver, not accepted inside an explain command
+_DRIVER_FIELDS = {"$db", "lsid", "$clusterTime", "$readPreference", "txnNumber", "$readConcern"}
+
+# explains of the slow Mongo commands: the listener also runs on the event loop for the
+# AsyncMongoClient, so the explain round trip is made in this thread instead
+_explain_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+
+def log_mongo(command_name: str, command: dict, ms: float, rows: int) -> None:
+    """
+    Logs a slow Mongo command with its explain() output, queryPlanner verbosity,
+    once the explain run by _explain_pool returns.
+    getMore commands only continue a cursor: they are logged right away without a plan.
+    """
+    query = {k: v for k, v in command.items() if k not in _DRIVER_FIELDS}
+    if command_name in ["find", "aggregate", "count", "distinct"]:
+        _explain_pool.submit(_log_mongo_plan, command_name, query, ms, rows)
+    else:
+        _write({"backend": "mongo", "ms": round(ms, 2), "rows": rows, "query": command_name,
+                "params": query, "plan": None})
+
+def _log_mongo_plan(command_name: str, query: dict, ms: float, rows: int) -> None:
+    # imported here since mongo_service creates its clients with the listeners of this package
+    from .mongo_service import _db
+
+    try:
+        plan = _db.command({"explain": query, "verbosity": "queryPlanner"})
+    except Exception as e:
+        plan = f"explain failed: {e}"
+
+    _write({"backend": "mongo", "ms": round(ms, 2), "rows": rows, "query": command_name,
+            "params": query, "plan": plan})
@@ -1,7 +1,18 @@
-from django.db import connection
+from django.conf import settings
+from django.db import connection, transaction
 
+import json
+import random
+import re
+import unicodedata
+from functools import lru_cache
 from typing import Literal
 
+from .cache import cached
+from .dataset import WRITE_DB, get_db_signature, get_write_connection
+from .counts import cached_count, normalize_filters, normalize_query, peek_count, store_count
+
+@cached()
 def get_top_N_movies(N: int) -> list:
     with connection.cursor() as c:
         sql = """
@@ -27,7 +38,7 @@ def get_top_N_movies(N: int) -> list:
 
     return res
 
-def get_basic_stats() -> dict:
+def _query_basic_stats() -> dict:
     with connection.cursor() as c:
         movieCnt = c.execute("SELECT COUNT(*) FROM MOVIES").fetchone()[0]
         actorCnt = c.execute("""
@@ -44,7 +55,38 @@ def get_basic_stats() -> dict:
         """).fetchone()[0]
     return {"movieCnt": movieCnt, "actorCnt": actorCnt, "directorCnt": directorCnt}
 
-def get_random_movies(N: int) -> list:
+def get_basic_stats() -> dict:
+    res = _stats_snapshot().get("basic_stats")
+    return res if res is not None else _query_basic_stats()
+
+def get_random_movies(N: int, min_votes: int = 0) -> list:
+    """
+    Returns N distinct random movies having at least 'min_votes' votes.
+    Movies are drawn by id from the random_pool table built by refresh_random_pool,
+    so the cost doesn't depend on the number of movies.
+    """
+    if not table_exists("random_pool"):
+        return _query_random_movies(N, min_votes)
+
+    # the pool is sorted by votes: movies with enough votes are the first pool_size ones
+    pool_size = _random_pool_size(min_votes, get_db_signature())
+    ids = random.sample(range(1, pool_size + 1), min(N, pool_size))
+    if not ids:
+        return []
+
+    with connection.cursor() as c:
+        sql = f"""
+            SELECT movie_id, title_name
+            FROM random_pool
+            WHERE pool_id IN ({", ".join("?" * len(ids))})
+        """
+        res = c.execute(sql, ids).fetchall()
+
+    res = [{"mid": t[0], "title": t[1]} for t in res]
+    random.shuffle(res)
+    return res
+
+def _query_random_movies(N: int, min_votes: int) -> list:
     with connection.cursor() as c:
 
         sql = f"""
@@ -52,148 +94,560 @@ def get_random_movies(N: int) -> list:
             FROM movies m
             JOIN movie_titles mt ON m.movie_id = mt.movie_id
             JOIN titles t ON mt.title_id = t.title_id 
+            LEFT JOIN ratings r ON m.movie_id = r.movie_id
             WHERE mt.is_primary = TRUE
+            AND COALESCE(r.num_votes, 0) >= ?
             ORDER BY RANDOM()
-            LIMIT {N}
+            LIMIT ?
         """
-        res = c.execute(sql).fetchall()
+        res = c.execute(sql, (min_votes, N)).fetchall()
 
     res = [{"mid": t[0], "title": t[1]} for t in res]
     return res
 
+@lru_cache(maxsize=32)
+def _random_pool_size(min_votes: int, db_signature: str) -> int:
+    with connection.cursor() as c:
+        return c.execute("SELECT COUNT(*) FROM random_pool WHERE num_votes >= ?", (min_votes,)).fetchone()[0]
+
+def refresh_random_pool() -> int:
+    """
+    (Re)builds the random_pool table: one row per movie with a primary title, numbered
+    from 1 without gaps in decreasing number of votes. Returns the number of movies in the pool.
+    """
+    with transaction.atomic(using=WRITE_DB), get_write_connection().cursor() as c:
+        c.execute("DROP TABLE IF EXISTS random_pool")
+        c.execute("""
+            CREATE TABLE random_pool (
+                pool_id INTEGER PRIMARY KEY,
+                movie_id VARCHAR(20) NOT NULL,
+                title_name VARCHAR(200),
+                num_votes INTEGER NOT NULL
+            )
+        """)
+        c.execute("""
+            INSERT INTO random_pool (movie_id, title_name, num_votes)
+            SELECT m.movie_id, MIN(t.title_name), COALESCE(MAX(r.num_votes), 0) AS votes
+            FROM movies m
+            JOIN movie_titles mt ON m.movie_id = mt.movie_id
+            JOIN titles t ON mt.title_id = t.title_id
+            LEFT JOIN ratings r ON m.movie_id = r.movie_id
+            WHERE mt.is_primary = TRUE
+            GROUP BY m.movie_id
+            ORDER BY votes DESC
+        """)
+        c.execute("CREATE INDEX idx_rp_votes ON random_pool(num_votes)")
+        return c.execute("SELECT COUNT(*) FROM random_pool").fetchone()[0]
+
+@cached()
 def get_film_list(
         page: int,
         filters: list,
         sort_on: Literal["title", "year", "note"],
-        order_by: Literal["ASC", "DESC"]
-    ) -> list:
+        order_by: Literal["ASC", "DESC"],
+        cursor: tuple | None = None,
+        with_count: bool = False,
+        pages: int = 1
+    ):
+    """
+    Returns a page of 20 movies.
+    Without a cursor the page is fetched with LIMIT/OFFSET, otherwise 'cursor' is a
+    ("after" | "before", sort_value, movie_id) tuple and the page is fetched by seeking
+    on (sort column, movie_id), which costs the same whatever the page number.
+    With a cursor, 'pages' consecutive pages can be read in the same query.
+    With 'with_count', returns (page, total number of movies) and the total is
+    computed in the same query as the page when it is not memoized yet.
+    """
     match sort_on:
         case "title":
-            sort_on = "t.title_name"
+            sort_on = "title_name"
         case "year":
-            sort_on = "m.year"
+            sort_on = "year"
         case "note":
-            sort_on = "r.average_rating"
+            sort_on = "average_rating"
         case _:
             raise(ValueError("wrong sort_on value in get_film_list: ", sort_on))
         
     if(order_by not in ["ASC", "DESC"]):
         raise(ValueError("wrong order_by value in get_film_list: ", order_by))
-    
-    offset = (page - 1) * 20
+
+    count_key = (normalize_filters(filters), None)
+    total = peek_count("film_list", count_key) if with_count else None
+    inline_count = with_count and total is None
+
+    source, params = _film_list_source(filters, sort_on)
+    if inline_count:
+        # the window runs over every filtered movie before the seek and the limit apply
+        source = f"SELECT *, COUNT(*) OVER () AS total FROM ({source})"
+
+    seek = ""
+    backwards = False
+    if cursor is None:
+        limit = "LIMIT 20 OFFSET ?"
+        params.append((page - 1) * 20)
+    else:
+        direction, value, mid = cursor
+        if direction not in ["after", "before"]:
+            raise(ValueError("wrong cursor direction in get_film_list: ", direction))
+
+        # the previous page is read in reverse order from the first row of the current one
+        backwards = direction == "before"
+        if backwards:
+            order_by = "DESC" if order_by == "ASC" else "ASC"
+        seek = f"AND ({sort_on}, movie_id) {'>' if order_by == 'ASC' else '<'} (?, ?)"
+        limit = "LIMIT ?"
+        params += [value, mid, 20 * pages]
+
     with connection.cursor() as c:
         sql = f"""
-            SELECT DISTINCT(m.movie_id), t.title_name, m.year, r.average_rating
-            FROM movies m
-            JOIN movie_titles mt ON m.movie_id = mt.movie_id
-            JOIN titles t ON mt.title_id = t.title_id 
-            JOIN ratings r ON m.movie_id = r.movie_id
-            JOIN movie_genres mg ON m.movie_id = mg.movie_id
-            JOIN genres g ON mg.genre_id = g.genre_id
-            WHERE g.genre_name LIKE ?
-            AND m.year >= ?
-            AND m.year <= ?
-            AND r.average_rating >= ?
-            AND mt.is_primary = TRUE
-            ORDER BY {sort_on} {order_by}
-            LIMIT 20 OFFSET ?
+            SELECT movie_id, title_name, year, average_rating{", total" if inline_count else ""}
+            FROM ({source})
+            WHERE TRUE {seek}
+            ORDER BY {sort_on} {order_by}, movie_id {order_by}
+            {limit}
         """
 
-        res = c.execute(sql, (f"%{filters[0]}%", filters[1], filters[2], filters[3], offset)).fetchall()
+        res = c.execute(sql, params).fetchall()
+    if backwards:
+        res.reverse()
+
+    if inline_count:
+        if res:
+            total = res[0][4]
+            store_count("film_list", count_key, total)
+        else:
+            # past the last page: no row carries the total
+            total = get_film_list_size(filters)
     res = [{"mid": t[0], "title": t[1], "year": t[2], "note": t[3]} for t in res]
-    return res
+    return (res, total) if with_count else res
 
-def get_film_list_size(filters: list) -> int:
-    with connection.cursor() as c:
-        sql = """
-            SELECT COUNT(DISTINCT(m.movie_id))
-            FROM movies m
-            JOIN ratings r ON m.movie_id = r.movie_id
-            JOIN movie_genres mg ON m.movie_id = mg.movie_id
-            JOIN genres g ON mg.genre_id = g.genre_id
-            WHERE g.genre_name LIKE ?
-            AND m.year >= ?
-            AND m.year <= ?
-            AND r.average_rating >= ?
+def _film_list_source(filters: list, sort_on: str | None = None) -> tuple[str, list]:
+    """
+    Returns (sql, params) of a subquery listing the (movie_id, title_name, year, average_rating)
+    of the movies matching the list page filters, to be sorted on the 'sort_on' column.
+    Reads movie_summary when it was built by refresh_movie_summary: a single table whose
+    indexes serve both the filters and the sort, instead of a join on six tables.
+    """
+    if table_exists("movie_summary"):
+        # a unary + keeps the planner from using the index of a filter column instead
+        # of the one of the sort column, which would sort every match to return 20 rows
+        year   = "year" if sort_on in [None, "year"] else "+year"
+        rating = "average_rating" if sort_on in [None, "average_rating"] else "+average_rating"
+        genre_sql, genre_params = _genre_filter(filters[0], filters[4], summary=True)
+        sql = f"""
+            SELECT movie_id, title_name, year, average_rating
+            FROM movie_summary
+            WHERE {year} >= ?
+            AND {year} <= ?
+            AND {rating} >= ?
+            {genre_sql}
         """
-        res = c.execute(sql, (f"%{filters[0]}%", filters[1], filters[2], filters[3])).fetchone()[0]
-    return res
+        return sql, [filters[1], filters[2], filters[3], *genre_params]
+
+    genre_sql, genre_params = _genre_filter(filters[0], filters[4], summary=False)
+    sql = f"""
+        SELECT DISTINCT m.movie_id AS movie_id, t.title_name AS title_name,
+            m.year AS year, r.average_rating AS average_rating
+        FROM movies m
+        JOIN movie_titles mt ON m.movie_id = mt.movie_id
+        JOIN titles t ON mt.title_id = t.title_id 
+        JOIN ratings r ON m.movie_id = r.movie_id
+        WHERE m.year >= ?
+        AND m.year <= ?
+        AND r.average_rating >= ?
+        AND mt.is_primary = TRUE
+        {genre_sql}
+    """
+    return sql, [filters[1], filters[2], filters[3], *genre_params]
+
+def _genre_filter(genres: list, genre_mode: str, summary: bool) -> tuple[str, list]:
+    """
+    Returns the (sql, params) condition keeping the movies of the given genres:
+    at least one of them if genre_mode is "any", all of them if it is "all".
+    Genre names are resolved to their genre_id through get_genre_ids, then matched on
+    movie_summary.genre_mask if 'summary' (bit genre_id - 1), on movie_genres.genre_id otherwise.
+    No genre means no condition.
+    """
+    if genre_mode not in ["any", "all"]:
+        raise(ValueError("wrong genre_mode value in get_film_list: ", genre_mode))
+    if not genres:
+        return "", []
+
+    genre_ids = get_genre_ids()
+    ids = sorted({genre_ids[g.lower()] for g in genres if g.lower() in genre_ids})
+    # an unknown genre matches no movie
+    if not ids or (genre_mode == "all" and len(ids) < len({g.lower() for g in genres})):
+        return "AND FALSE", []
+
+    if summary:
+        mask = sum(1 << (i - 1) for i in ids)
+        if genre_mode == "any":
+            return "AND genre_mask & ? != 0", [mask]
+        return "AND genre_mask & ? = ?", [mask, mask]
+
+    placeholders = ", ".join("?" * len(ids))
+    if genre_mode == "any":
+        return f"""
+            AND m.movie_id IN (SELECT movie_id FROM movie_genres WHERE genre_id IN ({placeholders}))
+        """, ids
+    return f"""
+        AND m.movie_id IN (
+            SELECT movie_id FROM movie_genres
+            WHERE genre_id IN ({placeholders})
+            GROUP BY movie_id
+            HAVING COUNT(*) = ?
+        )
+    """, [*ids, len(ids)]
+
+def get_film_list_size(filters: list, cap: int | None = None) -> int:
+    """
+    Returns the number of movies matching the filters, memoized per filter set.
+    With 'cap', counting stops after cap + 1 movies: any result above 'cap' means "more than cap".
+    """
+    def count():
+        if table_exists("movie_summary"):
+            source, params = _film_list_source(filters)
+        else:
+            genre_sql, genre_params = _genre_filter(filters[0], filters[4], summary=False)
+            source = f"""
+                SELECT m.movie_id
+                FROM movies m
+                JOIN ratings r ON m.movie_id = r.movie_id
+                WHERE m.year >= ?
+                AND m.year <= ?
+                AND r.average_rating >= ?
+                {genre_sql}
+            """
+            params = [filters[1], filters[2], filters[3], *genre_params]
+
+        with connection.cursor() as c:
+            sql = f"SELECT COUNT(*) FROM ({source} LIMIT ?)"
+            return c.execute(sql, (*params, _count_limit(cap))).fetchone()[0]
+
+    return cached_count("film_list", (normalize_filters(filters), cap), count)
+
+def refresh_movie_summary() -> int:
+    """
+    (Re)builds movie_summary: one row per movie with its primary title, year, rating, votes and
+    the mask of its genres. Each sort of the list page has an index covering the filters,
+    scanned forward for ASC and backward for DESC. Returns the number of movies in the table.
+    """
+    with transaction.atomic(using=WRITE_DB), get_write_connection().cursor() as c:
+        c.execute("DROP TABLE IF EXISTS movie_summary")
+        c.execute("""
+            CREATE TABLE movie_summary (
+                movie_id VARCHAR(20) PRIMARY KEY,
+                title_name VARCHAR(200) COLLATE NOCASE,
+                year INTEGER,
+                average_rating REAL,
+                num_votes INTEGER,
+                genre_mask INTEGER NOT NULL
+            )
+        """)
+        c.execute("""
+            INSERT INTO movie_summary (movie_id, title_name, year, average_rating, num_votes, genre_mask)
+            SELECT m.movie_id, MIN(t.title_name), m.year, r.average_rating, r.num_votes,
+                COALESCE((
+                    SELECT SUM(1 << (mg.genre_id - 1))
+                    FROM movie_genres mg
+                    WHERE mg.movie_id = m.movie_id
+                ), 0)
+            FROM movies m
+            JOIN movie_titles mt ON m.movie_id = mt.movie_id
+            JOIN titles t ON mt.title_id = t.title_id
+            LEFT JOIN ratings r ON m.movie_id = r.movie_id
+            WHERE mt.is_primary = TRUE
+            GROUP BY m.movie_id
+        """)
+        c.execute("""
+            CREATE INDEX idx_ms_title
+            ON movie_summary(title_name, movie_id, year, average_rating, genre_mask)
+        """)
+        c.execute("""
+            CREATE INDEX idx_ms_year
+            ON movie_summary(year, movie_id, average_rating, genre_mask, title_name)
+        """)
+        c.execute("""
+            CREATE INDEX idx_ms_note
+            ON movie_summary(average_rating, movie_id, year, genre_mask, title_name)
+        """)
+        # statistics letting the planner choose between the filter and the sort indexes
+        c.execute("ANALYZE movie_summary")
+        return c.execute("SELECT COUNT(*) FROM movie_summary").fetchone()[0]
+
+def _count_limit(cap: int | None) -> int:
+    # LIMIT -1 means no limit in SQLite
+    return -1 if cap is None else cap + 1
+
+@lru_cache(maxsize=64)
+def _table_exists(name: str, db_signature: str) -> bool:
+    with connection.cursor() as c:
+        res = c.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    return res is not None
+
+def table_exists(name: str) -> bool:
+    """
+    Tells whether the optional table or index 'name', built by the scripts
+    of phase1_sqlite, exists in the current dataset.
+    """
+    return _table_exists(name, get_db_signature())
+
+@cached()
+def get_genre_ids() -> dict:
+    """
+    Returns {lower case genre name: genre_id} for every genre, resolving the genre
+    filters of the list page without a join on genres.
+    """
+    with connection.cursor() as c:
+        res = c.execute("SELECT genre_name, genre_id FROM genres").fetchall()
+    return {r[0].lower(): r[1] for r in res}
 
+@cached()
 def get_genre_list() -> list:
     with connection.cursor() as c:
         res = c.execute("SELECT genre_name FROM genres").fetchall()
     return [r[0] for r in res]
 
-def search_movies_from_title(title: str, page: int) -> list:
+def _title_match(title: str):
+    """
+    Returns the FTS5 query matching 'title' as a substring of the primary titles,
+    or None if the title_search index can't serve it: index not built by
+    scripts/phase1_sqlite/search_index.py, or query shorter than a trigram.
+    """
+    title = title.strip()
+    if len(title) < 3 or not table_exists("title_search"):
+        return None
+    return '"' + title.replace('"', '""') + '"'
+
+@cached()
+def search_movies_from_title(title: str, page: int, with_count: bool = False):
+    """
+    Returns a page of 20 movies whose primary title contains 'title', best bm25 matches
+    first then most voted movies first.
+    With 'with_count', returns (page, total number of results), see get_film_list.
+    """
+    count_key = (normalize_query(title), None)
+    total = peek_count("title_search", count_key) if with_count else None
+    inline_count = with_count and total is None
+    window = ", COUNT(*) OVER ()" if inline_count else ""
+
     offset = (page - 1) * 20
+    match_query = _title_match(title)
     with connection.cursor() as c:
-        sql = """
-            SELECT DISTINCT(m.movie_id), t.title_name
-            FROM movies m
-            JOIN movie_titles mt ON m.movie_id = mt.movie_id
-            JOIN titles t ON mt.title_id = t.title_id
-            WHERE mt.is_primary = TRUE
-            AND t.title_name LIKE ?
-            ORDER BY t.title_name ASC
-            LIMIT 20 OFFSET ?
-        """
+        if match_query:
+            sql = f"""
+                SELECT ts.movie_id, ts.title_name{window}
+                FROM (
+                    SELECT movie_id, title_name, bm25(title_search) AS score
+                    FROM title_search
+                    WHERE title_search MATCH ?
+                ) ts
+                LEFT JOIN ratings r ON ts.movie_id = r.movie_id
+                ORDER BY ts.score ASC, r.num_votes DESC
+                LIMIT 20 OFFSET ?
+            """
+            params = (match_query, offset)
+        else:
+            sql = f"""
+                SELECT m.movie_id, t.title_name{window}
+                FROM movies m
+                JOIN movie_titles mt ON m.movie_id = mt.movie_id
+                JOIN titles t ON mt.title_id = t.title_id
+                WHERE mt.is_primary = TRUE
+                AND t.title_name LIKE ?
+                GROUP BY m.movie_id
+                ORDER BY t.title_name ASC
+                LIMIT 20 OFFSET ?
+            """
+            params = (f"%{title}%", offset)
 
-        res = c.execute(sql, (f"%{title}%", offset)).fetchall()
+        res = c.execute(sql, params).fetchall()
+
+    if inline_count:
+        if res:
+            total = res[0][2]
+            store_count("title_search", count_key, total)
+        else:
+            total = get_list_from_title_size(title)
     res = [{"mid": r[0], "title": r[1]} for r in res]
-    return res
+    return (res, total) if with_count else res
 
-def get_list_from_title_size(title: str):
-    with connection.cursor() as c:
-        sql = """
-            SELECT COUNT(DISTINCT(m.movie_id))
-            FROM movies m
-            JOIN movie_titles mt ON m.movie_id = mt.movie_id
-            JOIN titles t ON mt.title_id = t.title_id
-            WHERE mt.is_primary = TRUE
-            AND t.title_name LIKE ?
-        """
+def get_list_from_title_size(title: str, cap: int | None = None) -> int:
+    """
+    Returns the number of movies whose primary title contains 'title', memoized per query.
+    With 'cap', counting stops after cap + 1 movies.
+    """
+    def count():
+        match_query = _title_match(title)
+        with connection.cursor() as c:
+            if match_query:
+                sql = """
+                    SELECT COUNT(*) FROM (
+                        SELECT movie_id
+                        FROM title_search
+                        WHERE title_search MATCH ?
+                        LIMIT ?
+                    )
+                """
+                params = (match_query, _count_limit(cap))
+            else:
+                sql = """
+                    SELECT COUNT(*) FROM (
+                        SELECT DISTINCT(m.movie_id)
+                        FROM movies m
+                        JOIN movie_titles mt ON m.movie_id = mt.movie_id
+                        JOIN titles t ON mt.title_id = t.title_id
+                        WHERE mt.is_primary = TRUE
+                        AND t.title_name LIKE ?
+                        LIMIT ?
+                    )
+                """
+                params = (f"%{title}%", _count_limit(cap))
+            return c.execute(sql, params).fetchone()[0]
 
-        res = c.execute(sql, (f"%{title}%",)).fetchone()[0]
-    return res
+    return cached_count("title_search", (normalize_query(title), cap), count)
+
+def name_trigrams(name: str) -> set:
+    """
+    Returns the trigrams of a person name, the same way as scripts/phase1_sqlite/search_index.py:
+    diacritics removed, lower case, each word padded with two spaces before and one after.
+    """
+    folded = unicodedata.normalize("NFKD", name)
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch)).lower()
+    trigrams = set()
+    for word in re.findall(r"\w+", folded):
+        padded = "  " + word + " "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+def _person_match(person_name: str):
+    """
+    Returns (sql, params) of a subquery listing the (person_id, similarity) of the persons
+    whose name looks like 'person_name', or None if the person_search index can't serve it:
+    index not built by scripts/phase1_sqlite/search_index.py, or query shorter than a trigram.
+    The similarity is the Dice coefficient of the trigrams: 2 * shared / (query + name trigrams),
+    so that typos ("brad pit") and partial names ("brad") still match while a name sharing
+    only its first word with the query ("Bradley Cooper") doesn't.
+    """
+    trigrams = name_trigrams(person_name)
+    if len(normalize_query(person_name)) < 3 or not trigrams or not table_exists("person_search"):
+        return None
+
+    sql = f"""
+        SELECT person_id, 2.0 * shared / (? + ps.trigram_count) AS similarity
+        FROM (
+            SELECT person_id, COUNT(*) AS shared
+            FROM person_trigrams
+            WHERE trigram IN ({", ".join("?" * len(trigrams))})
+            GROUP BY person_id
+        )
+        JOIN person_search ps USING (person_id)
+        WHERE similarity >= ?
+    """
+    return sql, [len(trigrams), *trigrams, settings.PERSON_SEARCH_THRESHOLD]
+
+@cached()
+def search_movies_from_person(person_name: str, page: int, with_count: bool = False):
+    """
+    Returns a page of 20 movies in which a person whose name looks like 'person_name' took part.
+    Movies of the closest matches come first, then the ones of the persons with the most movies.
+    With 'with_count', returns (page, total number of results), see get_film_list.
+    """
+    count_key = (normalize_query(person_name), None)
+    total = peek_count("person_search", count_key) if with_count else None
+    inline_count = with_count and total is None
+    window = ", COUNT(*) OVER ()" if inline_count else ""
 
-def search_movies_from_person(person_name: str, page: int) -> list:
     offset = (page - 1) * 20
+    person_match = _person_match(person_name)
     with connection.cursor() as c:
-        sql = """
-            SELECT DISTINCT(m.movie_id), t.title_name
-            FROM movies m
-            JOIN movie_titles mt ON m.movie_id = mt.movie_id
-            JOIN titles t ON mt.title_id = t.title_id
-            JOIN principals pr ON m.movie_id = pr.movie_id
-            JOIN persons pe ON pr.person_id = pe.person_id
-            WHERE mt.is_primary = TRUE
-            AND pe.name LIKE ?
-            ORDER BY pe.name ASC
-            LIMIT 20 OFFSET ?
-        """
+        if person_match:
+            match_sql, params = person_match
+            sql = f"""
+                SELECT mt.movie_id, t.title_name{window}
+                FROM ({match_sql}) pm
+                JOIN person_search ps ON pm.person_id = ps.person_id
+                JOIN principals pr ON pm.person_id = pr.person_id
+                JOIN movie_titles mt ON pr.movie_id = mt.movie_id
+                JOIN titles t ON mt.title_id = t.title_id
+                WHERE mt.is_primary = TRUE
+                GROUP BY mt.movie_id
+                ORDER BY MAX(pm.similarity) DESC, MAX(ps.film_count) DESC, t.title_name ASC
+                LIMIT 20 OFFSET ?
+            """
+            params = (*params, offset)
+        else:
+            sql = f"""
+                SELECT movie_id, title_name{window}
+                FROM (
+                    SELECT m.movie_id AS movie_id, t.title_name AS title_name, MIN(pe.name) AS name
+                    FROM movies m
+                    JOIN movie_titles mt ON m.movie_id = mt.movie_id
+                    JOIN titles t ON mt.title_id = t.title_id
+                    JOIN principals pr ON m.movie_id = pr.movie_id
+                    JOIN persons pe ON pr.person_id = pe.person_id
+                    WHERE mt.is_primary = TRUE
+                    AND pe.name LIKE ?
+                    GROUP BY m.movie_id
+                )
+                ORDER BY name ASC
+                LIMIT 20 OFFSET ?
+            """
+            params = (f"%{person_name}%", offset)
+
+        res = c.execute(sql, params).fetchall()
 
-        res = c.execute(sql, (f"%{person_name}%", offset)).fetchall()
+    if inline_count:
+        if res:
+            total = res[0][2]
+            store_count("person_search", count_key, total)
+        else:
+            total = get_list_from_person_size(person_name)
     res = [{"mid": r[0], "title": r[1]} for r in res]
-    return res
+    return (res, total) if with_count else res
 
 
-def get_list_from_person_size(person_name: str):
-    with connection.cursor() as c:
-        sql = """
-            SELECT COUNT(DISTINCT(m.movie_id))
-            FROM movies m
-            JOIN movie_titles mt ON m.movie_id = mt.movie_id
-            JOIN titles t ON mt.title_id = t.title_id
-            JOIN principals pr ON m.movie_id = pr.movie_id
-            JOIN persons pe ON pr.person_id = pe.person_id
-            WHERE mt.is_primary = TRUE
-            AND pe.name LIKE ?
-        """
+def get_list_from_person_size(person_name: str, cap: int | None = None) -> int:
+    """
+    Returns the number of movies in which a person whose name looks like 'person_name'
+    took part, memoized per query. With 'cap', counting stops after cap + 1 movies.
+    """
+    def count():
+        person_match = _person_match(person_name)
+        with connection.cursor() as c:
+            if person_match:
+                match_sql, params = person_match
+                sql = f"""
+                    SELECT COUNT(*) FROM (
+                        SELECT DISTINCT(mt.movie_id)
+                        FROM ({match_sql}) pm
+                        JOIN principals pr ON pm.person_id = pr.person_id
+                        JOIN movie_titles mt ON pr.movie_id = mt.movie_id
+                        WHERE mt.is_primary = TRUE
+                        LIMIT ?
+                    )
+                """
+                params = (*params, _count_limit(cap))
+            else:
+                sql = """
+                    SELECT COUNT(*) FROM (
+                        SELECT DISTINCT(m.movie_id)
+                        FROM movies m
+                        JOIN movie_titles mt ON m.movie_id = mt.movie_id
+                        JOIN titles t ON mt.title_id = t.title_id
+                        JOIN principals pr ON m.movie_id = pr.movie_id
+                        JOIN persons pe ON pr.person_id = pe.person_id
+                        WHERE mt.is_primary = TRUE
+                        AND pe.name LIKE ?
+                        LIMIT ?
+                    )
+                """
+                params = (f"%{person_name}%", _count_limit(cap))
+            return c.execute(sql, params).fetchone()[0]
 
-        res = c.execute(sql, (f"%{person_name}%",)).fetchone()[0]
-    return res
+    return cached_count("person_search", (normalize_query(person_name), cap), count)
 
-def get_movies_count_by_genre() -> dict:
+def _query_movies_count_by_genre() -> dict:
     with connection.cursor() as c:
         sql = """
             SELECT COUNT(DISTINCT(mg.movie_id)), g.genre_name
@@ -205,7 +659,7 @@ def get_movies_count_by_genre() -> dict:
     res = [{"movie_count": r[0], "genre": r[1]} for r in res]
     return res
 
-def get_movies_count_by_decade() -> dict:
+def _query_movies_count_by_decade() -> dict:
     with connection.cursor() as c:
         sql = """
             WITH cte AS (
@@ -220,7 +674,7 @@ def get_movies_count_by_decade() -> dict:
     res = [{"movie_count": r[0], "decade": r[1]} for r in res]
     return res
 
-def get_ratings_distribution(bin_size: int) -> list[dict]:
+def _query_ratings_distribution(bin_size: int) -> list[dict]:
     with connection.cursor() as c:
         sql = """
             SELECT CAST(average_rating / ? AS INTEGER) * ? AS bin,
@@ -233,7 +687,7 @@ def get_ratings_distribution(bin_size: int) -> list[dict]:
     res = [{"bin": r[0], "count": r[1]} for r in res]
     return res
 
-def get_top_N_prolific_actors(N: int) -> list:
+def _query_top_N_prolific_actors(N: int) -> list:
     with connection.cursor() as c:
         sql = """ SELECT COUNT(c.person_id), pe.name
             FROM cast c 
@@ -245,4 +699,72 @@ def get_top_N_prolific_actors(N: int) -> list:
         """ 
         res = c.execute(sql, (N,)).fetchall()
     res = [{"movies_played": r[0], "actor": r[1]} for r in res]
-    return res
\ No newline at end of file
+    return res
+
+def get_movies_count_by_genre() -> dict:
+    res = _stats_snapshot().get("movies_by_genre")
+    return res if res is not None else _query_movies_count_by_genre()
+
+def get_movies_count_by_decade() -> dict:
+    res = _stats_snapshot().get("movies_by_decade")
+    return res if res is not None else _query_movies_count_by_decade()
+
+def get_ratings_distribution(bin_size: int) -> list[dict]:
+    res = _stats_snapshot().get(f"ratings_distribution_{bin_size}")
+    return res if res is not None else _query_ratings_distribution(bin_size)
+
+def get_top_N_prolific_actors(N: int) -> list:
+    res = _stats_snapshot().get("prolific_actors")
+    if res is None or N > len(res):
+        return _query_top_N_prolific_actors(N)
+    return res[:N]
+
+#----------Stats snapshot----------
+
+# Number of prolific actors and ratings bin sizes kept in the snapshot
+SNAPSHOT_PROLIFIC_ACTORS = 100
+SNAPSHOT_RATINGS_BINS = [1]
+
+@lru_cache(maxsize=1)
+def _read_stats_snapshot(db_signature: str) -> dict:
+    if not table_exists("stats_snapshot"):
+        return {}
+    with connection.cursor() as c:
+        res = c.execute("SELECT name, value FROM stats_snapshot").fetchall()
+    return {name: json.loads(value) for name, value in res}
+
+def _stats_snapshot() -> dict:
+    """
+    Returns the aggregations precomputed by refresh_stats_snapshot, read once per dataset.
+    Empty if the snapshot was never built, in which case the stats are queried directly.
+    """
+    return _read_stats_snapshot(get_db_signature())
+
+def refresh_stats_snapshot() -> dict:
+    """
+    (Re)computes the aggregations of the home and stats pages and stores them as JSON
+    in the stats_snapshot table. Must be called after each import, see the refresh_stats command.
+    Returns the stored values.
+    """
+    snapshot = {
+        "basic_stats":      _query_basic_stats(),
+        "movies_by_genre":  _query_movies_count_by_genre(),
+        "movies_by_decade": _query_movies_count_by_decade(),
+        "prolific_actors":  _query_top_N_prolific_actors(SNAPSHOT_PROLIFIC_ACTORS),
+    }
+    for bin_size in SNAPSHOT_RATINGS_BINS:
+        snapshot[f"ratings_distribution_{bin_size}"] = _query_ratings_distribution(bin_size)
+
+    with transaction.atomic(using=WRITE_DB), get_write_connection().cursor() as c:
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS stats_snapshot (
+                name VARCHAR(50) PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+        c.execute("DELETE FROM stats_snapshot")
+        c.executemany(
+            "INSERT INTO stats_snapshot (name, value) VALUES (?, ?)",
+            [(name, json.dumps(value)) for name, value in snapshot.items()]
+        )
+    return snapshot
@@ -0,0 +1,280 @@
+import hashlib
+import io
+import logging
+import queue
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import requests
+from django.conf import settings
+
+# Image URLs of the movie thumbnails, configured by settings.THUMBNAILS.
+# URLs are kept in a local SQLite file, separate from imdb.db which the web app may open read-only.
+# Movies missing from it are fetched from the image API by background threads,
+# at most CONCURRENCY at a time and RATE per second.
+# The thumbnails built by the build_thumbnails command are stored under STORAGE, named by the
+# sha256 of their content, and served by the web app itself from /thumb/<movie_id>.
+
+MOVIE_ID = re.compile(r"tt\d+")
+
+logger = logging.getLogger("movies.thumbnails")
+
+class RateLimiter:
+    """
+    Spaces the calls of all the threads by at least 1 / rate seconds.
+    """
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        time.sleep(start - now)
+
+class ImageUrlStore:
+    """
+    Persistent movie_id -> image URL table (a NULL url records that the API has no image),
+    along with the hashes of the local thumbnails of each movie.
+    """
+    def __init__(self, path: str):
+        self.path = str(path)
+        self._local = threading.local()
+
+    @property
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS image_urls (
+                    movie_id VARCHAR(20) PRIMARY KEY,
+                    url TEXT,
+                    fetched_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS thumbs (
+                    movie_id VARCHAR(20),
+                    size VARCHAR(20),
+                    hash CHAR(64) NOT NULL,
+
+                    PRIMARY KEY (movie_id, size)
+                ) WITHOUT ROWID
+            """)
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, movie_ids: list) -> dict:
+        """
+        Returns {movie_id: (url, fetched_at)} of the stored movies among 'movie_ids'.
+        """
+        if not movie_ids:
+            return {}
+        placeholders = ", ".join("?" * len(movie_ids))
+        res = self._conn.execute(
+            f"SELECT movie_id, url, fetched_at FROM image_urls WHERE movie_id IN ({placeholders})",
+            movie_ids
+        ).fetchall()
+        return {r[0]: (r[1], r[2]) for r in res}
+
+    def set(self, movie_id: str, url: str | None) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO image_urls (movie_id, url, fetched_at) VALUES (?, ?, ?)",
+            (movie_id, url, time.time())
+        )
+
+    def get_local(self, movie_ids: list, size: str = "card") -> set:
+        """
+        Returns the movies of 'movie_ids' having a local thumbnail of the given size.
+        """
+        if not movie_ids:
+            return set()
+        placeholders = ", ".join("?" * len(movie_ids))
+        res = self._conn.execute(
+            f"SELECT movie_id FROM thumbs WHERE size = ? AND movie_id IN ({placeholders})",
+            (size, *movie_ids)
+        ).fetchall()
+        return {r[0] for r in res}
+
+    def get_thumb(self, movie_id: str, size: str):
+        res = self._conn.execute(
+            "SELECT hash FROM thumbs WHERE movie_id = ? AND size = ?", (movie_id, size)
+        ).fetchone()
+        return res[0] if res else None
+
+    def set_thumbs(self, movie_id: str, hashes: dict) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO thumbs (movie_id, size, hash) VALUES (?, ?, ?)",
+            [(movie_id, size, h) for size, h in hashes.items()]
+        )
+
+class ThumbnailFetcher:
+    """
+    Background threads filling the store from the image API.
+    A movie is queued once, however many requests ask for it while it is pending.
+    """
+    def __init__(self, store: ImageUrlStore, api_url: str, concurrency: int, rate: float, timeout: float):
+        self.store = store
+        self.api_url = api_url
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._limiter = RateLimiter(rate)
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._done = threading.Condition()
+        self._threads = []
+        self._session = requests.Session()
+
+    def request(self, movie_ids: list) -> None:
+        with self._done:
+            for mid in movie_ids:
+                if mid not in self._pending:
+                    self._pending.add(mid)
+                    self._queue.put(mid)
+            # threads are started on first use, in the worker serving the request,
+            # and replaced if one of them died
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.concurrency:
+                thread = threading.Thread(target=self._run, daemon=True, name="thumbnails")
+                thread.start()
+                self._threads.append(thread)
+
+    def wait(self, movie_ids: list, timeout: float) -> None:
+        """
+        Waits until none of 'movie_ids' is pending, 'timeout' seconds at most.
+        """
+        with self._done:
+            self._done.wait_for(lambda: self._pending.isdisjoint(movie_ids), timeout)
+
+    def _run(self) -> None:
+        while True:
+            mid = self._queue.get()
+            try:
+                self._fetch(mid)
+            except Exception:
+                # not stored either: a bad answer or a locked store must not stop the thread
+                logger.exception("thumbnail fetch of %s failed", mid)
+            finally:
+                with self._done:
+                    self._pending.discard(mid)
+                    self._done.notify_all()
+
+    def _fetch(self, movie_id: str) -> None:
+        self._limiter.wait()
+        try:
+            res = self._session.get(self.api_url + movie_id, timeout=self.timeout)
+        except requests.RequestException:
+            # not stored: fetched again the next time it is asked for
+            return
+        if res.status_code == 404:
+            self.store.set(movie_id, None)
+        elif res.ok:
+            image = res.json().get("primaryImage") or {}
+            self.store.set(movie_id, image.get("url"))
+
+_fetcher = None
+_fetcher_conf = None
+_fetcher_lock = threading.Lock()
+
+def get_fetcher() -> ThumbnailFetcher:
+    """
+    Returns the fetcher of this process, built from settings.THUMBNAILS.
+    """
+    global _fetcher, _fetcher_conf
+    conf = settings.THUMBNAILS
+    with _fetcher_lock:
+        if _fetcher is None or _fetcher_conf is not conf:
+            _fetcher = ThumbnailFetcher(
+                ImageUrlStore(conf["PATH"]), conf["API_URL"], conf["CONCURRENCY"], conf["RATE"], conf["TIMEOUT"]
+            )
+            _fetcher_conf = conf
+    return _fetcher
+
+def get_image_urls(movie_ids: list, wait: float = 0) -> tuple[dict, list]:
+    """
+    Returns ({movie_id: image URL or None}, [pending movie_ids]) for the valid ids of 'movie_ids',
+    the URL being /thumb/<movie_id> for the movies with a local thumbnail.
+    Movies not stored yet, or stored without image for more than MISSING_TTL seconds,
+    are fetched in the background; the call waits for them 'wait' seconds at most.
+    """
+    conf = settings.THUMBNAILS
+    movie_ids = list(dict.fromkeys(mid for mid in movie_ids if MOVIE_ID.fullmatch(mid)))[:conf["MAX_BATCH"]]
+    fetcher = get_fetcher()
+
+    # thumbnails of our own origin first
+    local = fetcher.store.get_local(movie_ids)
+    stored = {mid: (f"/thumb/{mid}", None) for mid in local}
+    stored.update(fetcher.store.get_many([mid for mid in movie_ids if mid not in local]))
+    now = time.time()
+    misses = [
+        mid for mid in movie_ids
+        if mid not in stored or (stored[mid][0] is None and now - stored[mid][1] > conf["MISSING_TTL"])
+    ]
+    if misses:
+        fetcher.request(misses)
+        if wait:
+            fetcher.wait(misses, wait)
+            stored.update(fetcher.store.get_many(misses))
+
+    urls = {mid: stored[mid][0] for mid in movie_ids if mid in stored}
+    pending = [mid for mid in misses if mid not in urls]
+    return urls, pending
+
+def thumbnail_path(content_hash: str) -> Path:
+    """
+    Returns the file of the thumbnail of sha256 'content_hash', spread over 256 directories.
+    """
+    return Path(settings.THUMBNAILS["STORAGE"]) / content_hash[:2] / f"{content_hash}.jpg"
+
+def get_thumbnail(movie_id: str, size: str):
+    """
+    Returns (path, hash) of the local thumbnail of 'movie_id' in the given size, or None.
+    """
+    content_hash = get_fetcher().store.get_thumb(movie_id, size)
+    if content_hash is None:
+        return None
+    return thumbnail_path(content_hash), content_hash
+
+def resize_image(data: bytes, sizes: dict) -> dict:
+    """
+    Returns {size name: JPEG bytes} of the image 'data' fitted in each (width, height) of 'sizes'.
+    Runs in the processes of build_thumbnails: takes and returns bytes only.
+    """
+    from PIL import Image
+
+    res = {}
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("RGB")
+        for name, box in sizes.items():
+            resized = image.copy()
+            resized.thumbnail(box, Image.Resampling.LANCZOS)
+            out = io.BytesIO()
+            resized.save(out, "JPEG", quality=85, optimize=True, progressive=True)
+            res[name] = out.getvalue()
+    return res
+
+def store_thumbnails(movie_id: str, images: dict) -> dict:
+    """
+    Writes the resized images of 'movie_id' under their sha256 and records them.
+    Returns {size name: hash}.
+    """
+    hashes = {}
+    for size, data in images.items():
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = thumbnail_path(content_hash)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(data)
+            tmp.replace(path)
+        hashes[size] = content_hash
+    get_fetcher().store.set_thumbs(movie_id, hashes)
+    return hashes
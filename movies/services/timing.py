@@ -0,0 +1,181 @@
+import contextvars
+import time
+
+from django.conf import settings
+from pymongo import monitoring
+
+from . import slow_queries
+
+# Per-request timings of the database queries, enabled by settings.DB_TIMING.
+# Each query is recorded as {"backend", "query", "ms", "rows"} in the list of the current request.
+# The same hooks feed the slow query log (see slow_queries.py).
+
+_queries = contextvars.ContextVar("db_timing_queries", default=None)
+
+def is_enabled() -> bool:
+    return getattr(settings, "DB_TIMING", False)
+
+def hooks_needed() -> bool:
+    """
+    Tells whether the queries must be timed, for the requests or for the slow query log.
+    """
+    return is_enabled() or slow_queries.is_enabled()
+
+def start_request():
+    """
+    Starts recording the queries of the current request (and of the threads it calls through
+    sync_to_async, which copies the context). Returns the token for end_request.
+    """
+    return _queries.set([])
+
+def end_request(token) -> list:
+    """
+    Stops recording and returns the queries of the request.
+    """
+    queries = _queries.get()
+    _queries.reset(token)
+    return queries or []
+
+def record(backend: str, query: str, ms: float, rows: int) -> None:
+    queries = _queries.get()
+    if queries is not None:
+        queries.append({"backend": backend, "query": query, "ms": ms, "rows": rows})
+
+def summarize(queries: list) -> dict:
+    """
+    Returns {backend: {"queries", "ms", "rows"}} totals of the recorded queries.
+    """
+    totals = {}
+    for q in queries:
+        t = totals.setdefault(q["backend"], {"queries": 0, "ms": 0.0, "rows": 0})
+        t["queries"] += 1
+        t["ms"] += q["ms"]
+        t["rows"] += q["rows"]
+    return totals
+
+class _TimedCursor:
+    """
+    Proxy of the cursor returned by execute: SQLite computes the rows as they are fetched,
+    so the time of the query runs until its rows are read.
+    """
+    def __init__(self, cursor, sql: str, params, connection, elapsed: float):
+        self._cursor = cursor
+        self._sql = sql
+        self._params = params
+        self._connection = connection
+        self._elapsed = elapsed
+        self._rows = 0
+
+    def _fetch(self, fetch, *args):
+        start = time.perf_counter()
+        res = fetch(*args)
+        self._elapsed += time.perf_counter() - start
+        return res
+
+    def fetchone(self):
+        row = self._fetch(self._cursor.fetchone)
+        self._rows += row is not None
+        self._done()
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._fetch(self._cursor.fetchmany, *args)
+        self._rows += len(rows)
+        if not rows:
+            self._done()
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(self._cursor.fetchall)
+        self._rows += len(rows)
+        self._done()
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def _done(self):
+        # recorded once, when the caller has read what it needed or drops the cursor
+        if self._sql is not None:
+            _sqlite_done(self._connection, self._sql, self._params, self._elapsed * 1000, self._rows)
+            self._sql = None
+
+    def __del__(self):
+        self._done()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+def _sqlite_done(connection, sql: str, params, ms: float, rows: int) -> None:
+    record("sqlite", sql, ms, rows)
+    if slow_queries.is_slow(ms):
+        slow_queries.log_sqlite(connection, sql, params, ms, rows)
+
+def sqlite_wrapper(execute, sql, params, many, context):
+    """
+    Execute wrapper of the Django connections (see connection.execute_wrappers):
+    times each query of a request being recorded, and every query for the slow query log.
+    """
+    if _queries.get() is None and not slow_queries.is_enabled():
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    cursor = execute(sql, params, many, context)
+    elapsed = time.perf_counter() - start
+    if many or cursor is None:
+        # executemany: no plan for a batch of parameters
+        record("sqlite", sql, elapsed * 1000, max(cursor.rowcount, 0) if cursor is not None else 0)
+        return cursor
+    return _TimedCursor(cursor, sql, params, context["connection"], elapsed)
+
+def install_sqlite_wrapper(sender, connection, **kwargs):
+    """
+    connection_created receiver adding sqlite_wrapper to every new SQLite connection.
+    """
+    if connection.vendor == "sqlite" and sqlite_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sqlite_wrapper)
+
+class MongoTimingListener(monitoring.CommandListener):
+    """
+    Times the commands sent by the clients behind mongo_service._db, including the getMore
+    of cursors iterated later, e.g. by the templates.
+    """
+    def __init__(self):
+        self._started = {}
+
+    def started(self, event):
+        if _queries.get() is not None or slow_queries.is_enabled():
+            self._started[event.request_id] = (event.command_name, event.command)
+
+    def succeeded(self, event):
+        self._finish(event, self._count_rows(event.reply))
+
+    def failed(self, event):
+        self._finish(event, 0)
+
+    def _finish(self, event, rows: int):
+        started = self._started.pop(event.request_id, None)
+        if started is None:
+            return
+        command_name, command = started
+        # duration_micros is measured by the driver, in the thread of the caller
+        ms = event.duration_micros / 1000
+        # the value of the command name is the collection, or the cursor id for a getMore
+        target = command.get(command_name)
+        record("mongo", f"{command_name} {target}" if isinstance(target, str) else command_name, ms, rows)
+        if slow_queries.is_slow(ms):
+            slow_queries.log_mongo(command_name, command, ms, rows)
+
+    @staticmethod
+    def _count_rows(reply) -> int:
+        cursor = reply.get("cursor")
+        if cursor is not None:
+            return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+        return reply.get("n", 0)
+
+def mongo_listeners() -> list:
+    """
+    Returns the event listeners to give to the Mongo clients: none when neither DB_TIMING
+    nor the slow query log is enabled.
+    """
+    return [MongoTimingListener()] if hooks_needed() else []
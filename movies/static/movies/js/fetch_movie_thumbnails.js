@@ -4,21 +4,34 @@ function sleep(ms) {
     return new Promise(resolve => setTimeout(resolve, ms));
 }
 
-async function delayed_fetch(card) {
-    const movie_id = card.dataset.imdbId
-    const res = await fetch("https://api.imdbapi.dev/titles/" + movie_id);
+// image URLs of all the cards in one request, from the cache of the server
+async function fetch_thumbnails(movie_ids) {
+    const res = await fetch("/thumbnails?ids=" + movie_ids.join(","));
     const data = await res.json();
-    const img_url = data.primaryImage?.url;
-    if(img_url) {
-        card.querySelector("img").setAttribute("src", img_url);
+    for (const card of movie_cards) {
+        let img_url = data.urls[card.dataset.imdbId];
+        // thumbnails served by our own origin come in several sizes
+        if(img_url && img_url.startsWith("/thumb/") && card.dataset.thumbSize) {
+            img_url += "?size=" + card.dataset.thumbSize;
+        }
+        if(img_url) {
+            card.querySelector("img").setAttribute("src", img_url);
+        }
     }
+    return data.pending;
 }
 
 async function loadAllMovieCards() {
-    for (const card of movie_cards) {
-        await delayed_fetch(card);
-        await sleep(1); // avoid 429 error from the api by slowing requests
+    const movie_ids = [...new Set(Array.from(movie_cards, card => card.dataset.imdbId))];
+    if(movie_ids.length == 0) {
+        return;
+    }
+    const pending = await fetch_thumbnails(movie_ids);
+    if(pending.length > 0) {
+        // the server is still fetching some images from the api: asks once more for them
+        await sleep(3000);
+        await fetch_thumbnails(pending);
     }
 }
 
-loadAllMovieCards();
\ No newline at end of file
+loadAllMovieCards();
@@ -1,3 +1,1014 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, Client, SimpleTestCase, TransactionTestCase, override_settings
+from PIL import Image
+
+from config.sqlite_profiles import memory_database, sqlite_database
+
+from . import views
+from .middleware import DBTimingMiddleware
+from .services import cache, dataset, memory_db, slow_queries, sqlite_service, timing
+from .services.cache import DiskBackend, MemoryBackend, cached, clear_cache
+from .services.mongo_service import get_rd_movies_from_pool
+from .services.pagination import decode_cursor, encode_cursor, nearby_cursors
+from .services.counts import clear_counts, count_cap, normalize_filters, peek_count
+from .services.thumbnails import RateLimiter, get_fetcher, get_image_urls, get_thumbnail, resize_image, store_thumbnails
+
+class CacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def disk_backend(self, **kwargs) -> DiskBackend:
+        return DiskBackend(Path(self.tmp.name) / "cache.db", **kwargs)
+
+    def check_lru(self, backend):
+        backend.set("a", b"1", None)
+        backend.set("b", b"2", None)
+        self.assertEqual(backend.get("a"), b"1")
+        backend.set("c", b"3", None)
+        # b is the least recently used entry
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual((backend.get("a"), backend.get("c")), (b"1", b"3"))
+        self.assertEqual(backend.info()["entries"], 2)
+
+    def test_memory_lru(self):
+        self.check_lru(MemoryBackend(max_entries=2, max_bytes=100))
+
+    def test_disk_lru(self):
+        # access times are only one per entry and per second in the test
+        with mock.patch.object(cache.time, "time", side_effect=range(1, 100)):
+            self.check_lru(self.disk_backend(max_entries=2, max_bytes=100, access_interval=0))
+
+    def test_size_bound(self):
+        for backend in (MemoryBackend(10, 10), self.disk_backend(max_entries=10, max_bytes=10)):
+            backend.set("big", b"x" * 11, None)
+            self.assertIsNone(backend.get("big"))
+            for key in "abc":
+                backend.set(key, b"xxxx", None)
+            self.assertEqual(backend.info()["bytes"], 8)
+            self.assertIsNone(backend.get("a"))
+
+    def test_expiry(self):
+        for backend in (MemoryBackend(10, 100), self.disk_backend(max_entries=10, max_bytes=100)):
+            backend.set("a", b"1", 60)
+            self.assertEqual(backend.get("a"), b"1")
+            with mock.patch.object(cache.time, "time", return_value=time.time() + 61):
+                self.assertIsNone(backend.get("a"))
+
+    def test_disk_reads_dont_write(self):
+        backend = self.disk_backend(max_entries=10, max_bytes=100)
+        backend.set("a", b"1", None)
+        other = self.disk_backend(max_entries=10, max_bytes=100)
+        # another worker holding the write lock doesn't block the hits
+        other._conn.execute("BEGIN IMMEDIATE")
+        try:
+            for _ in range(3):
+                self.assertEqual(backend.get("a"), b"1")
+                backend.count("f", True)
+        finally:
+            other._conn.execute("ROLLBACK")
+
+        self.assertEqual(other.info()["functions"], {})
+        self.assertEqual(backend.info()["functions"], {"f": {"hits": 3, "misses": 0}})
+
+    def test_disk_counters_are_flushed(self):
+        backend = self.disk_backend(max_entries=10, max_bytes=100, flush_interval=0)
+        backend.count("f", True)
+        backend.count("f", False)
+        other = self.disk_backend(max_entries=10, max_bytes=100, flush_interval=0)
+        other.count("f", True)
+        self.assertEqual(other.info()["functions"], {"f": {"hits": 2, "misses": 1}})
+
+    def test_keys_follow_the_data_version(self):
+        calls = []
+
+        @cached()
+        def double(x):
+            calls.append(x)
+            return [x * 2]
+
+        backend = MemoryBackend(10, 1000)
+        with mock.patch.object(cache, "_backend", backend), \
+                mock.patch.object(cache, "get_data_version", return_value="v1") as version:
+            self.assertEqual(double(1), [2])
+            double(1)[0] = 0 # callers get their own copy
+            self.assertEqual(double(1), [2])
+            self.assertEqual(calls, [1])
+            self.assertEqual(double.cache_stats, {"hits": 2, "misses": 1})
+
+            version.return_value = "v2"
+            self.assertEqual(double(1), [2])
+            self.assertEqual(calls, [1, 1])
+
+    def test_counters_are_thread_safe(self):
+        @cached()
+        def identity(x):
+            return x
+
+        for backend in (MemoryBackend(10, 1000), self.disk_backend(max_entries=10, max_bytes=1000)):
+            with self.subTest(type(backend).__name__), mock.patch.object(cache, "_backend", backend), \
+                    mock.patch.object(cache, "get_data_version", return_value="v1"):
+                clear_cache()
+                def run():
+                    for i in range(500):
+                        identity(i % 5)
+                threads = [threading.Thread(target=run) for _ in range(8)]
+                switch = sys.getswitchinterval()
+                sys.setswitchinterval(1e-6)
+                try:
+                    for t in threads:
+                        t.start()
+                    for t in threads:
+                        t.join()
+                finally:
+                    sys.setswitchinterval(switch)
+                stats = identity.cache_stats
+                self.assertEqual(stats["hits"] + stats["misses"], 4000)
+                if isinstance(backend, DiskBackend):
+                    shared = backend.info()["functions"][identity.__module__ + "." + identity.__qualname__]
+                    self.assertEqual(shared, stats)
+
+class DatasetVersionTests(SimpleTestCase):
+    def test_sqlite_stamp(self):
+        # as written by the import scripts, without Django
+        conn = sqlite3.connect(":memory:")
+        self.addCleanup(conn.close)
+        first = dataset.store_data_version(conn)
+        self.assertEqual(dataset.store_data_version(conn, "v2"), "v2")
+        self.assertNotEqual(first, "v2")
+        self.assertEqual(conn.execute("SELECT id, version FROM dataset_version").fetchall(), [(1, "v2")])
+
+    def test_mongo_stamp(self):
+        db = {"dataset_version": mock.Mock()}
+        version = dataset.store_mongo_version(db)
+        (query, stamp), options = db["dataset_version"].replace_one.call_args
+        self.assertEqual((query, stamp["version"], options), ({"_id": 1}, version, {"upsert": True}))
+
+class SqliteProfileTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "imdb db.sqlite"
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("CREATE TABLE movies (movie_id VARCHAR(20) PRIMARY KEY)")
+            conn.execute("INSERT INTO movies VALUES ('tt001')")
+        conn.close()
+
+    def open(self, profile) -> DatabaseWrapper:
+        if profile == "memory":
+            conf = memory_database()
+        else:
+            conf = sqlite_database(self.path, profile, 1024 * 1024, 2 * 1024 * 1024)
+        db = DatabaseWrapper(connections.configure_settings({"default": conf})["default"], "test")
+        self.addCleanup(db.close)
+        return db
+
+    def test_profiles(self):
+        self.assertEqual(sqlite_database(self.path, None, 0, 0)["NAME"], self.path)
+        for profile in ("readonly", "immutable"):
+            with self.subTest(profile):
+                conf = sqlite_database(self.path, profile, 1024, 2048)
+                self.assertTrue(conf["NAME"].startswith("file:") and "mode=ro" in conf["NAME"])
+                self.assertEqual("immutable=1" in conf["NAME"], profile == "immutable")
+                self.assertIn("PRAGMA cache_size = -2;", conf["OPTIONS"]["init_command"])
+                self.assertIsNone(conf["CONN_MAX_AGE"])
+        with self.assertRaises(ValueError):
+            sqlite_database(self.path, "fast", 0, 0)
+
+    def test_read_only_connections(self):
+        for profile in ("readonly", "immutable"):
+            with self.subTest(profile), self.open(profile).cursor() as c:
+                self.assertEqual(c.execute("SELECT movie_id FROM movies").fetchall(), [("tt001",)])
+                self.assertEqual(c.execute("PRAGMA query_only").fetchone(), (1,))
+                self.assertEqual(c.execute("PRAGMA mmap_size").fetchone(), (1024 * 1024,))
+                with self.assertRaises(DatabaseError):
+                    c.execute("INSERT INTO movies VALUES ('tt002')")
+
+        with self.open(None).cursor() as c:
+            c.execute("INSERT INTO movies VALUES ('tt002')")
+            self.assertEqual(c.execute("PRAGMA query_only").fetchone(), (0,))
+
+    def test_memory_copy(self):
+        with override_settings(IMDB_DB_PATH=self.path, SQLITE_MEMORY_MIN_FREE=0):
+            keeper = memory_db._copy_to_memory()
+        self.assertIsNotNone(keeper)
+        self.addCleanup(keeper.close)
+
+        # the copy is seen by the other connections of the process, read-only
+        with self.open("memory").cursor() as c:
+            self.assertEqual(c.execute("SELECT movie_id FROM movies").fetchall(), [("tt001",)])
+            with self.assertRaises(DatabaseError):
+                c.execute("INSERT INTO movies VALUES ('tt002')")
+
+    def test_memory_copy_needs_free_memory(self):
+        with override_settings(IMDB_DB_PATH=self.path, SQLITE_MEMORY_MIN_FREE=1024 ** 3), \
+                mock.patch.object(memory_db, "_available_memory", return_value=1024 ** 3), \
+                self.assertLogs("movies.services.memory_db", "WARNING"):
+            self.assertIsNone(memory_db._copy_to_memory())
+
+#----------Test dataset----------
+
+GENRES = ["Drama", "Comedy", "Action"]
+PERSONS = {"nm1": "Brad Pitt", "nm2": "Bradley Cooper", "nm3": "Brad Garrett", "nm4": "Penélope Cruz"}
+# movies of each person, Bradley Cooper has the most
+PERSON_MOVIES = {"nm1": [1, 2], "nm2": list(range(3, 11)), "nm3": [11], "nm4": [12]}
+TITLES = {44: "The Matrix Reloaded", 45: "The Matrix"}
+MOVIE_COUNT = 45
+
+TABLES = [
+    "genres", "movies", "titles", "movie_titles", "ratings", "movie_genres", "persons", "principals",
+    "cast", "professions", "person_profession", "title_search", "person_search", "person_trigrams",
+    "movie_summary", "random_pool", "stats_snapshot", "dataset_version",
+]
+
+def movie_id(i: int) -> str:
+    return f"tt{i:03}"
+
+def movie_genres(i: int) -> list:
+    """
+    Drama for the even movies, Comedy for the multiples of 3, Action for the multiples of 7.
+    """
+    return [g for g, n in zip(GENRES, (2, 3, 7)) if i % n == 0]
+
+def create_dataset() -> None:
+    """
+    Builds a small imdb.db in the test database, with the columns read by movies.services:
+    MOVIE_COUNT movies "Movie 001"... (except TITLES), of year 1990 + i % 10, rated i % 10 + 0.5,
+    and the title_search and person_search indexes of scripts/phase1_sqlite/search_index.py.
+    """
+    with connection.cursor() as c:
+        for table in TABLES:
+            c.execute(f"DROP TABLE IF EXISTS {table}")
+        c.execute("CREATE TABLE genres (genre_id INTEGER PRIMARY KEY, genre_name VARCHAR(50) COLLATE NOCASE)")
+        c.execute("CREATE TABLE movies (movie_id VARCHAR(20) PRIMARY KEY, year INTEGER, runtime_minutes INTEGER)")
+        c.execute("CREATE TABLE titles (title_id INTEGER PRIMARY KEY, title_name VARCHAR(200) COLLATE NOCASE)")
+        c.execute("CREATE TABLE movie_titles (movie_id VARCHAR(20), title_id INTEGER, is_primary BOOLEAN, is_original BOOLEAN)")
+        c.execute("CREATE TABLE ratings (movie_id VARCHAR(20) PRIMARY KEY, average_rating REAL, num_votes INTEGER)")
+        c.execute("CREATE TABLE movie_genres (movie_id VARCHAR(20), genre_id INTEGER)")
+        c.execute("CREATE TABLE persons (person_id VARCHAR(20) PRIMARY KEY, name VARCHAR(100))")
+        c.execute("CREATE TABLE principals (movie_id VARCHAR(20), ordering INTEGER, person_id VARCHAR(20))")
+        c.execute("CREATE TABLE cast (movie_id VARCHAR(20), person_id VARCHAR(20), character_id INTEGER)")
+        c.execute("CREATE TABLE professions (profession_id INTEGER PRIMARY KEY, job_name VARCHAR(100))")
+        c.execute("CREATE TABLE person_profession (person_id VARCHAR(20), profession_id INTEGER)")
+
+        c.executemany("INSERT INTO genres VALUES (?, ?)", list(enumerate(GENRES, 1)))
+        for i in range(1, MOVIE_COUNT + 1):
+            c.execute("INSERT INTO movies VALUES (?, ?, 100)", (movie_id(i), 1990 + i % 10))
+            c.execute("INSERT INTO titles VALUES (?, ?)", (i, TITLES.get(i, f"Movie {i:03}")))
+            c.execute("INSERT INTO movie_titles VALUES (?, ?, TRUE, TRUE)", (movie_id(i), i))
+            c.execute("INSERT INTO ratings VALUES (?, ?, ?)", (movie_id(i), i % 10 + 0.5, i * 100))
+            c.executemany(
+                "INSERT INTO movie_genres VALUES (?, ?)",
+                [(movie_id(i), GENRES.index(g) + 1) for g in movie_genres(i)]
+            )
+
+        c.executemany("INSERT INTO persons VALUES (?, ?)", PERSONS.items())
+        for person_id, movies in PERSON_MOVIES.items():
+            c.executemany("INSERT INTO principals VALUES (?, 1, ?)", [(movie_id(i), person_id) for i in movies])
+            c.executemany("INSERT INTO cast VALUES (?, ?, 1)", [(movie_id(i), person_id) for i in movies])
+
+        c.execute("CREATE VIRTUAL TABLE title_search USING fts5(movie_id UNINDEXED, title_name, tokenize = 'trigram')")
+        c.execute("INSERT INTO title_search SELECT mt.movie_id, t.title_name FROM movie_titles mt JOIN titles t USING (title_id)")
+
+        c.execute("CREATE TABLE person_search (person_id VARCHAR(20) PRIMARY KEY, trigram_count INTEGER, film_count INTEGER)")
+        c.execute("CREATE TABLE person_trigrams (trigram CHAR(3), person_id VARCHAR(20), PRIMARY KEY (trigram, person_id))")
+        for person_id, name in PERSONS.items():
+            trigrams = sqlite_service.name_trigrams(name)
+            c.execute(
+                "INSERT INTO person_search VALUES (?, ?, ?)",
+                (person_id, len(trigrams), len(PERSON_MOVIES[person_id]))
+            )
+            c.executemany("INSERT INTO person_trigrams VALUES (?, ?)", [(t, person_id) for t in trigrams])
+
+def reset_caches() -> None:
+    """
+    Drops every result derived from the dataset: the test database changes without
+    changing the signature of settings.IMDB_DB_PATH.
+    """
+    clear_cache()
+    clear_counts()
+    dataset._read_data_version.cache_clear()
+    sqlite_service._table_exists.cache_clear()
+    sqlite_service._random_pool_size.cache_clear()
+    sqlite_service._read_stats_snapshot.cache_clear()
+
+class DatasetTestCase(TransactionTestCase):
+    """
+    Tests running on the dataset of create_dataset. Not wrapped in a transaction: the async
+    views and the 'writer' connection query the test database from other connections.
+    """
+    databases = {"default", "writer"}
+
+    def setUp(self):
+        create_dataset()
+        reset_caches()
+        self.addCleanup(reset_caches)
+
+    def new_version(self) -> str:
+        version = dataset.write_data_version()
+        reset_caches()
+        return version
+
+ALL_MOVIES = [[], 0, 9000, 0, "any"]
+
+@contextmanager
+def recorded_queries():
+    """
+    Records the SQL of the queries run on the default connection.
+    """
+    queries = []
+    def record(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(record):
+        yield queries
+
+class CountTests(DatasetTestCase):
+    def test_exact_counts_are_memoized(self):
+        self.assertEqual(sqlite_service.get_film_list_size(ALL_MOVIES), MOVIE_COUNT)
+        with recorded_queries() as queries:
+            # same filters, written another way
+            self.assertEqual(sqlite_service.get_film_list_size([[], "0", 9000, 0.0, "all"]), MOVIE_COUNT)
+        self.assertEqual(queries, [])
+
+        self.new_version()
+        with recorded_queries() as queries:
+            sqlite_service.get_film_list_size(ALL_MOVIES)
+        self.assertEqual(len([q for q in queries if "COUNT(*)" in q]), 1)
+
+    def test_capped_counts(self):
+        self.assertEqual(sqlite_service.get_film_list_size(ALL_MOVIES, cap=10), 11)
+        self.assertEqual(sqlite_service.get_list_from_title_size("movie", cap=10), 11)
+        self.assertEqual(sqlite_service.get_list_from_person_size("cooper", cap=5), 6)
+        with override_settings(RESULT_COUNT_MODE="capped", RESULT_COUNT_CAP=1000):
+            # enough for the page navigation after the current page
+            self.assertEqual(count_cap(1), 1000)
+            self.assertEqual(count_cap(60), 2000)
+        self.assertIsNone(count_cap(60))
+
+    def test_inline_counts(self):
+        rows, total = sqlite_service.get_film_list(1, ALL_MOVIES, "title", "ASC", with_count=True)
+        self.assertEqual((len(rows), total), (20, MOVIE_COUNT))
+        self.assertEqual(peek_count("film_list", (normalize_filters(ALL_MOVIES), None)), MOVIE_COUNT)
+        # past the last page, the total comes from a count query
+        self.assertEqual(sqlite_service.get_film_list(9, ALL_MOVIES, "year", "ASC", with_count=True), ([], MOVIE_COUNT))
+
+        rows, total = sqlite_service.search_movies_from_title("movie", 3, with_count=True)
+        self.assertEqual((len(rows), total), (3, MOVIE_COUNT - len(TITLES)))
+        self.assertEqual(sqlite_service.search_movies_from_person("cooper", 1, with_count=True)[1], 8)
+
+    def test_count_modes_of_the_pages(self):
+        for mode in ("exact", "capped", "inline"):
+            with self.subTest(mode), override_settings(RESULT_COUNT_MODE=mode):
+                reset_caches()
+                res = self.client.get("/movies", {"page": 2})
+                self.assertEqual((res.context["page_count"], res.context["count_capped"]), (3, False))
+                res = self.client.get("/search", {"q": "movie", "page": 2})
+                self.assertEqual(res.context["page_count"], 3)
+                self.assertEqual(len(res.context["films"]), 20)
+
+class StatsSnapshotTests(DatasetTestCase):
+    def stats(self) -> dict:
+        return {
+            "basic_stats":      sqlite_service.get_basic_stats(),
+            "movies_by_genre":  sqlite_service.get_movies_count_by_genre(),
+            "movies_by_decade": sqlite_service.get_movies_count_by_decade(),
+            "ratings":          sqlite_service.get_ratings_distribution(1),
+            "prolific_actors":  sqlite_service.get_top_N_prolific_actors(3),
+        }
+
+    def test_snapshot(self):
+        queried = self.stats()
+        self.assertEqual(queried["prolific_actors"][0], {"movies_played": 8, "actor": "Bradley Cooper"})
+        self.assertEqual(queried["basic_stats"]["movieCnt"], MOVIE_COUNT)
+
+        sqlite_service.refresh_stats_snapshot()
+        reset_caches()
+        with recorded_queries() as queries:
+            self.assertEqual(self.stats(), queried)
+        # a single read of the snapshot
+        self.assertEqual([q for q in queries if "stats_snapshot" in q and "sqlite_master" not in q],
+                         ["SELECT name, value FROM stats_snapshot"])
+
+        # more actors than kept in the snapshot
+        with recorded_queries() as queries:
+            self.assertEqual(len(sqlite_service.get_top_N_prolific_actors(sqlite_service.SNAPSHOT_PROLIFIC_ACTORS + 1)), 4)
+        self.assertEqual(len(queries), 1)
+
+    def test_refresh_stats_command(self):
+        version = dataset.get_data_version()
+        call_command("refresh_stats", stdout=io.StringIO())
+        reset_caches()
+        self.assertNotEqual(dataset.get_data_version(), version)
+        for table in ("stats_snapshot", "random_pool", "movie_summary"):
+            self.assertTrue(sqlite_service.table_exists(table))
+        self.assertEqual(sqlite_service.get_movies_count_by_decade(), sqlite_service._query_movies_count_by_decade())
+
+class RandomMoviesTests(DatasetTestCase):
+    def check_random_movies(self):
+        movies = sqlite_service.get_random_movies(10)
+        self.assertEqual(len({m["mid"] for m in movies}), 10)
+        self.assertLessEqual({m["mid"] for m in movies}, {movie_id(i) for i in range(1, MOVIE_COUNT + 1)})
+
+        # 100 votes per movie number: only the last 6 movies have 4000 votes
+        movies = sqlite_service.get_random_movies(10, 4000)
+        self.assertCountEqual([m["mid"] for m in movies], [movie_id(i) for i in range(40, 46)])
+        self.assertEqual(sqlite_service.get_random_movies(10, 10 ** 6), [])
+
+    def test_without_pool(self):
+        self.check_random_movies()
+
+    def test_random_pool(self):
+        self.assertEqual(sqlite_service.refresh_random_pool(), MOVIE_COUNT)
+        reset_caches()
+        with connection.cursor() as c:
+            pool = c.execute("SELECT pool_id, num_votes FROM random_pool ORDER BY pool_id").fetchall()
+        self.assertEqual(pool, [(i, (MOVIE_COUNT + 1 - i) * 100) for i in range(1, MOVIE_COUNT + 1)])
+
+        with recorded_queries() as queries:
+            self.check_random_movies()
+        self.assertFalse([q for q in queries if "RANDOM()" in q])
+
+SORTS = [(sort, order) for sort in ("title", "year", "note") for order in ("ASC", "DESC")]
+FILTERS = [ALL_MOVIES, [["Drama"], 1992, 1997, 3, "any"], [["drama", "Comedy"], 0, 9000, 0, "all"]]
+
+class MovieSummaryTests(DatasetTestCase):
+    def pages(self, filters: list, sort: str, order: str) -> list:
+        return [sqlite_service.get_film_list(page, filters, sort, order) for page in range(1, 4)]
+
+    def test_same_pages_as_the_joins(self):
+        joined = {(i, sort, order): self.pages(f, sort, order) for i, f in enumerate(FILTERS) for sort, order in SORTS}
+        self.assertEqual(sqlite_service.refresh_movie_summary(), MOVIE_COUNT)
+        reset_caches()
+        for (i, sort, order), pages in joined.items():
+            with self.subTest(filters=FILTERS[i], sort=sort, order=order):
+                self.assertEqual(self.pages(FILTERS[i], sort, order), pages)
+
+    def test_sorts_read_an_index(self):
+        sqlite_service.refresh_movie_summary()
+        reset_caches()
+        for sort, order in SORTS:
+            queries = []
+            def record(execute, sql, params, many, context):
+                queries.append((sql, params))
+                return execute(sql, params, many, context)
+            with connection.execute_wrapper(record):
+                sqlite_service.get_film_list(1, FILTERS[1], sort, order)
+
+            sql, params = next((sql, params) for sql, params in queries if "movie_summary" in sql)
+            with connection.cursor() as c:
+                plan = " ".join(r[-1] for r in c.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall())
+            with self.subTest(sort=sort, order=order):
+                # the 20 rows are read in index order instead of sorting every match
+                self.assertIn("idx_ms_" + sort, plan)
+                self.assertNotIn("TEMP B-TREE", plan)
+
+class KeysetPaginationTests(DatasetTestCase):
+    def test_cursor_round_trip(self):
+        row = {"mid": "tt007", "title": "Movie 7", "year": 1997, "note": 7.5}
+        for sort in ("title", "year", "note"):
+            self.assertEqual(decode_cursor(encode_cursor(3, sort, row), sort), (3, row[sort], "tt007"))
+        self.assertIsNone(decode_cursor(encode_cursor(3, "year", row), "title"))
+        self.assertIsNone(decode_cursor(encode_cursor(0, "year", row), "year"))
+        for token in ("", "not a token", "e30", "WzEsMl0"):
+            self.assertIsNone(decode_cursor(token, "year"))
+        # values SQLite cannot bind
+        for value, mid in [([1997], "tt007"), ({"a": 1}, "tt007"), (1997, ["tt007"]), (1997, None)]:
+            token = encode_cursor(3, "year", {"year": value, "mid": mid})
+            self.assertIsNone(decode_cursor(token, "year"))
+            res = self.client.get("/movies", {"sort": "year", "after": token})
+            self.assertEqual(res.status_code, 200)
+
+    def test_same_pages_as_offset(self):
+        for sort, order in SORTS:
+            offset_pages = [sqlite_service.get_film_list(page, ALL_MOVIES, sort, order) for page in range(1, 4)]
+            pages = [offset_pages[0]]
+            for page in range(2, 4):
+                last = pages[-1][-1]
+                pages.append(sqlite_service.get_film_list(page, ALL_MOVIES, sort, order, ("after", last[sort], last["mid"])))
+            for page in range(2, 0, -1):
+                first = pages[page][0]
+                pages[page - 1] = sqlite_service.get_film_list(page, ALL_MOVIES, sort, order, ("before", first[sort], first["mid"]))
+            # several pages in one seek
+            last, first = offset_pages[0][-1], offset_pages[2][0]
+            after = sqlite_service.get_film_list(2, ALL_MOVIES, sort, order, ("after", last[sort], last["mid"]), pages=2)
+            before = sqlite_service.get_film_list(2, ALL_MOVIES, sort, order, ("before", first[sort], first["mid"]), pages=2)
+            with self.subTest(sort=sort, order=order):
+                self.assertEqual(pages, offset_pages)
+                self.assertEqual(after, offset_pages[1] + offset_pages[2])
+                self.assertEqual(before, offset_pages[0] + offset_pages[1])
+
+    def test_page_links_seek(self):
+        for sort, order in SORTS:
+            query = {"sort": sort, "order": order}
+            res = self.client.get("/movies", query)
+            links = dict(res.context["page_links"])
+            self.assertEqual(list(links), [1, 2, 3])
+            self.assertEqual(links[1], "page=1")
+            for page in (2, 3):
+                with self.subTest(sort=sort, order=order, page=page):
+                    self.assertTrue(links[page].startswith("after="))
+                    res = self.client.get("/movies?" + res.context["base_qs"] + "&" + links[page])
+                    self.assertEqual(res.context["page_num"], page)
+                    self.assertEqual(res.context["films"], sqlite_service.get_film_list(page, ALL_MOVIES, sort, order))
+
+            # and back from the last page
+            back = dict(res.context["page_links"])
+            self.assertTrue(back[1].startswith("before="))
+            res = self.client.get("/movies?" + res.context["base_qs"] + "&" + back[1])
+            self.assertEqual(res.context["films"], sqlite_service.get_film_list(1, ALL_MOVIES, sort, order))
+
+    def test_nearby_cursors_read_each_direction_once(self):
+        movies = [{"mid": movie_id(i), "year": 1990 + i // 3} for i in range(200)]
+        calls = []
+        def fetch(cursor, count):
+            calls.append((cursor[0], count))
+            start = next(i for i, m in enumerate(movies) if m["mid"] == cursor[2])
+            return movies[start + 1:start + 1 + 20 * count] if cursor[0] == "after" else movies[max(0, start - 20 * count):start]
+
+        cursors = nearby_cursors(5, range(2, 10), "year", movies[80:100], fetch)
+        self.assertEqual(sorted(calls), [("after", 3), ("before", 2)])
+        self.assertEqual(sorted(cursors), [2, 3, 4, 6, 7, 8, 9])
+        for page, (direction, token) in cursors.items():
+            _, year, mid = decode_cursor(token, "year")
+            # the movie next to the page, on the side it is read from
+            row = movies[(page - 1) * 20 - 1] if direction == "after" else movies[page * 20]
+            self.assertEqual((year, mid), (row["year"], row["mid"]))
+
+        # past the last movie there are no pages to point at
+        self.assertEqual(sorted(nearby_cursors(9, range(6, 13), "year", movies[160:180], fetch)), [6, 7, 8, 10, 11])
+
+    def test_no_last_page_jump(self):
+        # the search pages keep their page numbers and the jump to the last one
+        with mock.patch.object(views, "get_film_list_size", return_value=1000), \
+             mock.patch.object(views, "get_list_from_title_size", return_value=1000):
+            res = self.client.get("/movies", {"page": 1})
+            self.assertEqual(res.context["page_count"], 50)
+            self.assertNotContains(res, "page=50")
+            res = self.client.get("/search", {"q": "movie", "page": 1})
+            self.assertContains(res, "page=50")
+        self.assertEqual(res.context["page_links"], [(i, f"page={i}") for i in range(1, 6)])
+
+class GenreFilterTests(DatasetTestCase):
+    def movies(self, genres: list, mode: str) -> list:
+        filters = [genres, 0, 9000, 0, mode]
+        res = []
+        for page in range(1, 4):
+            res += [m["mid"] for m in sqlite_service.get_film_list(page, filters, "year", "ASC")]
+        self.assertEqual(len(res), sqlite_service.get_film_list_size(filters))
+        return sorted(res)
+
+    def expected(self, keep) -> list:
+        return [movie_id(i) for i in range(1, MOVIE_COUNT + 1) if keep(set(movie_genres(i)))]
+
+    def check_filters(self):
+        self.assertEqual(self.movies(["Drama", "comedy"], "any"), self.expected(lambda g: g & {"Drama", "Comedy"}))
+        self.assertEqual(self.movies(["Drama", "comedy"], "all"), self.expected(lambda g: {"Drama", "Comedy"} <= g))
+        self.assertEqual(self.movies(["Action"], "all"), self.expected(lambda g: "Action" in g))
+        # an unknown genre matches nothing, and can't be part of all the genres of a movie
+        self.assertEqual(self.movies(["Western"], "any"), [])
+        self.assertEqual(self.movies(["Drama", "Western"], "any"), self.expected(lambda g: "Drama" in g))
+        self.assertEqual(self.movies(["Drama", "Western"], "all"), [])
+
+    def test_genre_ids(self):
+        self.assertFalse(sqlite_service.table_exists("movie_summary"))
+        self.check_filters()
+
+    def test_genre_mask(self):
+        sqlite_service.refresh_movie_summary()
+        reset_caches()
+        self.assertTrue(sqlite_service.table_exists("movie_summary"))
+        self.check_filters()
+
+    def test_wrong_genre_mode(self):
+        with self.assertRaises(ValueError):
+            sqlite_service.get_film_list(1, [["Drama"], 0, 9000, 0, "xx"], "year", "ASC")
+
+        res = self.client.get("/movies", {"genre": "Drama", "genre_mode": "xx"})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.context["genre_mode"], "any")
+
+class TitleSearchTests(DatasetTestCase):
+    def search(self, title: str, page: int = 1) -> list:
+        return [m["mid"] for m in sqlite_service.search_movies_from_title(title, page)]
+
+    def test_ranking(self):
+        # the shorter title is the closer bm25 match
+        self.assertEqual(self.search("matrix"), ["tt045", "tt044"])
+        self.assertEqual(self.search("ATRIX rel"), ["tt044"])
+        self.assertEqual(sqlite_service.get_list_from_title_size("matrix"), 2)
+
+    def test_substrings(self):
+        self.assertEqual(self.search("ie 01"), [movie_id(i) for i in range(19, 9, -1)])
+        self.assertEqual(self.search('"matrix'), [])
+        # best matches first, then the most voted movies
+        self.assertEqual(self.search("movie", 3), [movie_id(i) for i in (3, 2, 1)])
+
+    def test_without_index(self):
+        with connection.cursor() as c:
+            c.execute("DROP TABLE title_search")
+        reset_caches()
+        # sorted by title
+        self.assertEqual(self.search("matrix"), ["tt045", "tt044"])
+        self.assertEqual(self.search("ie 01"), [movie_id(i) for i in range(10, 20)])
+        # too short for a trigram, read with LIKE even with the index
+        create_dataset()
+        reset_caches()
+        self.assertEqual(self.search("x"), ["tt045", "tt044"])
+
+class PersonSearchTests(DatasetTestCase):
+    def search(self, name: str) -> list:
+        return [m["mid"] for m in sqlite_service.search_movies_from_person(name, 1)]
+
+    def test_typos_and_accents(self):
+        self.assertEqual(self.search("brad pit"), ["tt001", "tt002"])
+        self.assertEqual(self.search("penelope cruz"), ["tt012"])
+        self.assertEqual(sqlite_service.get_list_from_person_size("brad pit"), 2)
+
+    def test_partial_name(self):
+        # Brad Pitt is closer than Brad Garrett, the longer name of Bradley Cooper is too far
+        self.assertEqual(self.search("brad"), ["tt001", "tt002", "tt011"])
+        self.assertEqual(self.search("cooper"), [movie_id(i) for i in PERSON_MOVIES["nm2"]])
+
+    @override_settings(PERSON_SEARCH_THRESHOLD=0.3)
+    def test_threshold(self):
+        # Bradley Cooper shares 4 of the 9 trigrams of "brad pit": 2 * 4 / (9 + 15) = 0.33
+        self.assertEqual(self.search("brad pit")[:2], ["tt001", "tt002"])
+        self.assertCountEqual(self.search("brad pit")[2:], ["tt011", *(movie_id(i) for i in PERSON_MOVIES["nm2"])])
+
+def movie_document(**fields) -> dict:
+    return {"_id": "tt001", "title": "Movie 001", "genres": ["Drama"], "directors": [{"person_id": "nm1", "name": "Brad Pitt"}], **fields}
+
+def slow_sample(movies: list):
+    """
+    Stand-in of a MongoDB $sample query taking 0.2 second.
+    """
+    async def sample(*args):
+        await asyncio.sleep(0.2)
+        return movies
+    return sample
+
+class RecommendationPoolTests(SimpleTestCase):
+    pool = {"directors": [{"mid": f"tt1{i:02}", "title": f"By Brad {i}"} for i in range(30)], "genres": []}
+
+    def setUp(self):
+        patcher = mock.patch("movies.conditional.get_mongo_version", return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sampled_from_the_pool(self):
+        movie = movie_document(rec_pool=self.pool)
+        sample = get_rd_movies_from_pool(movie, "directors", 10)
+        self.assertEqual(len({m["mid"] for m in sample}), 10)
+        self.assertTrue(all(m in self.pool["directors"] for m in sample))
+        self.assertEqual(get_rd_movies_from_pool(movie, "genres", 10), [])
+        # documents migrated before the pools
+        self.assertIsNone(get_rd_movies_from_pool(movie_document(), "genres", 10))
+
+    def test_detail_page(self):
+        with mock.patch.object(views, "get_movie_complete", return_value=movie_document(rec_pool=self.pool)), \
+                mock.patch.object(views, "get_rd_movies_from_directors") as directors, \
+                mock.patch.object(views, "get_rd_movies_from_genres") as genres:
+            res = self.client.get("/movies/tt001")
+        self.assertContains(res, "By Brad")
+        directors.assert_not_called()
+        genres.assert_not_called()
+        self.assertNotIn("rec_pool", res.context)
+
+class AsyncViewsTests(DatasetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = AsyncRequestFactory()
+        patcher = mock.patch("movies.conditional.get_mongo_version", return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_recommendations_are_sampled_concurrently(self):
+        directors = mock.AsyncMock(side_effect=slow_sample([{"mid": "tt002", "title": "By Brad"}]))
+        genres = mock.AsyncMock(side_effect=slow_sample([{"mid": "tt004", "title": "Also Drama"}]))
+        with mock.patch.object(views, "aget_movie_complete", mock.AsyncMock(return_value=movie_document())), \
+                mock.patch.object(views, "aget_rd_movies_from_directors", directors), \
+                mock.patch.object(views, "aget_rd_movies_from_genres", genres):
+            start = time.monotonic()
+            res = async_to_sync(views.movie_complete_view_async)(self.factory.get("/movies/tt001"), "tt001")
+            elapsed = time.monotonic() - start
+
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, "By Brad")
+        self.assertContains(res, "Also Drama")
+        directors.assert_awaited_once_with(["nm1"], 10, "tt001")
+        genres.assert_awaited_once_with(["Drama"], 10, "tt001")
+        self.assertLess(elapsed, 0.35)
+
+    def test_movie_not_found(self):
+        with mock.patch.object(views, "aget_movie_complete", mock.AsyncMock(return_value=None)):
+            res = async_to_sync(views.movie_complete_view_async)(self.factory.get("/movies/tt999"), "tt999")
+        self.assertContains(res, "tt999")
+
+    def test_home_and_stats(self):
+        res = async_to_sync(views.home_view_async)(self.factory.get("/"))
+        self.assertEqual(res.status_code, 200)
+        res = async_to_sync(views.stats_view_async)(self.factory.get("/stats"))
+        self.assertContains(res, "Bradley Cooper")
+
+class TimingTests(DatasetTestCase):
+    @override_settings(DB_TIMING=True)
+    def test_server_timing(self):
+        # the hooks are installed at startup when DB_TIMING is set
+        with connection.execute_wrapper(timing.sqlite_wrapper), self.assertLogs("movies.timing", "INFO") as logs:
+            res = Client().get("/movies", {"sort": "year"})
+
+        self.assertRegex(res["Server-Timing"], r'^sqlite;dur=[\d.]+;desc="\d+ queries, \d+ rows", total;dur=[\d.]+$')
+
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual((entry["path"], entry["status"]), ("/movies?sort=year", 200))
+        # the 20 movies of the page at least
+        self.assertGreaterEqual(entry["db"]["sqlite"]["rows"], 20)
+
+    def test_disabled(self):
+        self.assertNotIn("Server-Timing", self.client.get("/movies"))
+
+    @override_settings(DB_TIMING=True)
+    def test_async_views(self):
+        def query():
+            timing.record("sqlite", "SELECT 1", 2.0, 1)
+
+        async def view(request):
+            # queries run in worker threads, like those of _in_pool
+            await asyncio.gather(*[sync_to_async(query, thread_sensitive=False)() for _ in range(3)])
+            return HttpResponse()
+
+        middleware = DBTimingMiddleware(view)
+        # awaited by the async handler instead of being wrapped in async_to_sync
+        self.assertTrue(iscoroutinefunction(middleware))
+        with self.assertLogs("movies.timing", "INFO"):
+            res = async_to_sync(middleware)(AsyncRequestFactory().get("/stats"))
+        self.assertRegex(res["Server-Timing"], r'^sqlite;dur=6\.0;desc="3 queries, 3 rows", total;dur=[\d.]+$')
+
+    def test_rows_are_counted_as_they_are_read(self):
+        token = timing.start_request()
+        with connection.execute_wrapper(timing.sqlite_wrapper), connection.cursor() as c:
+            self.assertEqual(c.execute("SELECT movie_id FROM movies").fetchone(), ("tt001",))
+            self.assertEqual(len(c.execute("SELECT movie_id FROM movies WHERE year = 1990").fetchall()), 4)
+        queries = timing.end_request(token)
+        self.assertEqual([q["rows"] for q in queries], [1, 4])
+        self.assertEqual(timing.summarize(queries)["sqlite"]["queries"], 2)
+
+class SlowQueryLogTests(DatasetTestCase):
+    def slow_queries(self, run) -> list:
+        with connection.execute_wrapper(timing.sqlite_wrapper), \
+                self.assertLogs("movies.slow_queries", "WARNING") as logs:
+            run()
+        return [json.loads(r.getMessage()) for r in logs.records]
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_plan_and_params(self):
+        entries = self.slow_queries(lambda: sqlite_service.get_film_list(1, FILTERS[1], "year", "ASC"))
+        entry = next(e for e in entries if "ORDER BY" in e["query"])
+        self.assertEqual(entry["backend"], "sqlite")
+        # even movies of 1994 and 1996
+        self.assertEqual(entry["rows"], 9)
+        # the filters and the offset
+        self.assertEqual(entry["params"][:3], [1992, 1997, 3])
+        self.assertTrue(any("movies" in step["detail"] for step in entry["plan"]))
+
+    @override_settings(SLOW_QUERY_MS=60_000)
+    def test_threshold(self):
+        with connection.execute_wrapper(timing.sqlite_wrapper), \
+                mock.patch.object(slow_queries, "_write") as write:
+            sqlite_service.get_film_list(1, FILTERS[1], "year", "ASC")
+        write.assert_not_called()
+        self.assertTrue(slow_queries.is_slow(60_000))
+        with override_settings(SLOW_QUERY_MS=None):
+            self.assertFalse(slow_queries.is_slow(60_000))
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_mongo_cursor_continuations(self):
+        entries = self.slow_queries(lambda: slow_queries.log_mongo("getMore", {"getMore": 1, "lsid": {}}, 12.3, 101))
+        self.assertEqual(entries, [{"backend": "mongo", "ms": 12.3, "rows": 101, "query": "getMore",
+                                    "params": {"getMore": 1}, "plan": None}])
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_mongo_explain_off_the_caller(self):
+        explained = threading.Event()
+        db = mock.Mock()
+        db.command.side_effect = lambda command: explained.wait(5) and {"queryPlanner": {"winningPlan": "IXSCAN"}}
+        with mock.patch("movies.services.mongo_service._db", db), \
+                self.assertLogs("movies.slow_queries", "WARNING") as logs:
+            # returns while the explain is still waiting
+            slow_queries.log_mongo("find", {"find": "movies", "filter": {"genres": "Drama"}, "lsid": {}}, 54.0, 3)
+            self.assertEqual(logs.records, [])
+            explained.set()
+            slow_queries._explain_pool.submit(lambda: None).result()
+
+        db.command.assert_called_once_with(
+            {"explain": {"find": "movies", "filter": {"genres": "Drama"}}, "verbosity": "queryPlanner"}
+        )
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual((entry["query"], entry["plan"]), ("find", {"queryPlanner": {"winningPlan": "IXSCAN"}}))
+
+class ConditionalTests(DatasetTestCase):
+    def test_not_modified(self):
+        self.new_version()
+        res = self.client.get("/stats")
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("Last-Modified", res)
+
+        res = self.client.get("/stats", HTTP_IF_NONE_MATCH=res["ETag"])
+        self.assertEqual(res.status_code, 304)
+
+    def test_etag_follows_the_version_and_the_query(self):
+        self.new_version()
+        etag = self.client.get("/movies", {"sort": "year", "genre": ""})["ETag"]
+        # same query: empty parameters are dropped and the others sorted
+        self.assertEqual(self.client.get("/movies?genre=&sort=year")["ETag"], etag)
+        self.assertNotEqual(self.client.get("/movies", {"sort": "note"})["ETag"], etag)
+
+        self.new_version()
+        res = self.client.get("/movies", {"sort": "year"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res["ETag"], etag)
+
+    def test_async_views(self):
+        # the ETag reads imdb.db, which Django forbids on the event loop
+        self.new_version()
+        factory = AsyncRequestFactory()
+        res = async_to_sync(views.stats_view_async)(factory.get("/stats"))
+        self.assertEqual(res.status_code, 200)
+
+        request = factory.get("/stats", headers={"If-None-Match": res["ETag"]})
+        self.assertEqual(async_to_sync(views.stats_view_async)(request).status_code, 304)
+
+
+class FakeImageApi(BaseHTTPRequestHandler):
+    """
+    Local stand-in for the image API: tt1 has an image, tt2 has none, tt3 is unknown (404),
+    tt4 and tt5 get an answer that is not JSON.
+    Records the requested ids and the highest number of requests served at once.
+    """
+    images = {"tt1": {"primaryImage": {"url": "http://images.test/tt1.jpg"}}, "tt2": {}}
+    lock = threading.Lock()
+    requested = []
+    in_flight = 0
+    max_in_flight = 0
+
+    def do_GET(self):
+        movie_id = self.path.rsplit("/", 1)[-1]
+        cls = type(self)
+        with cls.lock:
+            cls.requested.append(movie_id)
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        time.sleep(0.05)
+        with cls.lock:
+            cls.in_flight -= 1
+
+        if movie_id in ("tt4", "tt5"):
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(b"<html>maintenance</html>")
+        elif movie_id in self.images:
+            body = json.dumps(self.images[movie_id]).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+class ThumbnailsTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeImageApi)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        FakeImageApi.requested = []
+        FakeImageApi.max_in_flight = 0
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.conf = {
+            "API_URL": f"http://127.0.0.1:{self.server.server_port}/titles/",
+            "PATH": Path(self.tmp.name) / "thumbnails.db",
+            "STORAGE": Path(self.tmp.name) / "thumbs",
+            "SIZES": {"card": (20, 30), "detail": (40, 60)},
+            "CONCURRENCY": 2,
+            "RATE": 200,
+            "TIMEOUT": 5,
+            "WAIT": 5,
+            "MISSING_TTL": 3600,
+            "MAX_BATCH": 100,
+        }
+        overrider = override_settings(THUMBNAILS=self.conf)
+        overrider.enable()
+        self.addCleanup(overrider.disable)
+
+    def test_batch_endpoint(self):
+        res = self.client.get("/thumbnails", {"ids": "tt1,tt2,tt3,bad,tt1"})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {
+            "urls": {"tt1": "http://images.test/tt1.jpg", "tt2": None, "tt3": None},
+            "pending": [],
+        })
+        self.assertCountEqual(FakeImageApi.requested, ["tt1", "tt2", "tt3"])
+
+    def test_urls_are_served_from_the_store(self):
+        get_image_urls(["tt1", "tt2"], wait=5)
+        FakeImageApi.requested = []
+
+        urls, pending = get_image_urls(["tt1", "tt2"], wait=5)
+        self.assertEqual(urls, {"tt1": "http://images.test/tt1.jpg", "tt2": None})
+        self.assertEqual(pending, [])
+        self.assertEqual(FakeImageApi.requested, [])
+
+    def test_misses_are_fetched_in_the_background(self):
+        urls, pending = get_image_urls(["tt1"])
+        self.assertEqual((urls, pending), ({}, ["tt1"]))
+
+        get_fetcher().wait(["tt1"], 5)
+        self.assertEqual(get_image_urls(["tt1"]), ({"tt1": "http://images.test/tt1.jpg"}, []))
+
+    def test_concurrency_is_bounded(self):
+        get_image_urls([f"tt{i}" for i in range(10, 20)], wait=5)
+        self.assertEqual(len(FakeImageApi.requested), 10)
+        self.assertLessEqual(FakeImageApi.max_in_flight, self.conf["CONCURRENCY"])
+
+    def test_failed_fetches_keep_the_threads(self):
+        with self.assertLogs("movies.thumbnails", "ERROR") as logs:
+            urls, pending = get_image_urls(["tt4", "tt5"], wait=5)
+        self.assertEqual((urls, pending), ({}, ["tt4", "tt5"]))
+        self.assertEqual(len(logs.records), 2)
+
+        fetcher = get_fetcher()
+        self.assertTrue(all(t.is_alive() for t in fetcher._threads))
+        self.assertEqual(get_image_urls(["tt1"], wait=5), ({"tt1": "http://images.test/tt1.jpg"}, []))
+
+    def test_dead_threads_are_replaced(self):
+        fetcher = get_fetcher()
+        dead = threading.Thread(target=lambda: None)
+        dead.start()
+        dead.join()
+        fetcher._threads = [dead] * self.conf["CONCURRENCY"]
+
+        self.assertEqual(get_image_urls(["tt1"], wait=5), ({"tt1": "http://images.test/tt1.jpg"}, []))
+        self.assertEqual(len(fetcher._threads), self.conf["CONCURRENCY"])
+        self.assertNotIn(dead, fetcher._threads)
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(50)
+        start = time.monotonic()
+        for _ in range(6):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 5 / 50)
+
+    def test_local_thumbnails(self):
+        image = io.BytesIO()
+        Image.new("RGB", (100, 100), "red").save(image, "PNG")
+        hashes = store_thumbnails("tt1", resize_image(image.getvalue(), self.conf["SIZES"]))
+
+        res = self.client.get("/thumb/tt1", {"size": "detail"})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res["ETag"], f'"{hashes["detail"]}"')
+        self.assertIn("immutable", res["Cache-Control"])
+        with Image.open(io.BytesIO(b"".join(res.streaming_content))) as thumb:
+            self.assertEqual(thumb.size, (40, 40))
+
+        self.assertEqual(self.client.get("/thumb/tt2").status_code, 404)
+        self.assertEqual(self.client.get("/thumb/tt1", {"size": "huge"}).status_code, 404)
+
+        # the batch endpoint points to our own origin, without asking the image API
+        self.assertEqual(get_image_urls(["tt1"]), ({"tt1": "/thumb/tt1"}, []))
+        self.assertEqual(FakeImageApi.requested, [])
+
+        # the row of a thumbnail whose file was removed
+        Path(get_thumbnail("tt1", "card")[0]).unlink()
+        self.assertEqual(self.client.get("/thumb/tt1", {"size": "card"}).status_code, 404)
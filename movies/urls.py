@@ -1,10 +1,19 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# The async views run their independent queries concurrently, they are meant to be served by config/asgi.py
+if settings.ASYNC_VIEWS:
+    home_view, movie_complete_view, stats_view = views.home_view_async, views.movie_complete_view_async, views.stats_view_async
+else:
+    home_view, movie_complete_view, stats_view = views.home_view, views.movie_complete_view, views.stats_view
+
 urlpatterns = [
-    path('', views.home_view),
-    path('movies/<str:movie_id>', views.movie_complete_view),
+    path('', home_view),
+    path('movies/<str:movie_id>', movie_complete_view),
     path('movies', views.pages_view),
     path('search', views.search_view),
-    path('stats', views.stats_view),
+    path('stats', stats_view),
+    path('thumbnails', views.thumbnails_view),
+    path('thumb/<str:movie_id>', views.thumb_view),
 ]
\ No newline at end of file
@@ -1,13 +1,22 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render
-from django.http import Http404
+from django.http import FileResponse, Http404, JsonResponse
 
 from .services.mongo_service import *
 from .services.sqlite_service import *
+from .services.pagination import decode_cursor, encode_cursor, nearby_cursors
+from .services.counts import count_cap, count_mode
+from .services.thumbnails import get_image_urls, get_thumbnail
+from .conditional import mongo_condition, sqlite_condition
 
 def home_view(request):
     top_movies = get_top_N_movies(10)
     stats = get_basic_stats()
-    rd_movies = get_random_movies(10)
+    rd_movies = get_random_movies(10, settings.RANDOM_MOVIES_MIN_VOTES)
 
     context = {
         "top_movies": top_movies,
@@ -17,42 +26,83 @@ def home_view(request):
 
     return render(request, "movies/home.html", context)
 
+@sqlite_condition
 def pages_view(request):
     page = int(request.GET.get('page', 1))
 
     # filters
-    genre    = request.GET.get('genre', "")
-    min_year = int(request.GET.get('min_year', 0) or 0)
-    max_year = int(request.GET.get('max_year', 9000) or 9000)
-    min_note = float(request.GET.get('min_note', 0) or 0)
-    filters  = [genre, min_year, max_year, min_note]
+    genres     = [g for g in request.GET.getlist('genre') if g]
+    genre_mode = request.GET.get('genre_mode', "any")
+    if genre_mode not in ("any", "all"):
+        genre_mode = "any"
+    min_year   = int(request.GET.get('min_year', 0) or 0)
+    max_year   = int(request.GET.get('max_year', 9000) or 9000)
+    min_note   = float(request.GET.get('min_note', 0) or 0)
+    filters    = [genres, min_year, max_year, min_note, genre_mode]
 
     # sorting
     sort  = request.GET.get('sort', "title")
     order = request.GET.get('order', "ASC")
+
+    # keyset tokens from the previous/next links take precedence over the page number
+    cursor = None
+    for direction in ("after", "before"):
+        token = decode_cursor(request.GET.get(direction, ""), sort)
+        if token:
+            page, value, mid = token
+            cursor = (direction, value, mid)
+            break
     
-    film_list  = get_film_list(page, filters, sort, order)
+    count_capped = False
+    if count_mode() == "inline":
+        film_list, film_list_size = get_film_list(page, filters, sort, order, cursor, with_count=True)
+    else:
+        film_list = get_film_list(page, filters, sort, order, cursor)
+        cap = count_cap(page)
+        film_list_size = get_film_list_size(filters, cap)
+        count_capped = cap is not None and film_list_size > cap
     genre_list = get_genre_list()
 
-    film_list_size = get_film_list_size(filters)
     page_count     = (film_list_size + 19) // 20
     page_nav_range = range(max(1, page - 3), min(page_count + 1, page + 5))
 
+    prev_cursor = encode_cursor(page - 1, sort, film_list[0])  if film_list and page > 1 else None
+    next_cursor = encode_cursor(page + 1, sort, film_list[-1]) if film_list and page < page_count else None
+
+    # the page numbers seek from the movies of this page as well, instead of an OFFSET scan
+    cursors = nearby_cursors(
+        page, page_nav_range, sort, film_list,
+        lambda nearby, count: get_film_list(page, filters, sort, order, nearby, pages=count)
+    )
+    current = f"{cursor[0]}={request.GET[cursor[0]]}" if cursor else f"page={page}"
+    page_links = [
+        (i, current if i == page else f"{cursors[i][0]}={cursors[i][1]}")
+        for i in page_nav_range if i == page or i in cursors
+    ]
+
     queryDict = request.GET.copy()
-    queryDict.pop("page", None)
+    for key in ("page", "after", "before"):
+        queryDict.pop(key, None)
     base_qs = queryDict.urlencode()
 
     context = {
         "films": film_list,
         "genres": genre_list,
+        "selected_genres": genres,
+        "genre_mode": genre_mode,
         "page_num": page,
         "page_count": page_count,
-        "page_nav_range": page_nav_range,
+        "count_capped": count_capped,
+        "page_links": page_links,
+        "keyset": True,
+        "prev_cursor": prev_cursor,
+        "next_cursor": next_cursor,
         "base_qs": base_qs
     }
 
     return render(request, "movies/list.html", context)
 
+@mongo_condition
 def movie_complete_view(request, movie_id):
     movie_comp = get_movie_complete(movie_id)
 
@@ -61,29 +111,43 @@ def movie_complete_view(request, movie_id):
     movie_comp["mid"] = movie_comp["_id"] # django doesn't accept underscores before variables
     movie_comp.pop("_id")
 
+    # sampled from the precomputed pools when the movie has them
     directors     = [d["person_id"] for d in movie_comp["directors"]]
-    directors_rec = get_rd_movies_from_directors(directors, 10, movie_id)
-    genres_rec    = get_rd_movies_from_genres(movie_comp["genres"], 10, movie_id)
+    directors_rec = get_rd_movies_from_pool(movie_comp, "directors", 10)
+    genres_rec    = get_rd_movies_from_pool(movie_comp, "genres", 10)
+    if directors_rec is None:
+        directors_rec = get_rd_movies_from_directors(directors, 10, movie_id)
+    if genres_rec is None:
+        genres_rec = get_rd_movies_from_genres(movie_comp["genres"], 10, movie_id)
+    movie_comp.pop("rec_pool", None)
 
     movie_comp["directors_rec"] = directors_rec
     movie_comp["genres_rec"]    = genres_rec
     return render(request, "movies/detail.html", movie_comp)
 
+@sqlite_condition
 def search_view(request):
     query      = request.GET.get('q', '')
     query_type = request.GET.get('type', 'title')
     page       = int(request.GET.get('page', 1) or 1)
     search_result = []
     res_size = 0
+    count_capped = False
     match query_type:
         case 'title':
-            search_result = search_movies_from_title(query, page)
-            res_size = get_list_from_title_size(query)
+            search_fn, size_fn = search_movies_from_title, get_list_from_title_size
         case 'person':
-            search_result = search_movies_from_person(query, page)
-            res_size = get_list_from_person_size(query)
+            search_fn, size_fn = search_movies_from_person, get_list_from_person_size
         case _:
             raise Http404('bad query')
+
+    if count_mode() == "inline":
+        search_result, res_size = search_fn(query, page, with_count=True)
+    else:
+        search_result = search_fn(query, page)
+        cap = count_cap(page)
+        res_size = size_fn(query, cap)
+        count_capped = cap is not None and res_size > cap
     
     page_count     = (res_size + 19) // 20
     page_nav_range = range(max(1, page - 3), min(page_count + 1, page + 5))
@@ -96,12 +160,14 @@ def search_view(request):
         "films": search_result,
         "page_num": page,
         "page_count": page_count,
-        "page_nav_range": page_nav_range,
+        "count_capped": count_capped,
+        "page_links": [(i, f"page={i}") for i in page_nav_range],
         "base_qs": base_qs
     }
 
     return render(request, "movies/search.html", context)
 
+@sqlite_condition
 def stats_view(request):
     context = {
         "movies_by_genre":  get_movies_count_by_genre(),
@@ -110,4 +176,104 @@ def stats_view(request):
         "prolific_actors":  get_top_N_prolific_actors(10)
     }
 
-    return render(request, "movies/stats.html", context)
\ No newline at end of file
+    return render(request, "movies/stats.html", context)
+
+def thumbnails_view(request):
+    """
+    Returns the image URLs of the comma separated movie ids of 'ids' in a single request,
+    waiting a little for those the background fetcher has to get from the image API.
+    """
+    movie_ids = request.GET.get('ids', '').split(',')
+    urls, pending = get_image_urls(movie_ids, wait=settings.THUMBNAILS["WAIT"])
+    return JsonResponse({"urls": urls, "pending": pending})
+
+def thumb_view(request, movie_id):
+    """
+    Serves the local thumbnail of a movie built by the build_thumbnails command,
+    in the 'size' of settings.THUMBNAILS["SIZES"] given by the query string ("card" by default).
+    """
+    size = request.GET.get('size', 'card')
+    if size not in settings.THUMBNAILS["SIZES"]:
+        raise Http404('bad size')
+    thumbnail = get_thumbnail(movie_id, size)
+    if thumbnail is None:
+        raise Http404('no thumbnail')
+    path, content_hash = thumbnail
+
+    try:
+        image = open(path, "rb")
+    except FileNotFoundError:
+        # data/thumbs pruned, or a build interrupted after the row was written
+        raise Http404('no thumbnail file')
+
+    response = FileResponse(image, content_type="image/jpeg")
+    # a movie keeps its image: browsers and proxies can keep it for a year
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    response["ETag"] = f'"{content_hash}"'
+    return response
+
+#----------Async views (settings.ASYNC_VIEWS)----------
+
+# Threads running the SQLite services of the async views, each one keeps its own connection
+_sqlite_pool = ThreadPoolExecutor(max_workers=settings.ASYNC_SQLITE_THREADS, thread_name_prefix="sqlite")
+
+def _in_pool(func, *args):
+    return sync_to_async(func, thread_sensitive=False, executor=_sqlite_pool)(*args)
+
+async def home_view_async(request):
+    top_movies, stats, rd_movies = await asyncio.gather(
+        _in_pool(get_top_N_movies, 10),
+        _in_pool(get_basic_stats),
+        _in_pool(get_random_movies, 10, settings.RANDOM_MOVIES_MIN_VOTES)
+    )
+
+    context = {
+        "top_movies": top_movies,
+        "stats": stats,
+        "rd_movies": rd_movies
+    }
+
+    return await sync_to_async(render)(request, "movies/home.html", context)
+
+@mongo_condition
+async def movie_complete_view_async(request, movie_id):
+    movie_comp = await aget_movie_complete(movie_id)
+
+    if not movie_comp:
+        return await sync_to_async(render)(request, "movies/movie_not_found.html", {"movie_id": movie_id})
+    movie_comp["mid"] = movie_comp["_id"] # django doesn't accept underscores before variables
+    movie_comp.pop("_id")
+
+    directors_rec = get_rd_movies_from_pool(movie_comp, "directors", 10)
+    genres_rec    = get_rd_movies_from_pool(movie_comp, "genres", 10)
+    movie_comp.pop("rec_pool", None)
+
+    # without precomputed pools, both recommendations are sampled concurrently
+    if directors_rec is None or genres_rec is None:
+        directors = [d["person_id"] for d in movie_comp["directors"]]
+        directors_rec, genres_rec = await asyncio.gather(
+            aget_rd_movies_from_directors(directors, 10, movie_id),
+            aget_rd_movies_from_genres(movie_comp["genres"], 10, movie_id)
+        )
+
+    movie_comp["directors_rec"] = directors_rec
+    movie_comp["genres_rec"]    = genres_rec
+    return await sync_to_async(render)(request, "movies/detail.html", movie_comp)
+
+@sqlite_condition
+async def stats_view_async(request):
+    movies_by_genre, movies_by_decade, ratings_dist, prolific_actors = await asyncio.gather(
+        _in_pool(get_movies_count_by_genre),
+        _in_pool(get_movies_count_by_decade),
+        _in_pool(get_ratings_distribution, 1),
+        _in_pool(get_top_N_prolific_actors, 10)
+    )
+
+    context = {
+        "movies_by_genre":  movies_by_genre,
+        "movies_by_decade": movies_by_decade,
+        "ratings_dist":     ratings_dist,
+        "prolific_actors":  prolific_actors
+    }
+
+    return await sync_to_async(render)(request, "movies/stats.html", context)
@@ -0,0 +1,247 @@
+import csv
+import gzip
+import io
+import json
+import multiprocessing as mp
+import os
+import numpy as np
+import pandas as pd
+
+# Lecture des dumps IMDb (https://datasets.imdbws.com/) sous la forme des CSV de data/csv,
+# pour import_data.py --imdb-dir: chaque .tsv.gz est décompressé par un processus qui le découpe
+# en blocs de lignes, lus et transformés en parallèle par des processus de travail.
+# Seuls les titres de TITLE_TYPES sont gardés, avec les personnes de leurs principals.
+
+TITLE_TYPES = ["movie"]
+
+def hash_ids(serie):
+    """
+    Empreintes 64 bits des identifiants (tconst, nconst), comparées avec np.isin
+    plutôt que de garder des millions de chaînes en mémoire.
+    """
+    return pd.util.hash_pandas_object(serie, index=False).to_numpy()
+
+def read_tsv(data):
+    # \N est la seule valeur manquante des dumps: un titre "NA" reste un titre
+    return pd.read_csv(
+        io.BytesIO(data), sep="\t", dtype=str, quoting=csv.QUOTE_NONE,
+        na_values=["\\N"], keep_default_na=False
+    )
+
+def to_numbers(df, columns):
+    # en float comme les colonnes numériques à valeurs manquantes des CSV
+    return df.astype({column: float for column in columns})
+
+def explode(df, column):
+    """
+    Une ligne par élément des listes de 'column', sans les valeurs manquantes.
+    """
+    df = df.explode(column)
+    return df[df[column].notna() & (df[column] != "")]
+
+def split(df, column):
+    """
+    Une ligne par valeur du champ multi-valué 'column', dont les valeurs sont séparées par des virgules.
+    """
+    return explode(df.assign(**{column: df[column].str.split(",")}), column)
+
+#----------Transformations d'un bloc (dans les processus de travail)----------
+
+def _movie_rows(df, context):
+    return df[df["titleType"].isin(context["title_types"])]
+
+def _movie_keys(df, context):
+    return np.unique(hash_ids(_movie_rows(df, context)["tconst"]))
+
+def _in_movies(serie, context):
+    return np.isin(hash_ids(serie), context["movies"])
+
+def _person_keys(df, context):
+    return np.unique(hash_ids(df["nconst"][_in_movies(df["tconst"], context)]))
+
+def _in_persons(serie, context):
+    return np.isin(hash_ids(serie), context["persons"])
+
+def _movies(df, context):
+    df = _movie_rows(df, context).rename(columns={"tconst": "mid"})
+    return to_numbers(df.drop(columns="genres"), ["isAdult", "startYear", "endYear", "runtimeMinutes"])
+
+def _genres(df, context):
+    df = _movie_rows(df, context)
+    return split(pd.DataFrame({"mid": df["tconst"], "genre": df["genres"]}), "genre")
+
+def _ratings(df, context):
+    df = df[_in_movies(df["tconst"], context)].rename(columns={"tconst": "mid"})
+    return to_numbers(df, ["averageRating", "numVotes"])
+
+def _persons(df, context):
+    df = df[_in_persons(df["nconst"], context)]
+    return to_numbers(pd.DataFrame({
+        "pid": df["nconst"],
+        "primaryName": df["primaryName"],
+        "birthYear": df["birthYear"],
+        "deathYear": df["deathYear"],
+    }), ["birthYear", "deathYear"])
+
+def _professions(df, context):
+    df = df[_in_persons(df["nconst"], context)]
+    return split(pd.DataFrame({"pid": df["nconst"], "jobName": df["primaryProfession"]}), "jobName")
+
+def _known_for(df, context):
+    df = df[_in_persons(df["nconst"], context)]
+    df = split(pd.DataFrame({"pid": df["nconst"], "mid": df["knownForTitles"]}), "mid")
+    return df[_in_movies(df["mid"], context)]
+
+def _titles(df, context):
+    df = df[_in_movies(df["titleId"], context)].rename(columns={"titleId": "mid"})
+    return to_numbers(df, ["ordering", "isOriginalTitle"])
+
+def _principals(df, context):
+    df = df[_in_movies(df["tconst"], context)]
+    return to_numbers(pd.DataFrame({
+        "mid": df["tconst"],
+        "ordering": df["ordering"],
+        "pid": df["nconst"],
+        "category": df["category"],
+        "job": df["job"],
+    }), ["ordering"])
+
+def _characters(df, context):
+    df = df[_in_movies(df["tconst"], context) & df["characters"].notna()]
+    # characters est une liste JSON: ["Self", "Narrator"]
+    return explode(pd.DataFrame({
+        "mid": df["tconst"],
+        "pid": df["nconst"],
+        "name": df["characters"].map(json.loads),
+    }), "name")
+
+# fichier CSV de import_data.py -> (dump IMDb, transformation, empreintes nécessaires)
+FILES = {
+    "movies.csv": ("title.basics.tsv.gz", _movies, []),
+    "genres.csv": ("title.basics.tsv.gz", _genres, []),
+    "ratings.csv": ("title.ratings.tsv.gz", _ratings, ["movies"]),
+    "titles.csv": ("title.akas.tsv.gz", _titles, ["movies"]),
+    "principals.csv": ("title.principals.tsv.gz", _principals, ["movies"]),
+    "characters.csv": ("title.principals.tsv.gz", _characters, ["movies"]),
+    "persons.csv": ("name.basics.tsv.gz", _persons, ["persons"]),
+    "professions.csv": ("name.basics.tsv.gz", _professions, ["persons"]),
+    "knownformovies.csv": ("name.basics.tsv.gz", _known_for, ["movies", "persons"]),
+}
+
+#----------Processus----------
+
+def _decompress(path, blocks, frames, slots, block_bytes, workers):
+    """
+    Découpe le dump 'path' en blocs d'environ 'block_bytes' octets de lignes entières,
+    précédées de l'en-tête, et les numérote pour les remettre dans l'ordre.
+    """
+    try:
+        with gzip.open(path, "rb") as f:
+            header = f.readline()
+            seq = 0
+            while True:
+                block = f.read(block_bytes)
+                if not block:
+                    break
+                block += f.readline()
+                slots.acquire()
+                blocks.put((seq, header + block))
+                seq += 1
+    except Exception as e:
+        frames.put(e)
+    finally:
+        for _ in range(workers):
+            blocks.put(None)
+
+def _parse(blocks, frames, transform, context):
+    try:
+        while True:
+            item = blocks.get()
+            if item is None:
+                break
+            seq, data = item
+            frames.put((seq, transform(read_tsv(data), context)))
+    except Exception as e:
+        frames.put(e)
+    finally:
+        frames.put(None)
+
+class ImdbDumps:
+    """
+    Dumps .tsv.gz d'un répertoire, lus comme les fichiers de data/csv.
+    Au plus 'in_flight' blocs de 'block_bytes' octets sont en cours à la fois.
+    """
+    def __init__(self, directory, workers=None, block_bytes=16 * 1024 ** 2, title_types=TITLE_TYPES):
+        self.directory = directory
+        self.workers = workers or max((os.cpu_count() or 2) - 1, 1)
+        self.block_bytes = block_bytes
+        self.in_flight = 3 * self.workers
+        self.context = {"title_types": list(title_types)}
+
+    def read_chunks(self, file, usecols=None):
+        """
+        Morceaux (DataFrames) de 'file', un nom de fichier de data/csv, dans l'ordre du dump.
+        """
+        name, transform, needs = FILES[file]
+        for key in needs:
+            self._load_keys(key)
+        for frame in self._stream(name, transform):
+            yield frame[usecols] if usecols is not None else frame
+
+    def _load_keys(self, key):
+        """
+        Empreintes des films gardés, ou des personnes de leurs principals, calculées
+        par une première lecture du dump correspondant.
+        """
+        if key in self.context:
+            return
+        if key == "movies":
+            parts = list(self._stream("title.basics.tsv.gz", _movie_keys))
+        else:
+            self._load_keys("movies")
+            parts = list(self._stream("title.principals.tsv.gz", _person_keys))
+        self.context[key] = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.uint64)
+
+    def _stream(self, name, transform):
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+
+        ctx = mp.get_context()
+        blocks = ctx.Queue()
+        frames = ctx.Queue()
+        slots = ctx.Semaphore(self.in_flight)
+        processes = [ctx.Process(
+            target=_decompress, args=(path, blocks, frames, slots, self.block_bytes, self.workers), daemon=True
+        )] + [
+            ctx.Process(target=_parse, args=(blocks, frames, transform, self.context), daemon=True)
+            for _ in range(self.workers)
+        ]
+        for p in processes:
+            p.start()
+
+        try:
+            pending = {}
+            next_seq = 0
+            running = self.workers
+            while running or pending:
+                if next_seq in pending:
+                    frame = pending.pop(next_seq)
+                    next_seq += 1
+                    slots.release()
+                    yield frame
+                    continue
+                if not running:
+                    raise RuntimeError("bloc " + str(next_seq) + " de " + name + " perdu")
+                item = frames.get()
+                if item is None:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    pending[item[0]] = item[1]
+        finally:
+            for p in processes:
+                if p.is_alive():
+                    p.terminate()
+                p.join()
@@ -1,548 +1,830 @@
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import re
 import sqlite3
+import string
+import subprocess
+import sys
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import numpy as np
 import pandas as pd
+from imdb_tsv import TITLE_TYPES, ImdbDumps
+
+# Racine du projet Django (manage.py), quel que soit le dossier de lancement
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+sys.path.append(ROOT_DIR)
+from movies.services.dataset import store_data_version
 
 DB_PATH = "../../data/imdb.db"
 CSV_REPO = "../../data/csv/"
 
+# nombre de lignes envoyées par executemany
+BATCH_SIZE = 50_000
+
+# mémoire allouée aux morceaux de CSV, modifiable avec --memory-budget (en Mo)
+MEMORY_BUDGET = 512 * 1024 * 1024
+# rapport entre la mémoire d'un import et celle du morceau lu (colonnes converties, tuples...)
+CHUNK_OVERHEAD = 10
+# lignes lues pour estimer la taille d'une ligne de chaque CSV
+SAMPLE_ROWS = 1000
+# paramètres par requête des IN (...)
+MAX_VARIABLES = 999
+
+# dumps IMDb lus à la place des CSV, avec --imdb-dir
+IMDB_DUMPS = None
+
+# COLLATE NOCASE ne replie que les lettres ASCII
+NOCASE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+# {phase: (durée en secondes, pic de mémoire résidente en octets ou None)}
+PHASES = {}
+
+# fonction appelée avec le nombre de lignes de chaque lot écrit, dans les processus de --jobs
+PROGRESS = None
+
+# lignes lues entre deux validations d'un import, modifiable avec --checkpoint-rows
+CHECKPOINT_ROWS = 1_000_000
+# points de reprise enregistrés dans import_progress (pas dans les fichiers de --jobs)
+CHECKPOINTS = True
+# reprise depuis les points enregistrés par l'import interrompu, avec --resume
+RESUME = False
+
+#----------Outils d'import en masse----------
+
+def chunk_rows(file, **kwargs):
+    """
+    Nombre de lignes de 'file' lues par morceau pour rester dans MEMORY_BUDGET,
+    estimé sur ses SAMPLE_ROWS premières lignes.
+    """
+    sample = pd.read_csv(CSV_REPO + file, nrows=SAMPLE_ROWS, **kwargs)
+    row_bytes = sample.memory_usage(deep=True, index=False).sum() / max(len(sample), 1)
+    return max(int(MEMORY_BUDGET / (max(row_bytes, 1) * CHUNK_OVERHEAD)), 1000)
+
+def read_chunks(file, skip=0, **kwargs):
+    """
+    Lit 'file' par morceaux (DataFrames) de chunk_rows() lignes, sans ses 'skip' premières lignes,
+    ou les lignes correspondantes des dumps IMDb avec --imdb-dir.
+    """
+    if IMDB_DUMPS is not None:
+        return skip_rows(IMDB_DUMPS.read_chunks(file, kwargs.get("usecols")), skip)
+    return pd.read_csv(
+        CSV_REPO + file, chunksize=chunk_rows(file, **kwargs), skiprows=range(1, skip + 1), **kwargs
+    )
+
+def skip_rows(chunks, skip):
+    """
+    Morceaux de 'chunks' sans leurs 'skip' premières lignes.
+    """
+    for chunk in chunks:
+        if skip >= len(chunk):
+            skip -= len(chunk)
+            continue
+        yield chunk.iloc[skip:]
+        skip = 0
+
+def select_in(conn, sql, values):
+    """
+    DataFrame des résultats de 'sql', dont le IN ({}) reçoit 'values' par lots de MAX_VARIABLES.
+    """
+    values = list(values)
+    parts = [
+        pd.read_sql_query(sql.format(", ".join("?" * len(batch))), conn, params=batch)
+        for batch in (values[start:start + MAX_VARIABLES] for start in range(0, max(len(values), 1), MAX_VARIABLES))
+    ]
+    return pd.concat(parts, ignore_index=True)
+
+def stage_csv(conn, name, file, columns):
+    """
+    Copie les colonnes {colonne du CSV: colonne} de 'file' dans la table temporaire 'name',
+    indexée sur sa première colonne, où les morceaux d'un autre fichier cherchent leurs lignes
+    sans garder le CSV entier en mémoire.
+    """
+    conn.execute(f"DROP TABLE IF EXISTS temp.{name}")
+    conn.execute(f"CREATE TEMP TABLE {name} ({', '.join(columns.values())})")
+    for chunk in read_chunks(file, usecols=list(columns)):
+        conn.executemany(
+            f"INSERT INTO temp.{name} VALUES ({', '.join('?' * len(columns))})",
+            to_rows(chunk[list(columns)])
+        )
+    first = next(iter(columns.values()))
+    conn.execute(f"CREATE INDEX temp.{name}_{first} ON {name}({first})")
+
+def drop_seen(serie, seen):
+    """
+    drop_duplicates() d'un fichier lu par morceaux: retire de 'serie' les valeurs déjà lues,
+    dont 'seen' garde les empreintes 64 bits triées plutôt que les valeurs.
+    Retourne (serie sans doublons, nouveau seen).
+    """
+    hashes = pd.util.hash_pandas_object(serie, index=False).to_numpy()
+    keep = ~pd.Series(hashes).duplicated().to_numpy() & ~np.isin(hashes, seen)
+    return serie[keep], np.union1d(seen, hashes)
+
+def nocase(serie):
+    """
+    Clés de recherche de 'serie', comparables comme par COLLATE NOCASE.
+    """
+    return serie.astype("string").str.translate(NOCASE)
+
+def load_ids(conn, keys, table, id_col, name_col):
+    """
+    Charge {nom replié: id} des noms 'keys' présents dans une table de noms
+    (genres, professions, characters, titles), pour résoudre les clés étrangères
+    d'un morceau sans un SELECT par ligne.
+    """
+    res = select_in(conn, f"SELECT {name_col} AS name, {id_col} AS id FROM {table} WHERE {name_col} IN ({{}})", keys)
+    return dict(zip(nocase(res["name"]), res["id"]))
+
+def new_names(conn, serie, table, id_col, name_col):
+    """
+    Noms de 'serie' à insérer dans une table de noms: sans valeur manquante, sans doublon
+    au sens de COLLATE NOCASE et absents de la table, car un INSERT OR IGNORE ignoré
+    consommerait tout de même un id AUTOINCREMENT.
+    """
+    keys = nocase(serie)
+    known = load_ids(conn, keys.dropna().unique(), table, id_col, name_col)
+    return serie[keys.notna() & ~keys.duplicated() & ~keys.isin(list(known))]
+
+def lookup(conn, serie, table, id_col, name_col):
+    """
+    Ids des noms de 'serie' (<NA> si absent), comme le faisait la sous-requête
+    (SELECT ... WHERE name = ? COLLATE NOCASE LIMIT 1).
+    """
+    keys = nocase(serie)
+    ids = load_ids(conn, keys.dropna().unique(), table, id_col, name_col)
+    return keys.map(ids).astype("Int64")
+
+def to_int(serie):
+    """
+    Entiers tronqués comme int(), <NA> pour les valeurs manquantes.
+    """
+    return np.trunc(serie.astype(float)).astype("Int64")
+
+def text_or_none(serie):
+    """
+    Valeurs vides ou manquantes remplacées par <NA>.
+    """
+    return serie.where(serie.notna() & (serie != ""))
+
+def to_rows(df):
+    """
+    Lignes de 'df' en tuples de types Python, None pour les valeurs manquantes.
+    """
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+def insert_rows(conn, sql, df):
+    """
+    Insère les lignes de 'df' par lots de BATCH_SIZE avec executemany.
+    'sql' est un INSERT OR IGNORE: une ligne violant une contrainte est ignorée seule,
+    comme l'IntegrityError de l'import ligne par ligne.
+    Retourne (lignes insérées, lignes abandonnées).
+    """
+    insert_cnt = 0
+    for start in range(0, len(df), BATCH_SIZE):
+        before = conn.total_changes
+        batch = df.iloc[start:start + BATCH_SIZE]
+        conn.executemany(sql, to_rows(batch))
+        insert_cnt += conn.total_changes - before
+        if PROGRESS is not None:
+            PROGRESS(len(batch))
+    return insert_cnt, len(df) - insert_cnt
+
+#----------Points de reprise (--resume)----------
+
+def create_progress(conn):
+    """
+    Crée import_progress, la position de chaque import à sa dernière validation.
+    Sans --resume, un nouvel import repart de zéro.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS import_progress (
+            table_name VARCHAR(30) PRIMARY KEY,
+            file_no INTEGER NOT NULL,
+            csv_offset INTEGER NOT NULL,
+            finished BOOLEAN NOT NULL,
+            updated_at VARCHAR(32) NOT NULL
+        )
+    """)
+    if not RESUME:
+        conn.execute("DELETE FROM import_progress")
+    conn.commit()
+
+def save_progress(conn, name, file_no, csv_offset, finished):
+    conn.execute(
+        "INSERT OR REPLACE INTO import_progress (table_name, file_no, csv_offset, finished, updated_at) VALUES (?, ?, ?, ?, ?)",
+        (name, file_no, csv_offset, int(finished), datetime.now(timezone.utc).isoformat())
+    )
+
+class Progress:
+    """
+    Position d'un import dans ses fichiers sources: le rang du fichier lu (titles et movie_titles
+    en lisent plusieurs) et le nombre de ses lignes déjà lues.
+    Les lignes insérées sont validées toutes les CHECKPOINT_ROWS lignes lues, avec cette position:
+    --resume repart de la dernière validation sans insérer deux fois les mêmes lignes.
+    """
+    def __init__(self, conn, name):
+        self.conn = conn
+        self.name = name
+        # les tables temporaires de --delta ne survivent pas au processus
+        self.enabled = CHECKPOINTS and not name.startswith("temp.")
+        self.file_no = -1
+        self.saved = (0, 0, False)
+        if self.enabled and RESUME:
+            res = conn.execute(
+                "SELECT file_no, csv_offset, finished FROM import_progress WHERE table_name = ?", (name,)
+            ).fetchone()
+            self.saved = res or self.saved
+        self.finished = bool(self.saved[2])
+        self.rows = 0
+
+    def chunks(self, file, **kwargs):
+        """
+        read_chunks() du fichier suivant de l'import, sans les lignes déjà validées.
+        Valide la transaction en cours après le morceau qui atteint CHECKPOINT_ROWS lignes.
+        """
+        self.file_no += 1
+        saved_file, saved_offset, _ = self.saved
+        if self.file_no < saved_file:
+            return
+        offset = saved_offset if self.file_no == saved_file else 0
+        if offset:
+            print("Reprise de " + file + " à la ligne ", offset)
+
+        for chunk in read_chunks(file, skip=offset, **kwargs):
+            yield chunk
+            offset += len(chunk)
+            self.rows += len(chunk)
+            if self.enabled and self.rows >= CHECKPOINT_ROWS:
+                save_progress(self.conn, self.name, self.file_no, offset, False)
+                self.conn.commit()
+                self.conn.execute("BEGIN TRANSACTION")
+                self.rows = 0
+
+    def finish(self):
+        """
+        Marque l'import terminé, dans sa dernière transaction.
+        """
+        if self.enabled:
+            save_progress(self.conn, self.name, self.file_no, 0, True)
+
 # no dependency
 def import_characters(conn):
     TRANSAC_NAME = "characters"
     insert_cnt = 0
     failure_cnt = 0
-
-    c = conn.cursor()
-    charactersDf = pd.read_csv(CSV_REPO + "characters.csv")
-
-    charactersSerie = charactersDf["name"].drop_duplicates()
+    seen = np.empty(0, dtype=np.uint64)
 
     try:
         print("--------------TRANSACTION " + TRANSAC_NAME + "--------------")
+        progress = Progress(conn, TRANSAC_NAME)
+        if progress.finished:
+            print("Transaction " + TRANSAC_NAME + " déjà terminée, ignorée (--resume)")
+            return True
         conn.execute("BEGIN TRANSACTION")
 
-        for _, elt in charactersSerie.items():
-            if (pd.isna(elt) or elt == ""): # skip invalid values
-                continue
-            try:
-                c.execute("""
-                    INSERT INTO characters (name)
-                    VALUES (?)
-                """, (
-                    elt,
-                ))
-                insert_cnt += 1
-            except sqlite3.IntegrityError as e:
-                # Skip invalid rows
-                failure_cnt += 1
+        for charactersDf in progress.chunks("characters.csv", usecols=["name"]):
+            charactersSerie, seen = drop_seen(charactersDf["name"], seen)
+            charactersSerie = charactersSerie[charactersSerie.notna() & (charactersSerie != "")] # skip invalid values
+
+            inserted, _ = insert_rows(conn, """
+                INSERT OR IGNORE INTO characters (name)
+                VALUES (?)
+            """, new_names(conn, charactersSerie, "characters", "character_id", "name").to_frame())
+            insert_cnt += inserted
+            failure_cnt += len(charactersSerie) - inserted
 
+        progress.finish()
         conn.commit()
         print("Transaction " + TRANSAC_NAME + " terminée avec succès: ")
         print("Lignes insérées: ", insert_cnt)
         print("Lignes abandonnées: ", failure_cnt)
+        return True
 
     except sqlite3.Error as e:
         conn.rollback()
         print("!!! TRANSACTION Echouée !!!:\n", e)
+        return False
 
 # Depends on tables movies, persons, characters
-def import_cast(conn):
+def import_cast(conn, table="cast"):
     TRANSAC_NAME = "cast"
     insert_cnt = 0
     failure_cnt = 0
 
-    c = conn.cursor()
-    charactersDf = pd.read_csv(CSV_REPO + "characters.csv")
-
     try:
         print("--------------TRANSACTION " + TRANSAC_NAME + "--------------")
+        progress = Progress(conn, table)
+        if progress.finished:
+            print("Transaction " + TRANSAC_NAME + " déjà terminée, ignorée (--resume)")
+            return True
         conn.execute("BEGIN TRANSACTION")
 
-        for _, row in charactersDf.iterrows():
-            if pd.isna(row["name"]) or row["name"] == "":
-                continue
-            try:
-                c.execute("""
-                    INSERT INTO cast(movie_id, person_id, character_id)
-                    VALUES(?, ?, (SELECT character_id FROM characters WHERE name = ? COLLATE NOCASE LIMIT 1))
-                """, (
-                    row["mid"],
-                    row["pid"],
-                    row["name"]
-                ))
-                insert_cnt += 1
-            except sqlite3.IntegrityError as e:
-                # Skip invalid rows
-                failure_cnt += 1
-
+        for charactersDf in progress.chunks("characters.csv", usecols=["mid", "pid", "name"]):
+            charactersDf = charactersDf[charactersDf["name"].notna() & (charactersDf["name"] != "")]
+
+            inserted, failed = insert_rows(conn, f"""
+                INSERT OR IGNORE INTO {table}(movie_id, person_id, character_id)
+                VALUES(?, ?, ?)
+            """, pd.DataFrame({
+                "movie_id": charactersDf["mid"],
+                "person_id": charactersDf["pid"],
+                "character_id": lookup(conn, charactersDf["name"], "characters", "character_id", "name"),
+            }))
+            insert_cnt += inserted
+            failure_cnt += failed
+
+        progress.finish()
         conn.commit()
         print("Transaction " + TRANSAC_NAME + " terminée avec succès: ")
         print("Lignes insérées: ", insert_cnt)
         print("Lignes abandonnées: ", failure_cnt)
+        return True
 
     except sqlite3.Error as e:
         conn.rollback()
         print("!!! TRANSACTION Echouée !!!:\n", e)
+        return False
 
 # No dependency
 def import_genres(conn):
     TRANSAC_NAME = "genres"
     insert_cnt = 0
     failure_cnt = 0
-
-    c = conn.cursor()
-    genresDf = pd.read_csv(CSV_REPO + "genres.csv")
-
-    genresSerie = genresDf["genre"].drop_duplicates()
+    seen = np.empty(0, dtype=np.uint64)
 
     try:
         print("--------------TRANSACTION " + TRANSAC_NAME + "--------------")
+        progress = Progress(conn, TRANSAC_NAME)
+        if progress.finished:
+            print("Transaction " + TRANSAC_NAME + " déjà terminée, ignorée (--resume)")
+            return True
         conn.execute("BEGIN TRANSACTION")
 
-        for _, elt in genresSerie.items():
-            if (pd.isna(elt) or elt == ""): # skip invalid values
-                continue
-            try:
-                c.execute("""
-                    INSERT INTO genres (genre_name)
-                    VALUES (?)
-                """, (
-                    elt,
-                ))
-                insert_cnt += 1
-            except sqlite3.IntegrityError as e:
-                # Skip invalid rows
-                failure_cnt += 1
+        for genresDf in progress.chunks("genres.csv", usecols=["genre"]):
+            genresSerie, seen = drop_seen(genresDf["genre"], seen)
+            genresSerie = genresSerie[genresSerie.notna() & (genresSerie != "")] # skip invalid values
 
+            inserted, _ = insert_rows(conn, """
+                INSERT OR IGNORE INTO genres (genre_name)
+                VALUES (?)
+            """, new_names(conn, genresSerie, "genres", "genre_id", "genre_name").to_frame())
+            insert_cnt += inserted
+            failure_cnt += len(genresSerie) - inserted
+
+        progress.finish()
         conn.commit()
         print("Transaction " + TRANSAC_NAME + " terminée avec succès: ")
         print("Lignes insérées: ", insert_cnt)
         print("Lignes abandonnées: ", failure_cnt)
+        return True
 
     except sqlite3.Error as e:
         conn.rollback()
         print("!!! TRANSACTION Echouée !!!:\n", e)
+        return False
 
 
 # depends on tables genres and movies
-def import_movie_genres(conn):
+def import_movie_genres(conn, table="movie_genres"):
     TRANSAC_NAME = "movie_genres"
     insert_cnt = 0
     failure_cnt = 0
 
-    c = conn.cursor()
-    genresDf = pd.read_csv(CSV_REPO + "genres.csv")
-
     try:
         print("--------------TRANSACTION " + TRANSAC_NAME + "--------------")
+        progress = Progress(conn, table)
+        if progress.finished:
+            print("Transaction " + TRANSAC_NAME + " déjà terminée, ignorée (--resume)")
+            return True
         conn.execute("BEGIN TRANSACTION")
 
-        for _, row in genresDf.iterrows():
-            if pd.isna(row["genre"]) or row["genre"] == "":
-                continue
-            try:
-                c.execute("""
-                    INSERT INTO movie_genres(movie_id, genre_id)
-                    VALUES(?, (SELECT genre_id FROM genres WHERE genre_name = ? COLLATE NOCASE LIMIT 1))
-                """, (
-                    row["mid"],
-                    row["genre"]
-                ))
-                insert_cnt += 1
-            except sqlite3.IntegrityError as e:
-                # Skip invalid rows
-                failure_cnt += 1
+        for genresDf in progress.chunks("genres.csv", usecols=["mid", "genre"]):
+            genresDf = genresDf[genresDf["genre"].notna() & (genresDf["genre"] != "")]
+
+            inserted, failed = insert_rows(conn, f"""
+                INSERT OR IGNORE INTO {table}(movie_id, genre_id)
+                VALUES(?, ?)
+            """, pd.DataFrame({
+                "movie_id": genresDf["mid"],
+                "genre_id": lookup(conn, genresDf["genre"], "genres", "genre_id", "genre_name"),
+            }))
+            insert_cnt += inserted
+            failure_cnt += failed
 
+        progress.finish()
         conn.commit()
         print("Transaction " + TRANSAC_NAME + " terminée avec succès: ")
         print("Lignes insérées: ", insert_cnt)
         print("Lignes abandonnées: ", failure_cnt)
+        return True
 
     except sqlite3.Error as e:
         conn.rollback()
         print("!!! TRANSACTION Echouée !!!:\n", e)
+        return False
 
 # Depends on tables persons and movies 
-def import_knownformovies(conn):
+def import_knownformovies(conn, table="known_for_movies"):
     TRANSAC_NAME = "known_for_movies"
     insert_cnt = 0
     failure_cnt = 0
 
-    c = conn.cursor()
-    knownDf = pd.read_csv(CSV_REPO + "knownformovies.csv")
-
     try:
         print("--------------TRANSACTION " + TRANSAC_NAME + "--------------")
+        progress = Progress(conn, table)
+        if progress.finished:
+            print("Transaction " + TRANSAC_NAME + " déjà terminée, ignorée (--resume)")
+            return True
         conn.execute("BEGIN TRANSACTION")
 
-        for _, row in knownDf.iterrows():
-            try:
-                
-                c.execute("""
-                    INSERT INTO known_for_movies (person_id, movie_id)
-                    VALUES (?, ?)
-                """, (
-                    row["pid"],
-                    row["mid"]
-                ))
-                insert_cnt += 1
-            except sqlite3.IntegrityError as e:
-                # Skip invalid rows
-                failure_cnt += 1
+        for knownDf in progress.chunks("knownformovies.csv", usecols=["pid", "mid"]):
+            inserted, failed = insert_rows(conn, f"""
+                INSERT OR IGNORE INTO {table} (person_id, movie_id)
+                VALUES (?, ?)
+            """, knownDf[["pid", "mid"]])
+            insert_cnt += inserted
+            failure_cnt += failed
 
+        progress.finish()
         conn.commit()
         print("Transaction " + TRANSAC_NAME + " terminée avec succès: ")
         print("Lignes insérées: ", insert_cnt)
         print("Lignes abandonnées: ", failure_cnt)
+        return True
 
     except sqlite3.Error as e:
         conn.rollback()
         print("!!! TRANSACTION Echouée !!!:\n", e)
+        return False
 
 # No dependency
-def import_movies(conn):
+def import_movies(conn, table="movies"):
     TRANSAC_NAME = "movies"
     insert_cnt = 0
     failure_cnt = 0
 
-    c = conn.cursor()
-    moviesDf = pd.read_csv(CSV_REPO + "movies.csv")
-
     try:
         print("--------------TRANSACTION " + TRANSAC_NAME + "--------------")
+        progress = Progress(conn, table)
+        if progress.finished:
+            print("Transaction " + TRANSAC_NAME + " déjà terminée, ignorée (--resume)")
+            return True
         conn.execute("BEGIN TRANSACTION")
 
-        for _, row in moviesDf.iterrows():
-            try:
-                c.execute("""
-                    INSERT INTO movies (movie_id, year, runtime_minutes)
-                    VALUES (?, ?, ?)
-                """, (
-                    row["mid"],
-                    int(row["startYear"]) if not pd.isna(row["startYear"]) else None,
-                    int(row["runtimeMinutes"]) if not pd.isna(row["runtimeMinutes"]) else None,
-                ))
-                insert_cnt += 1
-            except sqlite3.IntegrityError as e:
-                # Skip invalid rows
-                failure_cnt += 1
-
+        for moviesDf in progress.chunks("movies.csv", usecols=["mid", "startYear", "runtimeMinutes"]):
+            inserted, failed = insert_rows(conn, f"""
+                INSERT OR IGNORE INTO {table} (movie_id, year, runtime_minutes)
+                VALUES (?, ?, ?)
+            """, pd.DataFrame({
+                "movie_id": moviesDf["mid"],
+                "year": to_int(moviesDf["startYear"]),
+                "runtime_minutes": to_int(moviesDf["runtimeMinutes"]),
+            }))
+            insert_cnt += inserted
+            failure_cnt += failed
+
+        progress.finish()
         conn.commit()
         print("Transaction " + TRANSAC_NAME + " terminée avec succès: ")
         print("Lignes insérées: ", insert_cnt)
         print("Lignes abandonnées: ", failure_cnt)
+        return True
 
     except sqlite3.Error as e:
         conn.rollback()
         print("!!! TRANSACTION Echouée !!!:\n", e)
+        return False
 
 # No dependency
-def import_persons(conn):
+def import_persons(conn, table="persons"):
     TRANSAC_NAME = "persons"
     insert_cnt = 0
     failure_cnt = 0
 
-    c = conn.cursor()
-    personsDf = pd.read_csv(CSV_REPO + "persons.csv")
-
     try:
         print("--------------TRANSACTION " + TRANSAC_NAME + "--------------")
+        progress = Progress(conn, table)
+        if progress.finished:
+            print("Transaction " + TRANSAC_NAME + " déjà terminée, ignorée (--resume)")
+            return True
         conn.execute("BEGIN TRANSACTION")
 
-        for _, row in personsDf.iterrows():
-            try:
-                c.execute("""
-                    INSERT INTO persons (person_id, name, birth_year, death_year)
-                    VALUES (?, ?, ?, ?)
-                """, (
-                    row["pid"],
-                    row["primaryName"] if not pd.isna(row["primaryName"]) and not row["primaryName"] == "" else None,
-                    int(row["birthYear"]) if not pd.isna(row["birthYear"]) else None,
-                    int(row["deathYear"]) if not pd.isna(row["deathYear"]) else None
-                ))
-                insert_cnt += 1
-            except sqlite3.IntegrityError as e:
-                # Skip invalid rows
-                failure_cnt += 1
-
+        for personsDf in progress.chunks("persons.csv", usecols=["pid", "primaryName", "birthYear", "deathYear"]):
+            inserted, failed = insert_rows(conn, f"""
+                INSERT OR IGNORE INTO {table} (person_id, name, birth_year, death_year)
+                VALUES (?, ?, ?, ?)
+            """, pd.DataFrame({
+                "person_id": personsDf["pid"],
+                "name": text_or_none(personsDf["primaryName"]),
+                "birth_year": to_int(personsDf["birthYear"]),
+                "death_year": to_int(personsDf["deathYear"]),
+            }))
+            insert_cnt += inserted
+            failure_cnt += failed
+
+        progress.finish()
         conn.commit()
         print("Transaction " + TRANSAC_NAME + " terminée avec succès: ")
         print("Lignes insérées: ", insert_cnt)
         print("Lignes abandonnées: ", failure_cnt)
+        return True
 
     except sqlite3.Error as e:
         conn.rollback()
         print("!!! TRANSACTION Echouée !!!:\n", e)
+        return False
 
 # No dependency
 def import_professions(conn):
     TRANSAC_NAME = "professions"
     insert_cnt = 0
     failure_cnt = 0
+    seen = np.empty(0, dtype=np.uint64)
 
-    c = conn.cursor()
-    professionsDf = pd.read_csv(CSV_REPO + "professions.csv")
-
-    professionsSerie = professionsDf["jobName"].drop_duplicates()
     try:
         print("--------------TRANSACTION " + TRANSAC_NAME + "--------------")
+        progress = Progress(conn, TRANSAC_NAME)
+        if progress.finished:
+            print("Transaction " + TRANSAC_NAME + " déjà terminée, ignorée (--resume)")
+            return True
         conn.execute("BEGIN TRANSACTION")
 
-        for _, elt in professionsSerie.items():
-            if (pd.isna(elt) or elt == ""): # skip invalid values
-                continue
-            try:
-                c.execute("""
-                    INSERT INTO professions (job_name)
-                    VALUES (?)
-                """, (
-                    elt,
-                ))
-                insert_cnt += 1
-            except sqlite3.IntegrityError as e:
-                # Skip invalid rows
-                failure_cnt += 1
+        for professionsDf in progress.chunks("professions.csv", usecols=["jobName"]):
+            professionsSerie, seen = drop_seen(professionsDf["jobName"], seen)
+            professionsSerie = professionsSerie[professionsSerie.notna() & (professionsSerie != "")] # skip invalid values
+
+            inserted, _ = insert_rows(conn, """
+                INSERT OR IGNORE INTO professions (job_name)
+                VALUES (?)
+            """, new_names(conn, professionsSerie, "professions", "profession_id", "job_name").to_frame())
+            insert_cnt += inserted
+            failure_cnt += len(professionsSerie) - inserted
 
+        progress.finish()
         conn.commit()
         print("Transaction " + TRANSAC_NAME + " terminée avec succès: ")
         print("Lignes insérées: ", insert_cnt)
         print("Lignes abandonnées: ", failure_cnt)
+        return True
 
     except sqlite3.Error as e:
         conn.rollback()
         print("!!! TRANSACTION Echouée !!!:\n", e)
+        return False
 
 # Depends on tables persons and professions
-def import_person_profession(conn):
+def import_person_profession(conn, table="person_profession"):
     TRANSAC_NAME = "person_profession"
     insert_cnt = 0
     failure_cnt = 0
 
-    c = conn.cursor()
-    professionsDf = pd.read_csv(CSV_REPO + "professions.csv")
-
     try:
         print("--------------TRANSACTION " + TRANSAC_NAME + "--------------")
+        progress = Progress(conn, table)
+        if progress.finished:
+            print("Transaction " + TRANSAC_NAME + " déjà terminée, ignorée (--resume)")
+            return True
         conn.execute("BEGIN TRANSACTION")
 
-        for _, row in professionsDf.iterrows():
-            if pd.isna(row["jobName"]) or row["jobName"] == "":
-                continue
-            try:
-                c.execute("""
-                    INSERT INTO person_profession(person_id, profession_id)
-                    VALUES(?, (SELECT profession_id FROM professions WHERE job_name = ? COLLATE NOCASE LIMIT 1))
-                """, (
-                    row["pid"],
-                    row["jobName"]
-                ))
-                insert_cnt += 1
-            except sqlite3.IntegrityError as e:
-                # Skip invalid rows
-                failure_cnt += 1
+        for professionsDf in progress.chunks("professions.csv", usecols=["pid", "jobName"]):
+            professionsDf = professionsDf[professionsDf["jobName"].notna() & (professionsDf["jobName"] != "")]
 
+            inserted, failed = insert_rows(conn, f"""
+                INSERT OR IGNORE INTO {table}(person_id, profession_id)
+                VALUES(?, ?)
+            """, pd.DataFrame({
+                "person_id": professionsDf["pid"],
+                "profession_id": lookup(conn, professionsDf["jobName"], "professions", "profession_id", "job_name"),
+            }))
+            insert_cnt += inserted
+            failure_cnt += failed
+
+        progress.finish()
         conn.commit()
         print("Transaction " + TRANSAC_NAME + " terminée avec succès: ")
         print("Lignes insérées: ", insert_cnt)
         print("Lignes abandonnées: ", failure_cnt)
+        return True
 
     except sqlite3.Error as e:
         conn.rollback()
         print("!!! TRANSACTION Echouée !!!:\n", e)
+        return False
 
 # Depends on table movies
-def import_ratings(conn):
+def import_ratings(conn, table="ratings"):
     TRANSAC_NAME = "ratings"
     insert_cnt = 0
     failure_cnt = 0
 
-    c = conn.cursor()
-    ratingsDf = pd.read_csv(CSV_REPO + "ratings.csv")
-
     try:
         print("--------------TRANSACTION " + TRANSAC_NAME + "--------------")
+        progress = Progress(conn, table)
+        if progress.finished:
+            print("Transaction " + TRANSAC_NAME + " déjà terminée, ignorée (--resume)")
+            return True
         conn.execute("BEGIN TRANSACTION")
 
-        for _, row in ratingsDf.iterrows():
-            try:
-                c.execute("""
-                    INSERT INTO ratings (movie_id, average_rating, num_votes)
-                    VALUES (?, ?, ?)
-                """, (
-                    row["mid"],
-                    float(row["averageRating"]) if not pd.isna(row["averageRating"]) else None,
-                    int(row["numVotes"]) if not pd.isna(row["numVotes"]) else None
-                ))
-                insert_cnt += 1
-            except sqlite3.IntegrityError as e:
-                # Skip invalid rows
-                failure_cnt += 1
-
+        for ratingsDf in progress.chunks("ratings.csv", usecols=["mid", "averageRating", "numVotes"]):
+            inserted, failed = insert_rows(conn, f"""
+                INSERT OR IGNORE INTO {table} (movie_id, average_rating, num_votes)
+                VALUES (?, ?, ?)
+            """, pd.DataFrame({
+                "movie_id": ratingsDf["mid"],
+                "average_rating": ratingsDf["averageRating"].astype(float),
+                "num_votes": to_int(ratingsDf["numVotes"]),
+            }))
+            insert_cnt += inserted
+            failure_cnt += failed
+
+        progress.finish()
         conn.commit()
         print("Transaction " + TRANSAC_NAME + " terminée avec succès: ")
         print("Lignes insérées: ", insert_cnt)
         print("Lignes abandonnées: ", failure_cnt)
+        return True
 
     except sqlite3.Error as e:
         conn.rollback()
         print("!!! TRANSACTION Echouée !!!:\n", e)
+        return False
 
 # No dependencies
 def import_titles(conn):
     TRANSAC_NAME = "titles"
     insert_cnt = 0
     failure_cnt = 0
+    seen = np.empty(0, dtype=np.uint64)
 
-    c = conn.cursor()
-    titlesDf = pd.read_csv(CSV_REPO + "titles.csv")
-    moviesDf = pd.read_csv(CSV_REPO + "movies.csv")
-
-    titlesSerie = pd.concat([
-        titlesDf["title"],
-        moviesDf["originalTitle"],
-        moviesDf["primaryTitle"]
-    ]).drop_duplicates()
+    # les titres de titles.csv, puis les titres originaux et primaires de movies.csv
+    def titlesSeries():
+        for titlesDf in progress.chunks("titles.csv", usecols=["title"]):
+            yield titlesDf["title"]
+        for column in ["originalTitle", "primaryTitle"]:
+            for moviesDf in progress.chunks("movies.csv", usecols=[column]):
+                yield moviesDf[column]
 
     try:
         print("--------------TRANSACTION " + TRANSAC_NAME + "--------------")
+        progress = Progress(conn, TRANSAC_NAME)
+        if progress.finished:
+            print("Transaction " + TRANSAC_NAME + " déjà terminée, ignorée (--resume)")
+            return True
         conn.execute("BEGIN TRANSACTION")
 
-        for _, elt in titlesSerie.items():
-            try:
-                c.execute("""
-                    INSERT INTO titles (title_name)
-                    VALUES (?)
-                """, (
-                    elt,
-                ))
-                insert_cnt += 1
-            except sqlite3.IntegrityError as e:
-                # Skip invalid rows
-                failure_cnt += 1
+        for titlesSerie in titlesSeries():
+            titlesSerie, seen = drop_seen(titlesSerie, seen)
+
+            inserted, _ = insert_rows(conn, """
+                INSERT OR IGNORE INTO titles (title_name)
+                VALUES (?)
+            """, new_names(conn, titlesSerie, "titles", "title_id", "title_name").to_frame())
+            insert_cnt += inserted
+            failure_cnt += len(titlesSerie) - inserted
 
+        progress.finish()
         conn.commit()
         print("Transaction " + TRANSAC_NAME + " terminée avec succès: ")
         print("Lignes insérées: ", insert_cnt)
         print("Lignes abandonnées: ", failure_cnt)
+        return True
 
     except sqlite3.Error as e:
         conn.rollback()
         print("!!! TRANSACTION Echouée !!!:\n", e)
+        return False
 
 # Depends on movies and titles:
-def import_movie_title(conn):
+def import_movie_title(conn, table="movie_titles"):
     TRANSAC_NAME = "movie_titles"
     insert_from_titles = 0
     failure_from_titles = 0
+    insert_from_movies = 0
+    failure_from_movies = 0
 
-    c = conn.cursor()
-
-    # création d'une lookup table pour éviter de faire un SELECT par ligne, la table titles étant très grosse
-    moviesDf = pd.read_csv(CSV_REPO + "movies.csv")
-    primaryLUT = set(zip(moviesDf["mid"], moviesDf["primaryTitle"]))
-    originalLUT = set(zip(moviesDf["mid"], moviesDf["originalTitle"]))
-
-    titlesDf = pd.read_csv(CSV_REPO + "titles.csv")
-    titlesLUT = set(zip(titlesDf["mid"], titlesDf["title"]))
     try:
 
         # Complete with table movies
         print("--------------TRANSACTION " + TRANSAC_NAME + "--------------")
+        progress = Progress(conn, table)
+        if progress.finished:
+            print("Transaction " + TRANSAC_NAME + " déjà terminée, ignorée (--resume)")
+            return True
         conn.execute("BEGIN TRANSACTION")
 
-        for _, row in titlesDf.iterrows():
-            try:
-                c.execute("""
-                    INSERT INTO movie_titles (movie_id, title_id, is_primary, is_original)
-                    VALUES (?, 
-                        (SELECT title_id FROM titles WHERE title_name = ? COLLATE NOCASE),
-                        ?, ?)
-                """, (
-                    row["mid"],
-                    row["title"],
-                    int((row["mid"], row["title"]) in primaryLUT),
-                    int(bool(row["isOriginalTitle"]) or ((row["mid"], row["title"]) in originalLUT))
-                ))
-                insert_from_titles += 1
-            except sqlite3.IntegrityError as e:
-                # Skip invalid rows
-                failure_from_titles += 1
-
-        insert_from_movies = 0
-        failure_from_movies = 0
+        # lookup tables des couples (film, titre) de chaque fichier, dans des tables temporaires
+        # où chaque morceau de l'autre fichier cherche les couples de ses films
+        stage_csv(conn, "movies_csv", "movies.csv", {"mid": "mid", "primaryTitle": "primary_title", "originalTitle": "original_title"})
+        stage_csv(conn, "titles_csv", "titles.csv", {"mid": "mid", "title": "title"})
+
+        for titlesDf in progress.chunks("titles.csv", usecols=["mid", "title", "isOriginalTitle"]):
+            moviesInfo = select_in(
+                conn, "SELECT mid, primary_title, original_title FROM temp.movies_csv WHERE mid IN ({})",
+                titlesDf["mid"].dropna().unique()
+            )
+            primaryLUT = pd.MultiIndex.from_arrays([moviesInfo["mid"], moviesInfo["primary_title"].astype("str")])
+            originalLUT = pd.MultiIndex.from_arrays([moviesInfo["mid"], moviesInfo["original_title"].astype("str")])
+            titlesLUT = pd.MultiIndex.from_arrays([titlesDf["mid"], titlesDf["title"]])
+
+            inserted, failed = insert_rows(conn, f"""
+                INSERT OR IGNORE INTO {table} (movie_id, title_id, is_primary, is_original)
+                VALUES (?, ?, ?, ?)
+            """, pd.DataFrame({
+                "movie_id": titlesDf["mid"],
+                "title_id": lookup(conn, titlesDf["title"], "titles", "title_id", "title_name"),
+                "is_primary": titlesLUT.isin(primaryLUT).astype(int),
+                "is_original": (titlesDf["isOriginalTitle"].astype(bool) | titlesLUT.isin(originalLUT)).astype(int),
+            }))
+            insert_from_titles += inserted
+            failure_from_titles += failed
+
         # populate with the titles in movies as well for completeness
-        for _, row in moviesDf.iterrows():
-            try:
-                # store in variables to avoid looking up multiple times
-                mid = row["mid"]
-                # skip NaN or empty strings
-                originalTitle = row["originalTitle"] if pd.notna(row["originalTitle"]) and row["originalTitle"] != "" else None
-                primaryTitle  = row["primaryTitle"]  if pd.notna(row["primaryTitle"])  and row["primaryTitle"]  != "" else None
-
-
-                # No need to update existing values, as boolean fields are already completed
-                insertOriginal = False if (originalTitle is not None) and (mid, originalTitle) in titlesLUT else True
-                insertPrimary = False if (primaryTitle is not None) and (mid, primaryTitle) in titlesLUT else True
-
-                # Si les titres sont les mêmes, on insère une seule fois 
-                if insertOriginal and insertPrimary and originalTitle == primaryTitle:
-                    c.execute("""
-                        INSERT INTO movie_titles (movie_id, title_id, is_original, is_primary)
-                        VALUES (?, 
-                            (SELECT title_id FROM titles WHERE title_name = ? COLLATE NOCASE),
-                            1, 1)
-                    """, (
-                        mid,
-                        originalTitle
-                    ))
-
-                    insert_from_movies += 1
-                    continue
-                if insertOriginal:
-                    c.execute("""
-                        INSERT INTO movie_titles (movie_id, title_id, is_original, is_primary)
-                        VALUES (?, 
-                            (SELECT title_id FROM titles WHERE title_name = ? COLLATE NOCASE),
-                            1, 0)
-                    """, (
-                        mid,
-                        originalTitle
-                    ))
-                    insert_from_movies += 1
-                if insertPrimary:
-                    c.execute("""
-                    INSERT INTO movie_titles (movie_id, title_id, is_original, is_primary)
-                        VALUES (?, 
-                            (SELECT title_id FROM titles WHERE title_name = ? COLLATE NOCASE),
-                            0, 1)
-                """, (
-                    mid,
-                    primaryTitle
-                ))
-                    insert_from_movies += 1
-            except sqlite3.IntegrityError as e:
-                # Skip invalid rows
-                failure_from_movies += 1
+        for moviesDf in progress.chunks("movies.csv", usecols=["mid", "primaryTitle", "originalTitle"]):
+            # skip NaN or empty strings
+            mid = moviesDf["mid"]
+            originalTitle = text_or_none(moviesDf["originalTitle"])
+            primaryTitle = text_or_none(moviesDf["primaryTitle"])
+
+            titlesInfo = select_in(conn, "SELECT mid, title FROM temp.titles_csv WHERE mid IN ({})", mid.dropna().unique())
+            titlesLUT = pd.MultiIndex.from_arrays([titlesInfo["mid"], titlesInfo["title"].astype("str")])
+
+            # No need to update existing values, as boolean fields are already completed
+            insertOriginal = originalTitle.isna() | ~pd.MultiIndex.from_arrays([mid, originalTitle]).isin(titlesLUT)
+            insertPrimary = primaryTitle.isna() | ~pd.MultiIndex.from_arrays([mid, primaryTitle]).isin(titlesLUT)
+
+            # Si les titres sont les mêmes, on insère une seule fois
+            same = insertOriginal & insertPrimary & (
+                (originalTitle == primaryTitle) | (originalTitle.isna() & primaryTitle.isna())
+            )
+
+            # pour chaque film, le titre original puis le titre primaire
+            originalRows = pd.DataFrame({
+                "movie_id": mid,
+                "title_id": lookup(conn, originalTitle, "titles", "title_id", "title_name"),
+                "is_original": 1,
+                "is_primary": same.astype(int),
+                "step": 0,
+            })[insertOriginal]
+            primaryRows = pd.DataFrame({
+                "movie_id": mid,
+                "title_id": lookup(conn, primaryTitle, "titles", "title_id", "title_name"),
+                "is_original": 0,
+                "is_primary": 1,
+                "step": 1,
+            })[insertPrimary & ~same]
+            moviesRows = pd.concat([originalRows, primaryRows]).rename_axis("pos").sort_values(["pos", "step"])
+
+            # Un titre déjà présent pour le film fait échouer l'insertion du titre original,
+            # et dans ce cas le titre primaire n'était pas tenté
+            existing = select_in(
+                conn, f"SELECT movie_id, title_id FROM {table} WHERE title_id IS NOT NULL AND movie_id IN ({{}})",
+                mid.dropna().unique()
+            ).astype({"title_id": "Int64"})
+            keys = pd.MultiIndex.from_frame(moviesRows[["movie_id", "title_id"]])
+            conflict = moviesRows["title_id"].notna() & (
+                keys.isin(pd.MultiIndex.from_frame(existing)) | keys.duplicated()
+            )
+            failedOriginal = moviesRows.index[conflict & (moviesRows["step"] == 0)]
+            moviesRows = moviesRows[~((moviesRows["step"] == 1) & moviesRows.index.isin(failedOriginal))]
+
+            inserted, failed = insert_rows(conn, f"""
+                INSERT OR IGNORE INTO {table} (movie_id, title_id, is_original, is_primary)
+                VALUES (?, ?, ?, ?)
+            """, moviesRows[["movie_id", "title_id", "is_original", "is_primary"]])
+            insert_from_movies += inserted
+            failure_from_movies += failed
+
+        conn.execute("DROP TABLE temp.movies_csv")
+        conn.execute("DROP TABLE temp.titles_csv")
+
+        c = conn.cursor()
 
         #----------Nettoyage----------
 
         # Si plusieurs titres primaires ou secondaires: en garder 1 seul
-        c.execute("""
-            UPDATE movie_titles
+        c.execute(f"""
+            UPDATE {table}
             SET is_primary = 0
             WHERE rowid NOT IN (
                 SELECT MIN(rowid)
-                FROM movie_titles
+                FROM {table}
                 WHERE is_primary = 1
                 GROUP BY movie_id
             )
             AND is_primary = 1;
         """)
 
-        c.execute("""
-            UPDATE movie_titles
+        c.execute(f"""
+            UPDATE {table}
             SET is_original = 0
             WHERE rowid NOT IN (
                 SELECT MIN(rowid)
-                FROM movie_titles
+                FROM {table}
                 WHERE is_original = 1
                 GROUP BY movie_id
             )
@@ -550,31 +832,31 @@ def import_movie_title(conn):
         """)
 
         # Si une seule des deux valeurs manquante: garder la deuxième
-        c.execute("""
-            UPDATE movie_titles
+        c.execute(f"""
+            UPDATE {table}
             SET is_original = 1
             WHERE rowid IN (
                 SELECT mt1.rowid
-                FROM movie_titles mt1
+                FROM {table} mt1
                 WHERE mt1.is_primary = 1
                 AND mt1.movie_id IN (
                     SELECT movie_id
-                    FROM movie_titles
+                    FROM {table}
                     GROUP BY movie_id
                     HAVING SUM(is_original) = 0
                 )
             );
         """)
-        c.execute("""
-            UPDATE movie_titles
+        c.execute(f"""
+            UPDATE {table}
             SET is_primary = 1
             WHERE rowid IN (
                 SELECT mt1.rowid
-                FROM movie_titles mt1
+                FROM {table} mt1
                 WHERE mt1.is_original = 1
                 AND mt1.movie_id IN (
                     SELECT movie_id
-                    FROM movie_titles
+                    FROM {table}
                     GROUP BY movie_id
                     HAVING SUM(is_primary) = 0
                 )
@@ -582,16 +864,16 @@ def import_movie_title(conn):
         """)
 
         # Si les deux valeurs manquantes: prendre un titre au hasard
-        c.execute("""
-            UPDATE movie_titles
+        c.execute(f"""
+            UPDATE {table}
             SET is_primary = 1,
                 is_original = 1
             WHERE rowid IN (
                 SELECT rowid
-                FROM movie_titles
+                FROM {table}
                 WHERE movie_id IN (
                     SELECT movie_id
-                    FROM movie_titles
+                    FROM {table}
                     GROUP BY movie_id
                     HAVING SUM(is_primary) = 0 AND SUM(is_original) = 0
                 )
@@ -599,6 +881,7 @@ def import_movie_title(conn):
             );
         """)
 
+        progress.finish()
         conn.commit()
         print("Transaction " + TRANSAC_NAME + " terminée avec succès: ")
 
@@ -607,119 +890,639 @@ def import_movie_title(conn):
         
         print("\nLignes insérées depuis movies.csv: ", insert_from_movies)
         print("Lignes abandonnées depuis movies.csv: ", failure_from_movies)
+        return True
 
     except sqlite3.Error as e:
         conn.rollback()
         print("!!! TRANSACTION Echouée !!!:\n", e)
+        return False
 
 # Depends on movie_titles
-def import_title_ordering(conn):
+def import_title_ordering(conn, table="title_ordering"):
     TRANSAC_NAME = "title_ordering"
     insert_cnt = 0
     failure_cnt = 0
 
-    c = conn.cursor()
-    titlesDf = pd.read_csv(CSV_REPO + "titles.csv")
-
     try:
         print("--------------TRANSACTION " + TRANSAC_NAME + "--------------")
+        progress = Progress(conn, table)
+        if progress.finished:
+            print("Transaction " + TRANSAC_NAME + " déjà terminée, ignorée (--resume)")
+            return True
         conn.execute("BEGIN TRANSACTION")
 
-        for _, row in titlesDf.iterrows():
-            try:
-                c.execute("""
-                    INSERT INTO title_ordering (movie_id, title_id, ordering, region, language, types, attributes)
-                    VALUES (?, 
-                        (SELECT title_id FROM titles WHERE title_name = ? COLLATE NOCASE),
-                        ?, ?, ?, ?, ?)
-                """, (
-                    row["mid"],
-                    row["title"],
-                    row["ordering"],
-                    row["region"] if not pd.isna(row["region"]) and not row["region"] == "" else None,
-                    row["language"] if not pd.isna(row["language"]) and not row["language"] == "" else None,
-                    row["types"] if not pd.isna(row["types"]) and not row["types"] == "" else None,
-                    row["attributes"] if not pd.isna(row["attributes"]) and not row["attributes"] == "" else None
-                ))
-                insert_cnt += 1
-            except sqlite3.IntegrityError as e:
-                # Skip invalid rows
-                failure_cnt += 1
-
+        for titlesDf in progress.chunks("titles.csv", usecols=["mid", "title", "ordering", "region", "language", "types", "attributes"]):
+            inserted, failed = insert_rows(conn, f"""
+                INSERT OR IGNORE INTO {table} (movie_id, title_id, ordering, region, language, types, attributes)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, pd.DataFrame({
+                "movie_id": titlesDf["mid"],
+                "title_id": lookup(conn, titlesDf["title"], "titles", "title_id", "title_name"),
+                "ordering": titlesDf["ordering"],
+                "region": text_or_none(titlesDf["region"]),
+                "language": text_or_none(titlesDf["language"]),
+                "types": text_or_none(titlesDf["types"]),
+                "attributes": text_or_none(titlesDf["attributes"]),
+            }))
+            insert_cnt += inserted
+            failure_cnt += failed
+
+        progress.finish()
         conn.commit()
         print("Transaction " + TRANSAC_NAME + " terminée avec succès: ")
         print("Lignes insérées: ", insert_cnt)
         print("Lignes abandonnées: ", failure_cnt)
+        return True
 
     except sqlite3.Error as e:
         conn.rollback()
         print("!!! TRANSACTION Echouée !!!:\n", e)
+        return False
 
 # Depends on movies, persons and professions
-def import_principals(conn):
+def import_principals(conn, table="principals"):
     TRANSAC_NAME = "principals"
     insert_cnt = 0
     failure_cnt = 0
 
-    c = conn.cursor()
-    principalsDf = pd.read_csv(CSV_REPO + "principals.csv")
-
     try:
         print("--------------TRANSACTION " + TRANSAC_NAME + "--------------")
+        progress = Progress(conn, table)
+        if progress.finished:
+            print("Transaction " + TRANSAC_NAME + " déjà terminée, ignorée (--resume)")
+            return True
         conn.execute("BEGIN TRANSACTION")
 
-        for _, row in principalsDf.iterrows():
-            try:
-                c.execute("""
-                    INSERT INTO principals (movie_id, ordering, person_id, profession_id, job)
-                    VALUES (?, ?, ?,
-                        (SELECT profession_id FROM professions WHERE job_name = ? COLLATE NOCASE LIMIT 1),
-                    ?)
-                """, (
-                    row["mid"],
-                    row["ordering"],
-                    row["pid"],
-                    row["category"] if not pd.isna(row["category"]) and not row["category"] == "" else None,
-                    row["job"] if not pd.isna(row["job"]) and not row["job"] == "" else None
-                ))
-                insert_cnt += 1
-            except sqlite3.IntegrityError as e:
-                # Skip invalid rows
-                failure_cnt += 1
-
+        for principalsDf in progress.chunks("principals.csv", usecols=["mid", "ordering", "pid", "category", "job"]):
+            inserted, failed = insert_rows(conn, f"""
+                INSERT OR IGNORE INTO {table} (movie_id, ordering, person_id, profession_id, job)
+                VALUES (?, ?, ?, ?, ?)
+            """, pd.DataFrame({
+                "movie_id": principalsDf["mid"],
+                "ordering": principalsDf["ordering"],
+                "person_id": principalsDf["pid"],
+                "profession_id": lookup(conn, text_or_none(principalsDf["category"]), "professions", "profession_id", "job_name"),
+                "job": text_or_none(principalsDf["job"]),
+            }))
+            insert_cnt += inserted
+            failure_cnt += failed
+
+        progress.finish()
         conn.commit()
         print("Transaction " + TRANSAC_NAME + " terminée avec succès: ")
         print("Lignes insérées: ", insert_cnt)
         print("Lignes abandonnées: ", failure_cnt)
+        return True
 
     except sqlite3.Error as e:
         conn.rollback()
         print("!!! TRANSACTION Echouée !!!:\n", e)
+        return False
+
+
+#----------Graphe des tables----------
+
+# table -> (importeur, tables dont elle dépend), dans l'ordre de l'import en série
+TABLES = {
+    "movies": (import_movies, []),
+    "persons": (import_persons, []),
+    "genres": (import_genres, []),
+    "characters": (import_characters, []),
+    "professions": (import_professions, []),
+    "titles": (import_titles, []),
+    "ratings": (import_ratings, ["movies"]),
+    "movie_genres": (import_movie_genres, ["movies", "genres"]),
+    "movie_titles": (import_movie_title, ["movies", "titles"]),
+    "person_profession": (import_person_profession, ["persons", "professions"]),
+    "title_ordering": (import_title_ordering, ["movie_titles"]),
+    "known_for_movies": (import_knownformovies, ["persons", "movies"]),
+    "cast": (import_cast, ["movies", "persons", "characters"]),
+    "principals": (import_principals, ["movies", "persons", "professions"]),
+}
+
+# tables de noms, dont les ids sont référencés par les autres tables
+NAME_TABLES = ["genres", "characters", "professions", "titles"]
+
+#----------Import différentiel (--delta)----------
+
+# tables rechargées par --delta, dans l'ordre de l'import.
+# Les tables de noms sont seulement complétées: les ids déjà attribués restent ceux
+# référencés par les autres tables.
+DELTA_TABLES = [(table, importer) for table, (importer, _) in TABLES.items() if table not in NAME_TABLES]
+
+def create_change_log(conn):
+    """
+    Journal des lignes modifiées par chaque --delta, identifié par la version du jeu de données
+    qu'il produit: les caches, les tables dérivées et movies_complete n'ont à rafraîchir
+    que les films (et personnes) qui y figurent.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            version VARCHAR(32) NOT NULL,
+            table_name VARCHAR(30) NOT NULL,
+            operation VARCHAR(6) NOT NULL,
+            movie_id VARCHAR(20),
+            person_id VARCHAR(20),
+
+            CHECK(operation IN ('insert', 'update', 'delete'))
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_change_log_version ON change_log(version, movie_id)")
+    conn.commit()
+
+def create_stage(conn, table):
+    """
+    Crée temp.delta_<table>, avec les colonnes et contraintes de 'table', où son importeur
+    charge le nouvel instantané: les lignes rejetées sont les mêmes qu'à un import complet.
+    """
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+    conn.execute(f"DROP TABLE IF EXISTS temp.delta_{table}")
+    conn.execute(re.sub(r"^\s*CREATE TABLE\s+\w+", f"CREATE TEMP TABLE delta_{table}", sql))
+
+def hash_rows(df):
+    """
+    Empreintes 64 bits (signées, pour SQLite) des lignes de 'df', calculées sur le texte des valeurs
+    lues de SQLite: un entier a la même empreinte qu'il soit lu avec ou sans valeurs manquantes.
+    """
+    return pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy().view(np.int64)
+
+def hash_table(conn, source, name, key_columns):
+    """
+    Remplit la table temporaire 'name' (row_id, key, hash, n) des empreintes des lignes de 'source',
+    lues par lots de BATCH_SIZE: 'key' celle de la clé primaire 'key_columns', 'hash' celle de la ligne,
+    'n' le rang de la ligne parmi ses copies identiques (une clé primaire à NULL n'empêche pas les doublons).
+    """
+    conn.execute(f"DROP TABLE IF EXISTS temp.{name}_raw")
+    conn.execute(f"CREATE TEMP TABLE {name}_raw (row_id INTEGER PRIMARY KEY, key INTEGER, hash INTEGER)")
+    last = 0
+    while True:
+        cur = conn.execute(f"SELECT rowid AS row_id, * FROM {source} WHERE rowid > ? ORDER BY rowid LIMIT ?", (last, BATCH_SIZE))
+        rows = cur.fetchall()
+        if not rows:
+            break
+        df = pd.DataFrame(rows, columns=[d[0] for d in cur.description], dtype=object)
+        conn.executemany(
+            f"INSERT INTO temp.{name}_raw VALUES (?, ?, ?)",
+            zip(df["row_id"].tolist(), hash_rows(df[key_columns]).tolist(), hash_rows(df.drop(columns="row_id")).tolist())
+        )
+        last = rows[-1][0]
+
+    conn.execute(f"DROP TABLE IF EXISTS temp.{name}")
+    conn.execute(f"""
+        CREATE TEMP TABLE {name} AS
+        SELECT row_id, key, hash, ROW_NUMBER() OVER (PARTITION BY hash ORDER BY row_id) AS n
+        FROM temp.{name}_raw
+    """)
+    conn.execute(f"DROP TABLE temp.{name}_raw")
+    conn.execute(f"CREATE INDEX temp.{name}_hash ON {name}(hash, n)")
+    conn.commit()
+
+def apply_delta(conn, table, version):
+    """
+    Compare 'table' au nouvel instantané de temp.delta_<table> par les empreintes de leurs lignes,
+    puis, en une transaction, supprime les lignes disparues ou modifiées, insère les lignes
+    nouvelles ou modifiées et les inscrit dans change_log.
+    Une ligne supprimée et une ligne insérée de même clé primaire sont une modification.
+    Retourne {opération: lignes}.
+    """
+    columns = [r[1] for r in conn.execute(f"SELECT * FROM pragma_table_info('{table}')")]
+    key_columns = [r[1] for r in sorted(conn.execute(f"SELECT * FROM pragma_table_info('{table}') WHERE pk > 0"), key=lambda r: r[5])]
+    hash_table(conn, f'main."{table}"', "old_rows", key_columns)
+    hash_table(conn, f"temp.delta_{table}", "new_rows", key_columns)
+
+    for name, rows, other in [("removed", "old_rows", "new_rows"), ("added", "new_rows", "old_rows")]:
+        conn.execute(f"DROP TABLE IF EXISTS temp.{name}")
+        conn.execute(f"""
+            CREATE TEMP TABLE {name} AS
+            SELECT row_id, key FROM temp.{rows} r
+            WHERE NOT EXISTS (SELECT 1 FROM temp.{other} o WHERE o.hash = r.hash AND o.n = r.n)
+        """)
+        conn.execute(f"CREATE INDEX temp.{name}_key ON {name}(key)")
+
+    movie = "t.movie_id" if "movie_id" in columns else "NULL"
+    person = "t.person_id" if "person_id" in columns else "NULL"
+    cols = ", ".join(columns)
 
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        # les lignes supprimées sont journalisées avant de disparaître, les insérées avec leurs nouvelles valeurs
+        conn.execute(f"""
+            INSERT INTO change_log (version, table_name, operation, movie_id, person_id)
+            SELECT ?, ?, 'delete', {movie}, {person}
+            FROM temp.removed r JOIN main."{table}" t ON t.rowid = r.row_id
+            WHERE r.key NOT IN (SELECT key FROM temp.added)
+        """, (version, table))
+        conn.execute(f"""
+            INSERT INTO change_log (version, table_name, operation, movie_id, person_id)
+            SELECT ?, ?, CASE WHEN a.key IN (SELECT key FROM temp.removed) THEN 'update' ELSE 'insert' END,
+                {movie}, {person}
+            FROM temp.added a JOIN temp.delta_{table} t ON t.rowid = a.row_id
+        """, (version, table))
+        counts = dict(conn.execute("""
+            SELECT operation, COUNT(*) FROM change_log
+            WHERE version = ? AND table_name = ?
+            GROUP BY operation
+        """, (version, table)).fetchall())
+
+        conn.execute(f'DELETE FROM main."{table}" WHERE rowid IN (SELECT row_id FROM temp.removed)')
+        conn.execute(f"""
+            INSERT INTO main."{table}" ({cols})
+            SELECT {cols} FROM temp.delta_{table}
+            WHERE rowid IN (SELECT row_id FROM temp.added)
+            ORDER BY rowid
+        """)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        for name in ["old_rows", "new_rows", "removed", "added"]:
+            conn.execute(f"DROP TABLE IF EXISTS temp.{name}")
+    return counts
+
+def delta_table(conn, table, importer, version):
+    """
+    Charge le nouvel instantané de 'table' avec son importeur, puis n'applique que les différences.
+    La table reste inchangée si le chargement échoue.
+    """
+    create_stage(conn, table)
+    try:
+        if not importer(conn, "temp.delta_" + table):
+            print("Table " + table + " inchangée")
+            return
+
+        print("--------------DELTA " + table + "--------------")
+        try:
+            counts = apply_delta(conn, table, version)
+        except sqlite3.Error as e:
+            print("!!! DELTA Echoué, table inchangée !!!:\n", e)
+            return
+        print("Lignes ajoutées: ", counts.get("insert", 0))
+        print("Lignes modifiées: ", counts.get("update", 0))
+        print("Lignes supprimées: ", counts.get("delete", 0))
+    finally:
+        conn.execute(f"DROP TABLE IF EXISTS temp.delta_{table}")
+
+#----------Phases de l'import----------
+
+def reset_peak_rss():
+    """
+    Remet à zéro le pic de mémoire résidente du processus (Linux seulement).
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def peak_rss():
+    """
+    Pic de mémoire résidente du processus depuis reset_peak_rss(), en octets,
+    None hors de Linux.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def format_phase(name):
+    seconds, rss = PHASES[name]
+    return name + ": " + str(round(seconds, 2)) + " secondes, pic mémoire: " + (
+        str(round(rss / 1024 ** 2)) + " Mo" if rss is not None else "inconnu"
+    )
+
+@contextmanager
+def phase(name):
+    """
+    Mesure la durée et le pic de mémoire du bloc, et les enregistre dans PHASES.
+    """
+    reset_peak_rss()
+    t_ini = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASES[name] = (time.perf_counter() - t_ini, peak_rss())
+        print(format_phase(name))
+
+def timed(func, *args):
+    with phase(func.__name__):
+        return func(*args)
+
+# --fast-load: ni journal ni fsync pendant le chargement
+def start_fast_load(conn):
+    """
+    Désactive le journal et la synchronisation, puis supprime les index secondaires
+    (ceux de index.py et des tables dérivées), mis à jour sinon à chaque insertion.
+    Retourne le SQL des index supprimés, pour les recréer après le chargement.
+    """
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+
+    # les index automatiques des PRIMARY KEY et UNIQUE n'ont pas de SQL
+    indexes = conn.execute("""
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND sql IS NOT NULL
+    """).fetchall()
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX {name}")
+    conn.commit()
+    print("Index secondaires supprimés: ", len(indexes))
+    return [sql for _, sql in indexes]
+
+def recreate_indexes(conn, indexes):
+    for sql in indexes:
+        conn.execute(sql)
+    conn.commit()
+    print("Index secondaires recréés: ", len(indexes))
+
+def check_database(conn):
+    """
+    Vérifie en une passe, après le chargement, l'intégrité du fichier
+    et les clés étrangères, qui ne sont pas contrôlées pendant l'import.
+    Retourne False si l'une des vérifications trouve des erreurs.
+    """
+    errors = [r[0] for r in conn.execute("PRAGMA integrity_check")]
+    print("Intégrité: ", "ok" if errors == ["ok"] else errors)
+
+    violations = conn.execute("""
+        SELECT "table", parent, COUNT(*)
+        FROM pragma_foreign_key_check
+        GROUP BY "table", parent
+    """).fetchall()
+    for table, parent, cnt in violations:
+        print("Clés étrangères invalides " + table + " -> " + parent + ": ", cnt)
+    if not violations:
+        print("Clés étrangères: ok")
+    return errors == ["ok"] and not violations
+
+def optimize(conn):
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+    conn.commit()
+
+def set_memory_budget(budget):
+    """
+    Fixe MEMORY_BUDGET, et la taille des blocs des dumps IMDb qui en découle.
+    """
+    global MEMORY_BUDGET
+    MEMORY_BUDGET = budget
+    if IMDB_DUMPS is not None:
+        # chaque bloc en cours de lecture occupe environ CHUNK_OVERHEAD fois sa taille une fois transformé
+        IMDB_DUMPS.block_bytes = max(MEMORY_BUDGET // (CHUNK_OVERHEAD * IMDB_DUMPS.in_flight), 64 * 1024)
+
+#----------Import parallèle (--jobs)----------
+
+# secondes entre deux lignes de progression
+PROGRESS_INTERVAL = 2
+# attente maximale d'un processus de travail lisant imdb.db pendant une fusion, en secondes
+LOCK_TIMEOUT = 3600
+
+def part_path(table):
+    """
+    Fichier où un processus de travail importe 'table' avant sa fusion dans imdb.db.
+    """
+    return DB_PATH + "." + table + ".part"
+
+def import_part(table, options, events):
+    """
+    Processus de travail: importe 'table' dans part_path(table), où imdb.db est attachée
+    pour lire les ids des tables déjà fusionnées, et signale dans 'events' les lignes écrites
+    puis ("done", table, succès, durée, pic mémoire).
+    """
+    global IMDB_DUMPS, PROGRESS, CHECKPOINTS
+    IMDB_DUMPS = options["imdb_dumps"]
+    CHECKPOINTS = False
+    set_memory_budget(options["memory_budget"])
+    PROGRESS = lambda rows: events.put(("rows", table, rows))
+
+    importer = TABLES[table][0]
+    ok = False
+    conn = sqlite3.connect(part_path(table), timeout=LOCK_TIMEOUT)
+    try:
+        # un fichier temporaire: ni journal ni fsync
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        # les noms sans schéma sont cherchés dans main puis dans src: seule la table importée est dans main
+        conn.execute("ATTACH DATABASE ? AS src", (DB_PATH,))
+        sql = conn.execute("SELECT sql FROM src.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+        conn.execute(sql)
+        with phase(importer.__name__):
+            ok = importer(conn)
+    except Exception:
+        traceback.print_exc()
+    finally:
+        conn.close()
+        seconds, rss = PHASES.get(importer.__name__, (0, None))
+        events.put(("done", table, ok, seconds, rss))
+
+def merge_part(conn, table):
+    """
+    Copie la table importée dans part_path(table) dans imdb.db, et la marque terminée
+    dans import_progress, en une transaction.
+    """
+    conn.execute("ATTACH DATABASE ? AS part", (part_path(table),))
+    try:
+        conn.execute("BEGIN TRANSACTION")
+        conn.execute(f'INSERT INTO main."{table}" SELECT * FROM part."{table}" ORDER BY rowid')
+        save_progress(conn, table, 0, 0, True)
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        conn.rollback()
+        print("!!! FUSION " + table + " Echouée !!!:\n", e)
+        return False
+    finally:
+        conn.execute("DETACH DATABASE part")
+
+def format_rate(rows, seconds):
+    return str(rows) + " lignes (" + str(round(rows / max(seconds, 1e-9))) + " lignes/s)"
+
+def run_parallel(conn, jobs):
+    """
+    Importe les tables de TABLES dans au plus 'jobs' processus de travail, chacune dès que
+    les tables dont elle dépend sont fusionnées, et dans son propre fichier: le processus
+    principal, seul à écrire dans imdb.db, fusionne chaque fichier terminé avec ATTACH.
+    Affiche toutes les PROGRESS_INTERVAL secondes les lignes écrites et le débit des tables en cours.
+    Avec --resume, les tables déjà terminées ne sont pas réimportées.
+    """
+    finished = {r[0] for r in conn.execute("SELECT table_name FROM import_progress WHERE finished = 1")}
+    for table in TABLES:
+        if table not in finished and conn.execute(f'SELECT 1 FROM "{table}" LIMIT 1').fetchone():
+            raise ValueError(
+                "--jobs importe dans une base vide (create_schema.py), ou reprend sans --jobs, table non vide: " + table
+            )
+
+    ctx = mp.get_context()
+    events = ctx.Queue()
+    options = {"imdb_dumps": IMDB_DUMPS, "memory_budget": MEMORY_BUDGET // jobs}
+    if finished:
+        print("Tables déjà terminées, ignorées (--resume): " + ", ".join(t for t in TABLES if t in finished))
+    waiting = {table: deps for table, (_, deps) in TABLES.items() if table not in finished}
+    merged = set(finished)
+    running = {}  # table -> (processus, début)
+    rows = {}
+    last_report = time.perf_counter()
+
+    try:
+        while waiting or running:
+            for table in [t for t, deps in waiting.items() if merged.issuperset(deps)][:jobs - len(running)]:
+                del waiting[table]
+                if os.path.exists(part_path(table)):
+                    os.remove(part_path(table))
+                process = ctx.Process(target=import_part, args=(table, options, events))
+                process.start()
+                running[table] = (process, time.perf_counter())
+                rows[table] = 0
+            if not running:
+                raise ValueError("dépendances circulaires entre les tables: " + ", ".join(waiting))
+
+            try:
+                event = events.get(timeout=PROGRESS_INTERVAL)
+            except queue.Empty:
+                event = None
+                # un processus tué (mémoire...) ne signale pas sa fin
+                for table, (process, start) in list(running.items()):
+                    if process.exitcode not in (None, 0):
+                        event = ("done", table, False, time.perf_counter() - start, None)
+                        break
+
+            if event is not None and event[0] == "rows":
+                rows[event[1]] += event[2]
+            elif event is not None:
+                _, table, ok, seconds, rss = event
+                process, start = running.pop(table)
+                process.join()
+                PHASES[TABLES[table][0].__name__] = (seconds, rss)
+                print(table + " importée: " + format_rate(rows[table], seconds))
+                if ok:
+                    with phase("fusion " + table):
+                        merge_part(conn, table)
+                else:
+                    print("Table " + table + " non fusionnée")
+                os.remove(part_path(table))
+                merged.add(table)
+
+            if running and time.perf_counter() - last_report >= PROGRESS_INTERVAL:
+                now = time.perf_counter()
+                print("progression: " + ", ".join(
+                    table + " " + format_rate(rows[table], now - start) for table, (_, start) in running.items()
+                ), flush=True)
+                last_report = now
+    finally:
+        for table, (process, _) in running.items():
+            process.terminate()
+            process.join()
+            if os.path.exists(part_path(table)):
+                os.remove(part_path(table))
+
+# les processus de lecture des dumps importent ce module: le chargement ne doit pas s'y relancer
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importe les CSV de data/csv, ou les dumps IMDb, dans imdb.db")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--fast-load", action="store_true",
+        help="charge sans journal ni fsync, et recrée les index secondaires à la fin "
+             "(en cas d'échec, la base doit être recréée avec create_schema.py)"
+    )
+    mode.add_argument(
+        "--resume", action="store_true",
+        help="reprend l'import interrompu depuis ses derniers points de reprise: les tables terminées "
+             "sont ignorées, les autres reprennent à la dernière ligne validée"
+    )
+    mode.add_argument(
+        "--delta", action="store_true",
+        help="met à jour une base déjà importée avec un nouvel instantané: seules les lignes "
+             "ajoutées, modifiées ou supprimées sont écrites, et inscrites dans change_log"
+    )
+    parser.add_argument(
+        "--memory-budget", type=int, default=MEMORY_BUDGET // 1024 ** 2,
+        help="mémoire en Mo des morceaux de CSV lus à la fois (%(default)s par défaut)"
+    )
+    parser.add_argument(
+        "--imdb-dir",
+        help="répertoire des dumps .tsv.gz d'IMDb (title.basics, title.akas, title.principals, "
+             "name.basics, title.ratings), lus à la place de data/csv"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="processus de lecture des dumps avec --imdb-dir (un de moins que de CPU par défaut)"
+    )
+    parser.add_argument(
+        "--title-types", default=",".join(TITLE_TYPES),
+        help="types de titres gardés des dumps avec --imdb-dir (%(default)s par défaut)"
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=1,
+        help="processus important en parallèle les tables indépendantes, dans une base vide "
+             "(1 par défaut: import en série); le budget mémoire est partagé entre eux"
+    )
+    parser.add_argument(
+        "--checkpoint-rows", type=int, default=CHECKPOINT_ROWS,
+        help="lignes lues entre deux validations de chaque import (%(default)s par défaut)"
+    )
+    args = parser.parse_args()
+    CHECKPOINT_ROWS = args.checkpoint_rows
+    RESUME = args.resume
+    if args.jobs > 1 and args.delta:
+        parser.error("--jobs ne s'utilise pas avec --delta")
+
+    if args.imdb_dir:
+        IMDB_DUMPS = ImdbDumps(args.imdb_dir, workers=args.workers, title_types=args.title_types.split(","))
+    set_memory_budget(args.memory_budget * 1024 ** 2)
+
+    t_ini = time.perf_counter()
+    with sqlite3.connect(DB_PATH) as conn:
+        if args.fast_load:
+            with phase("préparation"):
+                indexes = start_fast_load(conn)
+
+        create_progress(conn)
+
+        version = uuid.uuid4().hex
+        if args.delta:
+            create_change_log(conn)
+
+            # nouveaux noms seulement
+            for table in NAME_TABLES:
+                timed(TABLES[table][0], conn)
+
+            for table, importer in DELTA_TABLES:
+                with phase("delta " + table):
+                    delta_table(conn, table, importer, version)
+        elif args.jobs > 1:
+            run_parallel(conn, args.jobs)
+        else:
+            for importer, _ in TABLES.values():
+                timed(importer, conn)
+
+        if args.fast_load:
+            with phase("index"):
+                recreate_indexes(conn, indexes)
+            with phase("vérifications"):
+                checked = check_database(conn)
+            # sans journal ni fsync, rien d'autre ne signale une base corrompue
+            if not checked:
+                sys.exit("Base invalide après --fast-load: " + DB_PATH)
+            with phase("analyse"):
+                optimize(conn)
+
+        store_data_version(conn, version)
+        conn.commit()
 
-with sqlite3.connect(DB_PATH) as conn:
-    # No dependencies
-    import_movies(conn)
-    import_persons(conn)
-    import_genres(conn)
-    import_characters(conn)
-    import_professions(conn)
-    import_titles(conn)
-
-    # depends on movies
-    import_ratings(conn)
-
-    # depends on movies and genres
-    import_movie_genres(conn)
-    # depends on movies and titles
-    import_movie_title(conn)
-    # depends on persons and professions
-    import_person_profession(conn)
-
-    # depends on movie_titles
-    import_title_ordering(conn)
-
-    # depends on persons, movies, professions and characters
-    import_knownformovies(conn)
-    import_cast(conn)
-    import_principals(conn)
+    # Refresh the stats precomputed for the web app once the data is loaded
+    # (only for the database of the web app: the command writes to settings.IMDB_DB_PATH)
+    with phase("refresh_stats"):
+        if os.path.abspath(DB_PATH) == os.path.join(ROOT_DIR, "data", "imdb.db"):
+            subprocess.run([sys.executable, "manage.py", "refresh_stats"], cwd=ROOT_DIR, check=True)
+        else:
+            print("refresh_stats non lancé: ", os.path.abspath(DB_PATH), "n'est pas la base de l'application web")
+
+    print("--------------DURÉES--------------")
+    for name in PHASES:
+        print(format_phase(name))
+    print("total: ", round(time.perf_counter() - t_ini, 2), "secondes.")
@@ -25,3 +25,8 @@ with sqlite3.connect("../../data/imdb.db") as conn:
         CREATE INDEX IF NOT EXISTS idx_pe_name
         ON persons(name);
     """)
+
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_mg_genre
+        ON movie_genres(genre_id, movie_id);
+    """)
@@ -0,0 +1,133 @@
+import os
+import re
+import sqlite3
+import sys
+import unicodedata
+
+# movies.services.dataset, shared with the web app
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from movies.services.dataset import store_data_version
+
+BATCH_SIZE = 10000
+
+def name_trigrams(name: str) -> set:
+    """
+    Returns the trigrams of a person name, the same way as movies/services/sqlite_service.py:
+    diacritics removed, lower case, each word padded with two spaces before and one after.
+    """
+    folded = unicodedata.normalize("NFKD", name)
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch)).lower()
+    trigrams = set()
+    for word in re.findall(r"\w+", folded):
+        padded = "  " + word + " "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+# Full text index over the primary titles, used by the title search of the web app.
+def create_title_search(conn):
+    c = conn.cursor()
+
+    try:
+        print("--------------INDEX title_search--------------")
+        conn.execute("BEGIN TRANSACTION")
+
+        c.execute("DROP TABLE IF EXISTS title_search")
+
+        # The trigram tokenizer lets MATCH find any substring of 3+ characters,
+        # which keeps the behaviour of the former LIKE '%...%' search
+        c.execute("""
+            CREATE VIRTUAL TABLE title_search USING fts5(
+                movie_id UNINDEXED,
+                title_name,
+                tokenize = 'trigram'
+            )
+        """)
+
+        c.execute("""
+            INSERT INTO title_search (movie_id, title_name)
+            SELECT mt.movie_id, t.title_name
+            FROM movie_titles mt
+            JOIN titles t ON mt.title_id = t.title_id
+            WHERE mt.is_primary = TRUE
+        """)
+        print("Titres indexés: ", c.rowcount)
+
+        # merges the index b-trees into a single one for faster queries
+        c.execute("INSERT INTO title_search (title_search) VALUES ('optimize')")
+
+        conn.commit()
+        print("Index title_search créé avec succès")
+
+    except sqlite3.Error as e:
+        conn.rollback()
+        print("!!! Création de l'index échouée !!!:\n", e)
+
+# Trigram index over the person names, used by the person search of the web app.
+# Tolerates typos and accents: "brad pit" or "penelope cruz" find "Brad Pitt" and "Penélope Cruz"
+def create_person_search(conn):
+    c = conn.cursor()
+    insert_cnt = 0
+
+    try:
+        print("--------------INDEX person_search--------------")
+        conn.execute("BEGIN TRANSACTION")
+
+        c.execute("DROP TABLE IF EXISTS person_trigrams")
+        c.execute("DROP TABLE IF EXISTS person_search")
+
+        c.execute("""
+            CREATE TABLE person_search (
+                person_id VARCHAR(20) PRIMARY KEY,
+                trigram_count INTEGER,
+                film_count INTEGER
+            )
+        """)
+        c.execute("""
+            CREATE TABLE person_trigrams (
+                trigram CHAR(3),
+                person_id VARCHAR(20),
+
+                PRIMARY KEY (trigram, person_id)
+            ) WITHOUT ROWID
+        """)
+
+        film_counts = dict(conn.execute("""
+            SELECT person_id, COUNT(DISTINCT movie_id)
+            FROM principals
+            GROUP BY person_id
+        """).fetchall())
+
+        persons = []
+        trigrams = []
+        for person_id, name in conn.execute("SELECT person_id, name FROM persons WHERE name IS NOT NULL"):
+            person_trigrams = name_trigrams(name)
+            if not person_trigrams:
+                continue
+            persons.append((person_id, len(person_trigrams), film_counts.get(person_id, 0)))
+            trigrams.extend((t, person_id) for t in person_trigrams)
+
+            if len(persons) >= BATCH_SIZE:
+                c.executemany("INSERT INTO person_search VALUES (?, ?, ?)", persons)
+                c.executemany("INSERT INTO person_trigrams VALUES (?, ?)", trigrams)
+                insert_cnt += len(persons)
+                persons, trigrams = [], []
+
+        c.executemany("INSERT INTO person_search VALUES (?, ?, ?)", persons)
+        c.executemany("INSERT INTO person_trigrams VALUES (?, ?)", trigrams)
+        insert_cnt += len(persons)
+
+        conn.commit()
+        print("Personnes indexées: ", insert_cnt)
+        print("Index person_search créé avec succès")
+
+    except sqlite3.Error as e:
+        conn.rollback()
+        print("!!! Création de l'index échouée !!!:\n", e)
+
+# Must be rebuilt after each import (after index.py)
+with sqlite3.connect("../../data/imdb.db") as conn:
+    create_title_search(conn)
+    create_person_search(conn)
+    # new version stamp of the dataset so that the web app drops its cached results
+    store_data_version(conn)
+    conn.commit()
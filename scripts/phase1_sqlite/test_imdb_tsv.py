@@ -0,0 +1,122 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from imdb_tsv import ImdbDumps
+
+# Lancés depuis scripts/phase1_sqlite/: python -m unittest test_imdb_tsv
+
+# petits dumps au format d'IMDb: tt0000003 est un épisode, ignoré avec ses akas, principals et notes
+DUMPS = {
+    "title.basics.tsv.gz": [
+        ["tconst", "titleType", "primaryTitle", "originalTitle", "isAdult", "startYear", "endYear", "runtimeMinutes", "genres"],
+        ["tt0000001", "movie", "Fight Club", "Fight Club", "0", "1999", "\\N", "139", "Drama"],
+        ["tt0000002", "movie", "Le Fabuleux Destin", "Amélie", "0", "2001", "\\N", "122", "Comedy,Romance"],
+        ["tt0000003", "tvEpisode", "Pilot", "Pilot", "0", "2005", "\\N", "42", "Comedy"],
+        ["tt0000004", "movie", "NA", "NA", "0", "\\N", "\\N", "\\N", "\\N"],
+    ],
+    "title.akas.tsv.gz": [
+        ["titleId", "ordering", "title", "region", "language", "types", "attributes", "isOriginalTitle"],
+        ["tt0000001", "1", "Fight Club", "US", "\\N", "imdbDisplay", "\\N", "0"],
+        ["tt0000001", "2", "El club de la pelea", "MX", "es", "\\N", "\\N", "0"],
+        ["tt0000002", "1", "Amélie", "\\N", "\\N", "original", "\\N", "1"],
+        ["tt0000003", "1", "Pilot", "US", "\\N", "\\N", "\\N", "0"],
+    ],
+    "title.principals.tsv.gz": [
+        ["tconst", "ordering", "nconst", "category", "job", "characters"],
+        ["tt0000001", "1", "nm0000001", "actor", "\\N", '["Tyler Durden"]'],
+        ["tt0000001", "2", "nm0000002", "actor", "\\N", '["The Narrator","Jack"]'],
+        ["tt0000001", "3", "nm0000003", "director", "\\N", "\\N"],
+        ["tt0000002", "1", "nm0000004", "actress", "\\N", '["Amélie Poulain"]'],
+        ["tt0000003", "1", "nm0000005", "actor", "\\N", '["Himself"]'],
+    ],
+    "name.basics.tsv.gz": [
+        ["nconst", "primaryName", "birthYear", "deathYear", "primaryProfession", "knownForTitles"],
+        ["nm0000001", "Brad Pitt", "1963", "\\N", "actor,producer", "tt0000001,tt0000003"],
+        ["nm0000002", "Edward Norton", "1969", "\\N", "actor", "tt0000001"],
+        ["nm0000003", "David Fincher", "1962", "\\N", "director,producer", "tt0000001"],
+        ["nm0000004", "Audrey Tautou", "1976", "\\N", "actress", "tt0000002"],
+        ["nm0000005", "Episode Actor", "1980", "\\N", "actor", "tt0000003"],
+    ],
+    "title.ratings.tsv.gz": [
+        ["tconst", "averageRating", "numVotes"],
+        ["tt0000001", "8.8", "2300000"],
+        ["tt0000002", "8.3", "800000"],
+        ["tt0000003", "7.0", "120"],
+    ],
+}
+
+def write_dumps(directory):
+    for name, rows in DUMPS.items():
+        with gzip.open(os.path.join(directory, name), "wt", encoding="utf-8") as f:
+            f.writelines("\t".join(row) + "\n" for row in rows)
+
+def read_all(dumps, file):
+    return pd.concat(list(dumps.read_chunks(file)), ignore_index=True)
+
+class ImdbDumpsTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        write_dumps(self.tmp)
+        # blocs de quelques lignes: plusieurs blocs par dump, remis dans l'ordre
+        self.dumps = ImdbDumps(self.tmp, workers=2, block_bytes=16)
+
+    def test_movies(self):
+        movies = read_all(self.dumps, "movies.csv")
+        self.assertEqual(movies["mid"].tolist(), ["tt0000001", "tt0000002", "tt0000004"])
+        self.assertEqual(movies["originalTitle"].tolist(), ["Fight Club", "Amélie", "NA"])
+        self.assertEqual(movies["startYear"].tolist()[:2], [1999, 2001])
+        self.assertTrue(pd.isna(movies["startYear"][2]))
+
+    def test_multi_valued_fields(self):
+        genres = read_all(self.dumps, "genres.csv")
+        self.assertEqual(list(zip(genres["mid"], genres["genre"])), [
+            ("tt0000001", "Drama"), ("tt0000002", "Comedy"), ("tt0000002", "Romance"),
+        ])
+
+        professions = read_all(self.dumps, "professions.csv")
+        self.assertEqual(list(zip(professions["pid"], professions["jobName"])), [
+            ("nm0000001", "actor"), ("nm0000001", "producer"), ("nm0000002", "actor"),
+            ("nm0000003", "director"), ("nm0000003", "producer"), ("nm0000004", "actress"),
+        ])
+
+        known = read_all(self.dumps, "knownformovies.csv")
+        self.assertEqual(list(zip(known["pid"], known["mid"])), [
+            ("nm0000001", "tt0000001"), ("nm0000002", "tt0000001"),
+            ("nm0000003", "tt0000001"), ("nm0000004", "tt0000002"),
+        ])
+
+        characters = read_all(self.dumps, "characters.csv")
+        self.assertEqual(list(zip(characters["mid"], characters["pid"], characters["name"])), [
+            ("tt0000001", "nm0000001", "Tyler Durden"),
+            ("tt0000001", "nm0000002", "The Narrator"),
+            ("tt0000001", "nm0000002", "Jack"),
+            ("tt0000002", "nm0000004", "Amélie Poulain"),
+        ])
+
+    def test_only_rows_of_the_kept_movies(self):
+        self.assertEqual(read_all(self.dumps, "titles.csv")["mid"].tolist(), ["tt0000001", "tt0000001", "tt0000002"])
+        self.assertEqual(read_all(self.dumps, "ratings.csv")["mid"].tolist(), ["tt0000001", "tt0000002"])
+        self.assertEqual(read_all(self.dumps, "principals.csv")["ordering"].tolist(), [1, 2, 3, 1])
+        # seulement les personnes des principals des films
+        self.assertEqual(read_all(self.dumps, "persons.csv")["pid"].tolist(), [
+            "nm0000001", "nm0000002", "nm0000003", "nm0000004",
+        ])
+
+    def test_usecols(self):
+        chunks = list(self.dumps.read_chunks("ratings.csv", ["mid", "numVotes"]))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(list(chunks[0].columns), ["mid", "numVotes"])
+
+    def test_missing_dump(self):
+        os.remove(os.path.join(self.tmp, "title.ratings.tsv.gz"))
+        with self.assertRaises(FileNotFoundError):
+            read_all(self.dumps, "ratings.csv")
+
+if __name__ == "__main__":
+    unittest.main()
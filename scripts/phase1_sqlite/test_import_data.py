@@ -0,0 +1,172 @@
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from imdb_tsv import FILES, ImdbDumps
+from test_imdb_tsv import read_all, write_dumps
+
+# Lancés depuis scripts/phase1_sqlite/: python -m unittest test_import_data
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+
+def write_csvs(dumps_dir, csv_dir):
+    """
+    Écrit dans 'csv_dir' les CSV de data/csv équivalents aux dumps de 'dumps_dir'.
+    """
+    dumps = ImdbDumps(dumps_dir, workers=1)
+    for file in FILES:
+        read_all(dumps, file).convert_dtypes().to_csv(os.path.join(csv_dir, file), index=False)
+
+class ImportTestCase(unittest.TestCase):
+    """
+    Arborescence du projet dans un répertoire temporaire, create_schema.py et import_data.py
+    utilisant ../../data/imdb.db et ../../data/csv/: les petits dumps de test_imdb_tsv
+    dans dumps/ et les CSV équivalents dans data/csv/.
+    """
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.cwd = os.path.join(self.tmp, "scripts", "phase1_sqlite")
+        self.data = os.path.join(self.tmp, "data")
+        self.dumps = os.path.join(self.tmp, "dumps")
+        for directory in (self.cwd, os.path.join(self.data, "csv"), self.dumps):
+            os.makedirs(directory)
+        write_dumps(self.dumps)
+        write_csvs(self.dumps, os.path.join(self.data, "csv"))
+        subprocess.run([sys.executable, os.path.join(SCRIPTS, "create_schema.py")], cwd=self.cwd, check=True)
+
+    def run_import(self, *args, dumps=False):
+        """
+        Lance import_data.py sur les CSV, ou sur les dumps si 'dumps', et retourne une connexion à la base.
+        """
+        if dumps:
+            args = ("--imdb-dir", self.dumps, "--workers", "2", *args)
+        res = subprocess.run(
+            [sys.executable, os.path.join(SCRIPTS, "import_data.py"), *args],
+            cwd=self.cwd, capture_output=True, text=True
+        )
+        self.assertEqual(res.returncode, 0, res.stderr)
+        self.assertNotIn("Echou", res.stdout)
+        self.output = res.stdout
+        self.from_dumps = dumps
+        return self.connect()
+
+    def connect(self):
+        conn = sqlite3.connect(os.path.join(self.data, "imdb.db"))
+        self.addCleanup(conn.close)
+        return conn
+
+    def counts(self, conn):
+        return {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ["movies", "genres", "movie_genres", "persons", "professions", "person_profession",
+                          "known_for_movies", "ratings", "principals", "characters", "cast", "titles",
+                          "movie_titles", "title_ordering"]
+        }
+
+    def check_import(self, conn):
+        self.assertEqual(self.counts(conn), {
+            "movies": 3, "genres": 3, "movie_genres": 3, "persons": 4, "professions": 4, "person_profession": 6,
+            "known_for_movies": 4, "ratings": 2, "principals": 4, "characters": 4, "cast": 4,
+            # Fight Club, El club de la pelea, Amélie, Le Fabuleux Destin, NA
+            # (pandas lit le titre "NA" d'un CSV comme une valeur manquante)
+            "titles": 5 if self.from_dumps else 4, "movie_titles": 5, "title_ordering": 3,
+        })
+        self.assertEqual(conn.execute("""
+            SELECT t.title_name FROM movie_titles mt JOIN titles t ON t.title_id = mt.title_id
+            WHERE mt.movie_id = 'tt0000002' AND mt.is_primary = 1
+        """).fetchall(), [("Le Fabuleux Destin",)])
+        self.assertEqual(conn.execute("""
+            SELECT p.job_name FROM principals pr JOIN professions p ON p.profession_id = pr.profession_id
+            WHERE pr.movie_id = 'tt0000001' ORDER BY pr.ordering
+        """).fetchall(), [("actor",), ("actor",), ("director",)])
+
+class ImportTests(ImportTestCase):
+    def test_import_from_csv(self):
+        self.check_import(self.run_import())
+
+    def test_import_from_dumps(self):
+        self.check_import(self.run_import(dumps=True))
+
+    def test_duplicate_rows_are_ignored(self):
+        # lignes déjà présentes ailleurs dans le fichier, ou dans un autre morceau
+        for file, line in [("ratings.csv", "tt0000001,8.8,2300000"), ("principals.csv", "tt0000001,1,nm0000001,actor,"),
+                           ("genres.csv", "tt0000001,drama"), ("persons.csv", "nm0000002,Edward Norton,1969,")]:
+            with open(os.path.join(self.data, "csv", file), "a") as f:
+                f.write(line + "\n")
+        self.check_import(self.run_import())
+
+    def test_fast_load(self):
+        subprocess.run([sys.executable, os.path.join(SCRIPTS, "index.py")], cwd=self.cwd, check=True)
+        indexes = sqlite3.connect(os.path.join(self.data, "imdb.db")).execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL ORDER BY name"
+        ).fetchall()
+        self.assertTrue(indexes)
+
+        conn = self.run_import("--fast-load")
+        self.check_import(conn)
+        # index supprimés pendant le chargement puis recréés à l'identique
+        self.assertEqual(conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL ORDER BY name"
+        ).fetchall(), indexes)
+        self.assertEqual(conn.execute("PRAGMA integrity_check").fetchall(), [("ok",)])
+        self.assertEqual(conn.execute("PRAGMA foreign_key_check").fetchall(), [])
+
+    def test_fast_load_fails_on_invalid_database(self):
+        conn = self.connect()
+        # un film inconnu: clé étrangère invalide, non contrôlée pendant l'import
+        conn.execute("INSERT INTO movie_genres (movie_id, genre_id) VALUES ('tt9999999', 1)")
+        conn.commit()
+
+        res = subprocess.run(
+            [sys.executable, os.path.join(SCRIPTS, "import_data.py"), "--fast-load"],
+            cwd=self.cwd, capture_output=True, text=True
+        )
+        self.assertNotEqual(res.returncode, 0)
+        self.assertIn("Base invalide", res.stderr)
+        # ni analyse, ni nouvelle version des données
+        self.assertEqual(conn.execute(
+            "SELECT name FROM sqlite_master WHERE name IN ('sqlite_stat1', 'dataset_version')"
+        ).fetchall(), [])
+
+    # budget minimal: morceaux de chunk_rows() lignes au plus, ou blocs de 64 Ko des dumps
+    def test_memory_budget_from_csv(self):
+        self.check_import(self.run_import("--memory-budget", "1"))
+
+    def test_memory_budget_from_dumps(self):
+        self.check_import(self.run_import("--memory-budget", "1", dumps=True))
+
+class ReadChunksTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        with open(os.path.join(self.tmp, "ratings.csv"), "w") as f:
+            f.write("movie_id,rating,votes\n")
+            for i in range(5000):
+                f.write(f"tt{i:07d},{i % 10}.5,{i}\n")
+
+        import import_data
+        for name, value in [("CSV_REPO", self.tmp + os.sep), ("MEMORY_BUDGET", 1), ("IMDB_DUMPS", None)]:
+            patcher = patch.object(import_data, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.import_data = import_data
+
+    def test_chunks_within_budget(self):
+        chunks = list(self.import_data.read_chunks("ratings.csv"))
+        # au moins 1000 lignes par morceau, même pour un budget de 1 octet
+        self.assertEqual([len(chunk) for chunk in chunks], [1000] * 5)
+        self.assertEqual(sum(chunk["votes"].sum() for chunk in chunks), sum(range(5000)))
+
+    def test_skip(self):
+        chunks = list(self.import_data.read_chunks("ratings.csv", skip=2500))
+        self.assertEqual(sum(len(chunk) for chunk in chunks), 2500)
+        self.assertEqual(chunks[0]["movie_id"].iloc[0], "tt0002500")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+import os
+import subprocess
+import sys
+import unittest
+from unittest.mock import patch
+
+from test_imdb_tsv import DUMPS, write_dumps
+from test_import_data import SCRIPTS, ImportTestCase, write_csvs
+
+# Lancés depuis scripts/phase1_sqlite/: python -m unittest test_import_modes
+# Chaque mode est testé sur les CSV de data/csv, puis sur les dumps IMDb (classes ...FromDumpsTests).
+
+class ImportModeTestCase(ImportTestCase):
+    from_dumps = False
+
+    def run_import(self, *args):
+        return super().run_import(*args, dumps=type(self).from_dumps)
+
+    def check_progress(self, conn, tables=None):
+        """
+        Vérifie que l'import de chaque table est enregistré comme terminé dans import_progress.
+        """
+        progress = dict(conn.execute("SELECT table_name, finished FROM import_progress"))
+        self.assertEqual(progress, {table: 1 for table in tables or self.counts(conn)})
+
+class DeltaTests(ImportModeTestCase):
+    def write_snapshot(self):
+        """
+        Nouvel instantané: Fight Club change de note et de titre, tt0000004 disparaît.
+        """
+        ratings = DUMPS["title.ratings.tsv.gz"]
+        basics = DUMPS["title.basics.tsv.gz"]
+        with patch.dict(DUMPS, {
+            "title.ratings.tsv.gz": [ratings[0], ["tt0000001", "8.9", "2400000"]] + ratings[2:],
+            "title.basics.tsv.gz": [basics[0], ["tt0000001", "movie", "Fight Club!", "Fight Club", "0", "1999", "\\N", "139", "Drama"]] + basics[2:4],
+        }):
+            write_dumps(self.dumps)
+            write_csvs(self.dumps, os.path.join(self.data, "csv"))
+
+    def test_delta(self):
+        self.run_import().close()
+        self.write_snapshot()
+        conn = self.run_import("--delta")
+
+        self.assertEqual(conn.execute("SELECT average_rating, num_votes FROM ratings WHERE movie_id = 'tt0000001'").fetchone(), (8.9, 2400000))
+        self.assertEqual(conn.execute("SELECT movie_id FROM movies ORDER BY movie_id").fetchall(), [("tt0000001",), ("tt0000002",)])
+        self.assertEqual(conn.execute("""
+            SELECT t.title_name, mt.is_primary, mt.is_original FROM movie_titles mt JOIN titles t ON t.title_id = mt.title_id
+            WHERE mt.movie_id = 'tt0000001' AND (mt.is_primary = 1 OR mt.is_original = 1) ORDER BY t.title_name
+        """).fetchall(), [("Fight Club", 0, 1), ("Fight Club!", 1, 0)])
+        # les autres tables sont inchangées
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM principals").fetchone()[0], 4)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM persons").fetchone()[0], 4)
+
+        version = conn.execute("SELECT version FROM dataset_version").fetchone()[0]
+        changes = conn.execute("""
+            SELECT table_name, operation, movie_id FROM change_log WHERE version = ? AND table_name IN ('movies', 'ratings')
+            ORDER BY table_name, movie_id
+        """, (version,)).fetchall()
+        self.assertEqual(changes, [("movies", "delete", "tt0000004"), ("ratings", "update", "tt0000001")])
+        self.assertEqual(
+            {r[0] for r in conn.execute("SELECT DISTINCT movie_id FROM change_log WHERE version = ?", (version,))},
+            {"tt0000001", "tt0000004"}
+        )
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM change_log WHERE version <> ?", (version,)).fetchone()[0], 0)
+
+    def test_same_snapshot_changes_nothing(self):
+        self.run_import().close()
+        self.write_snapshot()
+        self.run_import("--delta").close()
+        before = self.connect().execute("SELECT COUNT(*) FROM change_log").fetchone()[0]
+
+        conn = self.run_import("--delta")
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0], before)
+        self.assertEqual(conn.execute("SELECT COUNT(DISTINCT version) FROM change_log").fetchone()[0], 1)
+
+    def test_delta_without_changes(self):
+        self.run_import().close()
+        conn = self.run_import("--delta")
+        self.check_import(conn)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0], 0)
+
+class DeltaFromDumpsTests(DeltaTests):
+    from_dumps = True
+
+class ParallelImportTests(ImportModeTestCase):
+    def test_parallel_import(self):
+        # tables indépendantes importées dans des fichiers séparés, puis fusionnées
+        conn = self.run_import("--jobs", "3")
+        self.check_import(conn)
+        self.check_progress(conn)
+        self.assertEqual([f for f in os.listdir(self.data) if f.endswith(".part")], [])
+
+    def test_same_database_as_sequential_import(self):
+        conn = self.run_import("--jobs", "3")
+        tables = {
+            table: sorted(conn.execute(f'SELECT * FROM "{table}"').fetchall(), key=repr)
+            for table in self.counts(conn)
+        }
+        conn.close()
+        os.remove(os.path.join(self.data, "imdb.db"))
+        subprocess.run([sys.executable, os.path.join(SCRIPTS, "create_schema.py")], cwd=self.cwd, check=True)
+        conn = self.run_import()
+        self.assertEqual(tables, {
+            table: sorted(conn.execute(f'SELECT * FROM "{table}"').fetchall(), key=repr)
+            for table in self.counts(conn)
+        })
+
+class ParallelImportFromDumpsTests(ParallelImportTests):
+    from_dumps = True
+
+class ResumeTests(ImportModeTestCase):
+    def interrupt(self, conn, table, offset):
+        """
+        Simule un import de 'table' interrompu après la validation de ses 'offset' premières lignes.
+        """
+        conn.execute(f'DELETE FROM "{table}" WHERE rowid > ?', (offset,))
+        conn.execute("UPDATE import_progress SET csv_offset = ?, finished = 0 WHERE table_name = ?", (offset, table))
+        conn.commit()
+        conn.close()
+
+    def test_resume(self):
+        self.interrupt(self.run_import(), "principals", 2)
+        conn = self.run_import("--resume")
+        self.check_import(conn)
+        self.check_progress(conn)
+
+    def test_resume_skips_validated_rows(self):
+        conn = self.run_import()
+        # lignes absentes mais comptées comme validées: la reprise ne les relit pas
+        conn.execute("DELETE FROM ratings")
+        self.interrupt(conn, "principals", 2)
+        conn = self.connect()
+        conn.execute("DELETE FROM principals WHERE ordering = 2")
+        conn.commit()
+
+        conn = self.run_import("--resume")
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM ratings").fetchone()[0], 0)
+        self.assertEqual(
+            conn.execute("SELECT movie_id, ordering FROM principals ORDER BY movie_id, ordering").fetchall(),
+            [("tt0000001", 1), ("tt0000001", 3), ("tt0000002", 1)]
+        )
+        self.check_progress(conn)
+
+    def test_without_resume_starts_over(self):
+        self.interrupt(self.run_import(), "principals", 2)
+        conn = self.run_import()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM principals").fetchone()[0], 4)
+        self.check_progress(conn)
+
+    def test_resume_parallel_import(self):
+        conn = self.run_import("--jobs", "3")
+        # --jobs reprend les tables non terminées depuis le début
+        conn.execute("DELETE FROM ratings")
+        self.interrupt(conn, "principals", 0)
+        conn = self.run_import("--jobs", "3", "--resume")
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM principals").fetchone()[0], 4)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM ratings").fetchone()[0], 0)
+        self.check_progress(conn)
+
+class ResumeFromDumpsTests(ResumeTests):
+    from_dumps = True
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,12 @@
+import os
+import sys
+
 from pymongo import MongoClient
 
+# movies.services.dataset, shared with the web app
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from movies.services.dataset import store_mongo_version
+
 def query_movies_complete_from_flat(db, movie_id=None):
     """
     Returns the movie complete documents fetched from the flat collections
@@ -249,3 +256,5 @@ with MongoClient('mongodb://localhost:27017/') as client:
     db = client["imdb"]
 
     create_movies_complete(db)
+    # new version stamp of the collections so that the web app stops answering 304 with the previous pages
+    store_mongo_version(db)
@@ -0,0 +1,96 @@
+import os
+import sys
+
+from pymongo import MongoClient, UpdateOne
+
+# movies.services.dataset, shared with the web app
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from movies.services.dataset import store_mongo_version
+
+# Number of recommendations kept per movie for each pool
+POOL_SIZE = 50
+BATCH_SIZE = 1000
+
+def top_movies_by(db, field: str) -> dict:
+    """
+    Returns the POOL_SIZE + 1 most voted movies of each value of 'field'
+    (one more than kept, as a movie is removed from its own pool)
+    Args:
+        db: MongoDB database ('imdb')
+        field: array field of movies_complete to group on (ex: "directors.person_id", "genres")
+    Returns:
+        dict {value: [{"mid", "title", "votes"}, ...]} sorted by decreasing votes
+    """
+    pipeline = [
+        {"$project": {
+            "title": 1,
+            "votes": "$rating.votes",
+            "key": "$" + field
+        }},
+        {"$unwind": "$key"},
+        {"$group": {
+            "_id": "$key",
+            "movies": {"$topN": {
+                "n": POOL_SIZE + 1,
+                "sortBy": {"votes": -1},
+                "output": {"mid": "$_id", "title": "$title", "votes": "$votes"}
+            }}
+        }}
+    ]
+    return {r["_id"]: r["movies"] for r in db["movies_complete"].aggregate(pipeline, allowDiskUse=True)}
+
+def build_pool(movie_id: str, keys: list, top_movies: dict) -> list:
+    """
+    Merges the top movies of each key into a single pool of at most POOL_SIZE
+    movies, most voted first, without 'movie_id' itself
+    """
+    candidates = {}
+    for k in keys:
+        for m in top_movies.get(k, []):
+            if m["mid"] != movie_id:
+                candidates[m["mid"]] = m
+    pool = sorted(candidates.values(), key=lambda m: m["votes"] or 0, reverse=True)[:POOL_SIZE]
+    return [{"mid": m["mid"], "title": m["title"]} for m in pool]
+
+def create_recommendation_pools(db):
+    """
+    Embeds in each movies_complete document a "rec_pool" field holding the candidate
+    recommendations of the detail page: the most voted movies of the same directors and
+    of the same genres. The web app samples them instead of running $sample on every request.
+    Args:
+        db: MongoDB database ('imdb')
+    movies_complete must be created (migrate_structured.py) before calling this function
+    """
+    if "movies_complete" not in db.list_collection_names():
+        print("Can not create the recommendation pools without collection: movies_complete")
+        exit()
+
+    top_by_director = top_movies_by(db, "directors.person_id")
+    top_by_genre    = top_movies_by(db, "genres")
+
+    updated = 0
+    batch = []
+    for movie in db["movies_complete"].find({}, {"directors.person_id": 1, "genres": 1}):
+        directors = [d["person_id"] for d in movie.get("directors", [])]
+        batch.append(UpdateOne({"_id": movie["_id"]}, {"$set": {"rec_pool": {
+            "directors": build_pool(movie["_id"], directors, top_by_director),
+            "genres":    build_pool(movie["_id"], movie.get("genres", []), top_by_genre)
+        }}}))
+
+        if len(batch) >= BATCH_SIZE:
+            updated += db["movies_complete"].bulk_write(batch, ordered=False).modified_count
+            batch = []
+
+    if batch:
+        updated += db["movies_complete"].bulk_write(batch, ordered=False).modified_count
+
+    print("Recommendation pools created succesfully")
+    print("Updated documents: ", updated)
+
+
+with MongoClient('mongodb://localhost:27017/') as client:
+    db = client["imdb"]
+
+    create_recommendation_pools(db)
+    # new version stamp of the collections so that the web app stops answering 304 with the previous pages
+    store_mongo_version(db)